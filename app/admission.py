@@ -0,0 +1,111 @@
+"""
+准入控制
+- AdmissionLimiter：限制同时进行的某类高开销操作数量，超出的请求在有界队列中等待，队列已满或等待超时时立即返回 429
+- TokenBucketLimiter：按键（用户名、客户端地址等）限制请求频率的令牌桶
+两者的状态均只在进程内保存，每个 worker 进程各自限制
+"""
+import asyncio
+import math
+import threading
+import time
+from contextlib import asynccontextmanager
+from typing import Any, Hashable
+
+from fastapi import HTTPException, status
+
+from .cache import TTLCache
+
+
+def too_many_requests(retry_after: float, detail: str = "请求过于频繁，请稍后再试") -> HTTPException:
+    """构造带 Retry-After 头的 429 响应"""
+    return HTTPException(
+        status_code=status.HTTP_429_TOO_MANY_REQUESTS,
+        detail=detail,
+        headers={"Retry-After": str(max(1, math.ceil(retry_after)))},
+    )
+
+
+class AdmissionLimiter:
+    """并发上限加有界等待队列"""
+
+    def __init__(self, concurrency: int, queue_size: int, timeout: float, retry_after: float = 1.0):
+        self.concurrency = concurrency
+        self.queue_size = queue_size
+        self.timeout = timeout
+        self.retry_after = retry_after
+        self.active = 0
+        self.waiting = 0
+        self.admitted = 0
+        self.rejected = 0
+        self.timeouts = 0
+        self._semaphore = asyncio.Semaphore(concurrency)
+
+    @asynccontextmanager
+    async def slot(self):
+        """取得执行名额，队列已满或等待超时时抛出 429"""
+        # 按计数判断而非 semaphore.locked()：同一时刻到达的请求在真正取得信号量之前都还未占用名额
+        if self.active + self.waiting >= self.concurrency + self.queue_size:
+            self.rejected += 1
+            raise too_many_requests(self.retry_after, "服务器繁忙，请稍后再试")
+        self.waiting += 1
+        try:
+            await asyncio.wait_for(self._semaphore.acquire(), self.timeout)
+        except asyncio.TimeoutError:
+            self.timeouts += 1
+            raise too_many_requests(self.retry_after, "服务器繁忙，请稍后再试")
+        finally:
+            self.waiting -= 1
+        self.active += 1
+        self.admitted += 1
+        try:
+            yield
+        finally:
+            self.active -= 1
+            self._semaphore.release()
+
+    def stats(self) -> dict[str, Any]:
+        return {
+            "concurrency": self.concurrency,
+            "queue_size": self.queue_size,
+            "active": self.active,
+            "queue_depth": self.waiting,
+            "admitted": self.admitted,
+            "rejected": self.rejected,
+            "timeouts": self.timeouts,
+        }
+
+
+class TokenBucketLimiter:
+    """令牌桶：每个键最多积累 capacity 个令牌，每秒补充 rate 个，每次请求消耗一个"""
+
+    def __init__(self, capacity: float, rate: float, maxsize: int = 100000):
+        self.capacity = capacity
+        self.rate = rate
+        self.allowed = 0
+        self.rejected = 0
+        # 超过补满所需时间未访问的桶已是满的，过期后直接丢弃即可
+        self._buckets = TTLCache(maxsize=maxsize, ttl=capacity / rate)
+        self._lock = threading.Lock()
+
+    def consume(self, key: Hashable, tokens: float = 1.0) -> float:
+        """消耗令牌，成功时返回 0，令牌不足时返回需要等待的秒数"""
+        now = time.monotonic()
+        with self._lock:
+            level, updated = self._buckets.get(key, (self.capacity, now))
+            level = min(self.capacity, level + (now - updated) * self.rate)
+            if level >= tokens:
+                self._buckets.set(key, (level - tokens, now))
+                self.allowed += 1
+                return 0.0
+            self._buckets.set(key, (level, now))
+            self.rejected += 1
+            return (tokens - level) / self.rate
+
+    def stats(self) -> dict[str, Any]:
+        return {
+            "capacity": self.capacity,
+            "rate_per_second": self.rate,
+            "tracked_keys": len(self._buckets),
+            "allowed": self.allowed,
+            "rejected": self.rejected,
+        }
@@ -0,0 +1,160 @@
+"""
+已编码附件缓存
+附件以 Base64 编码后放入邮件。同一文件（以 FileDB.md5 区分）的编码结果保存在磁盘上，并在内存中保留最近使用的部分，
+重复发送同一附件时既不读取原文件也不重新编码：
+- 内存：按编码后的字节数计算容量的 LRU，超过 memory_budget 时淘汰最久未使用的条目；只保存不超过容量 1/4 的条目
+- 磁盘：每个文件一个 {md5}.b64，总大小超过 disk_budget 时按最后使用时间淘汰
+编码结果逐块产出，较大的附件不会整个读入内存。写入磁盘时先写临时文件再重命名，多个进程（API 与 Celery worker）可以共享同一目录
+"""
+import base64
+import hashlib
+import os
+import threading
+from collections import OrderedDict
+from pathlib import Path
+from typing import Any, Iterator
+
+from .settings import EMAIL_ATTACHMENT_CACHE_PATH, EMAIL_ATTACHMENT_CACHE_MEMORY_MB, EMAIL_ATTACHMENT_CACHE_DISK_MB
+
+# 每次读取并编码的字节数，57 字节编码为一行 76 个字符
+ENCODE_CHUNK_SIZE = 57 * 1024
+
+
+class AttachmentCache:
+    """按文件 MD5 缓存 Base64 编码后的附件内容，线程安全"""
+
+    def __init__(self, directory: str, memory_budget: int, disk_budget: int):
+        self.directory = Path(directory)
+        self.memory_budget = memory_budget
+        self.disk_budget = disk_budget
+        self.memory_hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+        self._memory: OrderedDict[str, bytes] = OrderedDict()
+        self._memory_size = 0
+        self._lock = threading.Lock()
+
+    def _path(self, md5: str) -> Path:
+        return self.directory / f"{md5}.b64"
+
+    def _remember(self, md5: str, payload: bytes) -> None:
+        with self._lock:
+            if md5 in self._memory:
+                return
+            self._memory[md5] = payload
+            self._memory_size += len(payload)
+            while self._memory_size > self.memory_budget:
+                _, evicted = self._memory.popitem(last=False)
+                self._memory_size -= len(evicted)
+
+    def _trim_disk(self) -> None:
+        """磁盘缓存超出容量时淘汰最久未使用的文件"""
+        entries = [entry for entry in os.scandir(self.directory) if entry.name.endswith(".b64")]
+        total = sum(entry.stat().st_size for entry in entries)
+        for entry in sorted(entries, key=lambda entry: entry.stat().st_mtime):
+            if total <= self.disk_budget:
+                break
+            size = entry.stat().st_size
+            Path(entry.path).unlink(missing_ok=True)
+            total -= size
+
+    def stream(self, md5: str, source: Path, chunk_size: int = ENCODE_CHUNK_SIZE) -> Iterator[bytes]:
+        """
+        逐块产出 MD5 为 md5 的文件经 Base64 编码（每行 76 个字符，LF 换行）后的内容，内存占用与文件大小无关
+        未缓存时从 source 逐块读取并编码，同时写入磁盘缓存；读取的内容与 md5 不符时（文件被替换）不缓存
+        chunk_size 需为 57 的倍数（57 字节编码为一整行）
+        """
+        with self._lock:
+            payload = self._memory.get(md5)
+            if payload is not None:
+                self._memory.move_to_end(md5)
+                self.memory_hits += 1
+        if payload is not None:
+            for start in range(0, len(payload), chunk_size):
+                yield payload[start:start + chunk_size]
+            return
+
+        path = self._path(md5)
+        try:
+            cached = open(path, "rb")
+        except OSError:
+            cached = None
+        if cached is not None:
+            with self._lock:
+                self.disk_hits += 1
+            with cached:
+                try:
+                    # 更新修改时间，供磁盘淘汰判断最后使用时间
+                    os.utime(path)
+                except OSError:
+                    pass
+                # 较小的条目读入内存，较大的条目直接从磁盘逐块读取
+                if os.fstat(cached.fileno()).st_size <= self.memory_budget // 4:
+                    payload = cached.read()
+                    self._remember(md5, payload)
+                    yield from (payload[start:start + chunk_size] for start in range(0, len(payload), chunk_size))
+                    return
+                while chunk := cached.read(chunk_size):
+                    yield chunk
+            return
+
+        with self._lock:
+            self.misses += 1
+        digest = hashlib.md5()
+        temp_path = path.with_name(f"{path.name}.{os.getpid()}.{threading.get_ident()}.tmp")
+        try:
+            self.directory.mkdir(parents=True, exist_ok=True)
+            temp = open(temp_path, "wb")
+        except OSError:
+            temp = None
+        size = 0
+        try:
+            with open(source, "rb") as f:
+                while chunk := f.read(chunk_size):
+                    digest.update(chunk)
+                    encoded = base64.encodebytes(chunk)
+                    size += len(encoded)
+                    if temp is not None:
+                        try:
+                            temp.write(encoded)
+                        except OSError:
+                            # 写入缓存失败（如磁盘已满）时只是少一次缓存
+                            temp.close()
+                            temp = None
+                    yield encoded
+            if temp is not None and digest.hexdigest() == md5 and size <= self.disk_budget:
+                temp.close()
+                try:
+                    os.replace(temp_path, path)
+                    self._trim_disk()
+                except OSError:
+                    pass
+        finally:
+            if temp is not None:
+                temp.close()
+            temp_path.unlink(missing_ok=True)
+
+    def clear(self) -> None:
+        """清空内存中的缓存（磁盘上的缓存文件保留）"""
+        with self._lock:
+            self._memory.clear()
+            self._memory_size = 0
+
+    def stats(self) -> dict[str, Any]:
+        with self._lock:
+            return {
+                "memory_entries": len(self._memory),
+                "memory_bytes": self._memory_size,
+                "memory_budget": self.memory_budget,
+                "disk_budget": self.disk_budget,
+                "memory_hits": self.memory_hits,
+                "disk_hits": self.disk_hits,
+                "misses": self.misses,
+            }
+
+
+attachment_cache = AttachmentCache(
+    EMAIL_ATTACHMENT_CACHE_PATH,
+    memory_budget=int(EMAIL_ATTACHMENT_CACHE_MEMORY_MB * 1024 * 1024),
+    disk_budget=int(EMAIL_ATTACHMENT_CACHE_DISK_MB * 1024 * 1024),
+)
@@ -1,22 +1,33 @@
 from fastapi import APIRouter, Depends, HTTPException, status, Form, Query, BackgroundTasks, UploadFile, Security, File
-from fastapi.responses import HTMLResponse
+from fastapi.responses import HTMLResponse, StreamingResponse
 from fastapi.security import OAuth2PasswordRequestForm
 from fastapi import Request  # added for building activation link
-from datetime import timedelta
+from datetime import datetime, timedelta
 from fastapi.templating import Jinja2Templates
-from sqlmodel import col, select, desc
-from uuid import UUID
+from sqlmodel import select, desc
+from uuid import UUID, uuid4
 from enum import Enum
+from typing import Any
+import asyncio
 import pathlib
 
-from .models import Token, User, UserPublic, UserUpdate, ChallengeCodeDB, EmailSendHistory, EmailSendHistoryUpdate
-from ..models import PaginatedResponse
+from jinja2 import TemplateSyntaxError
+
+from .models import Token, User, Principal, RefreshTokenDB, UserPublic, UserUpdate, ChallengeCodeDB, EmailSendHistory, EmailSendHistoryUpdate, EmailSendHistoryPartial, MailMergeRequest
+from ..models import PaginatedResponse, CountStrategy, SearchOrder
+from ..search import search
+from ..responses import ORJSONResponse
 from ..file.models import FileDB
-from .utils import send_email, get_request_user, verify_password, hash_password, email_format_check, get_request_active_user
-from .settings import ACCESS_TOKEN_EXPIRE_MINUTES
+from .utils import queue_email, link_attachments, get_request_user, verify_and_update_password, hash_password_async, email_format_check, get_request_active_user, invalidate_principals, check_auth_rate_limit
+from .challenge import ChallengeUnavailable, challenge_store
+from .mailmerge import MergeTemplate, queue_merged_emails
+from .utils import hash_refresh_token, issue_refresh_token, rotate_refresh_token, revoke_refresh_tokens
+from .settings import ACCESS_TOKEN_EXPIRE_MINUTES, EMAIL_MERGE_BATCH_SIZE, EMAIL_MERGE_MAX_RECIPIENTS
 from ..file.utils import file_path_str, FILE_PATH
 
-from ..db_manager import SessionDep
+from ..bulk import bulk_delete, bulk_delete_where, bulk_insert, bulk_nullify, chunked, fetch_by_ids
+from ..db_manager import AsyncSessionDep, ReadSessionDep, read_engine
+from ..exporter import ExportFormat, export_response
 
 auth = APIRouter(
     prefix="/auth",
@@ -32,28 +43,22 @@ email_templates = Jinja2Templates(directory="app/auth/email_templates")
     response_model=PaginatedResponse[UserPublic]
     )
 async def get_all_users(
-    session: SessionDep,
+    session: ReadSessionDep,
     skip: int = 0,
     limit: int = Query(default=10, le=100),
-    request_user: User = Depends(get_request_active_user)
-) -> PaginatedResponse[UserPublic]:
+    count: CountStrategy = Query(CountStrategy.exact, description="总数统计方式：exact 精确计数，estimate 估算，none 不统计"),
+    request_user: Principal = Depends(get_request_active_user)
+) -> ORJSONResponse:
     if not request_user.is_superuser:
         raise HTTPException(
             status_code=status.HTTP_403_FORBIDDEN,
             detail="此操作需要管理员权限"
         )
     
-    # 获取总数
-    total_query = select(User)
-    total = len(session.exec(total_query).all())
-    
-    # 获取分页数据
-    users = session.exec(
-        select(User).offset(skip).limit(limit)
-    ).all()
-    
-    user_publics = [UserPublic.from_user(user) for user in users]
-    return PaginatedResponse[UserPublic].create(user_publics, skip, limit, total)
+    page = await PaginatedResponse[UserPublic].from_query_async(
+        session, select(User), skip, limit, transform=UserPublic.from_user, count=count
+    )
+    return page.to_response()
     
 
 
@@ -63,9 +68,16 @@ async def get_all_users(
     summary="获取登录态用户信息"
     )
 async def get_current_user(
-    request_user: User = Security(get_request_active_user, scopes=["auth:read_basic"]),
+    session: ReadSessionDep,
+    request_user: Principal = Security(get_request_active_user, scopes=["auth:read_basic"]),
 ):
-    return UserPublic.from_user(request_user)
+    user = await session.get(User, request_user.id)
+    if not user:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="用户不存在"
+        )
+    return UserPublic.from_user(user)
 
 class UserSearchRole(str, Enum):
     username = "username"
@@ -75,29 +87,24 @@ class UserSearchRole(str, Enum):
 
 @auth.get("/search", summary="搜索用户", response_model=PaginatedResponse[UserPublic])
 async def search_user(
-    session: SessionDep,
-    request_user: User = Security(get_request_active_user, scopes=["auth:read_basic"]),
+    session: ReadSessionDep,
+    request_user: Principal = Security(get_request_active_user, scopes=["auth:read_basic"]),
     q: str = Query(..., description="搜索关键词"),
     skip: int = Query(0, ge=0),
-    limit: int = Query(10, le=100)
-) -> PaginatedResponse[UserPublic]:
+    limit: int = Query(10, le=100),
+    count: CountStrategy = Query(CountStrategy.exact, description="总数统计方式：exact 精确计数，estimate 估算，none 不统计")
+) -> ORJSONResponse:
     if not request_user.is_superuser:
         raise HTTPException(
             status_code=status.HTTP_403_FORBIDDEN,
             detail="没有权限进行全局用户检索"
         )
     
-    # 获取总数
-    total_query = select(User).where(col(User.username).like(f"%{q}%"))
-    total = len(session.exec(total_query).all())
-    
-    # 获取分页数据
-    query = select(User).where(col(User.username).like(f"%{q}%"))
-    query = query.offset(skip).limit(limit)
-    users = session.exec(query).all()
-    
-    user_publics = [UserPublic.from_user(user) for user in users]
-    return PaginatedResponse[UserPublic].create(user_publics, skip, limit, total)
+    query = search(session, select(User), User, q)
+    page = await PaginatedResponse[UserPublic].from_query_async(
+        session, query, skip, limit, transform=UserPublic.from_user, count=count
+    )
+    return page.to_response()
 
 
 @auth.get(
@@ -106,23 +113,23 @@ async def search_user(
     summary="获取用户信息",
     )
 async def get_user_by_info(
-    session: SessionDep,
+    session: ReadSessionDep,
     user_search_role: UserSearchRole,
     user_search_value: str,
-    request_user: User = Depends(get_request_active_user)
+    request_user: Principal = Depends(get_request_active_user)
 ):
     match user_search_role:
         case UserSearchRole.username:
-            user = session.exec(
+            user = (await session.exec(
                 select(User).where(User.username == user_search_value)
-            ).first()
+            )).first()
         case UserSearchRole.email:
-            user = session.exec(
+            user = (await session.exec(
                 select(User).where(User.email == user_search_value)
-            ).first()
+            )).first()
         case UserSearchRole.user_id:
             user_id = UUID(user_search_value)
-            user = session.get(User, user_id)
+            user = await session.get(User, user_id)
         case _:
             raise HTTPException(
                 status_code=status.HTTP_400_BAD_REQUEST,
@@ -142,7 +149,7 @@ async def get_user_by_info(
     summary="用户注册",
     )
 async def register_user(
-    session: SessionDep,
+    session: AsyncSessionDep,
     background_tasks: BackgroundTasks,
     request: Request,
     username: str = Form(..., description="用户名"),
@@ -150,12 +157,13 @@ async def register_user(
     password: str = Form(..., description="用户密码"),
     avatar: UploadFile | None = File(None, description="用户头像"),
 ):
-    existing_user_username = session.exec(
+    check_auth_rate_limit(request, username)
+    existing_user_username = (await session.exec(
         select(User).where(User.username == username)
-    ).first()
-    existing_user_email = session.exec(
+    )).first()
+    existing_user_email = (await session.exec(
         select(User).where(User.email == email)
-    ).first()
+    )).first()
     if existing_user_username:
         raise HTTPException(
             status_code=status.HTTP_400_BAD_REQUEST,
@@ -202,7 +210,7 @@ async def register_user(
     db_user = User.model_validate({
         "username": username,
         "email": email,
-        "password": hash_password(password),
+        "password": await hash_password_async(password),
         "is_active": False  # 新用户需激活
     })
     
@@ -214,26 +222,24 @@ async def register_user(
         )
         db_avatar.is_public = True  # 头像文件默认公开
         session.add(db_avatar)
-        session.commit()
-        session.refresh(db_avatar)
-        db_user.avatar = db_avatar
+        await session.commit()
+        await session.refresh(db_avatar)
+        db_user.avatar_id = db_avatar.id
     
     session.add(db_user)
-    session.commit()
-    session.refresh(db_user)
+    await session.commit()
+    await session.refresh(db_user)
     
     # 生成激活码并发送激活邮件
-    challenge = ChallengeCodeDB(user_id=db_user.id, call_from="register")
-    session.add(challenge)
-    session.commit()
-    session.refresh(challenge)
+    challenge_code = await challenge_store.issue(session, db_user.id, "register")
+    await session.commit()
     
     # 构建激活链接
-    activate_link = request.url_for("activate_user", code=challenge.code)
+    activate_link = request.url_for("activate_user", code=challenge_code)
     
     # 发送激活邮件
-    background_tasks.add_task(
-        send_email,
+    await queue_email(
+        background_tasks,
         None,
         [db_user.email],
         [db_user.username],
@@ -245,7 +251,7 @@ async def register_user(
                 "activate_link": activate_link
             }
         ),
-        None  # 没有附件
+        priority=True
     )
     
     return UserPublic.from_user(db_user)
@@ -255,12 +261,14 @@ async def register_user(
     summary="用户登录",
     )
 async def login_for_access_token(
-    session: SessionDep,
+    session: AsyncSessionDep,
+    request: Request,
     form_data: OAuth2PasswordRequestForm = Depends()
 ) -> Token:
-    user = session.exec(
+    check_auth_rate_limit(request, form_data.username)
+    user = (await session.exec(
         select(User).where(User.username == form_data.username)
-    ).first()
+    )).first()
     if form_data.scopes:
         authenticate_value = f'Bearer scope="{" ".join(form_data.scopes)}"'
     else:
@@ -271,12 +279,18 @@ async def login_for_access_token(
             detail="不存在的用户",
             headers={"WWW-Authenticate": authenticate_value},
         )
-    if not user or not verify_password(form_data.password, user.password):
+    verified, new_hash = await verify_and_update_password(form_data.password, user.password)
+    if not verified:
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED,
             detail="用户名或密码错误",
             headers={"WWW-Authenticate": authenticate_value},
         )
+    if new_hash:
+        # 哈希成本已调整，按当前配置重新保存密码哈希
+        user.password = new_hash
+        session.add(user)
+        await session.commit()
     
     # 检查用户是否已激活
     if not user.is_active:
@@ -293,24 +307,87 @@ async def login_for_access_token(
             },
         expires_delta=access_token_expires
     )
-    return Token(access_token=access_token, token_type="bearer")
+    refresh_token = issue_refresh_token(session, user.id, form_data.scopes or [])
+    await session.commit()
+    return Token(access_token=access_token, token_type="bearer", refresh_token=refresh_token)
+
+@auth.post(
+    "/refresh",
+    summary="刷新访问令牌",
+    )
+async def refresh_access_token(
+    session: AsyncSessionDep,
+    refresh_token: str = Form(..., description="登录或上次刷新时获得的刷新令牌"),
+) -> Token:
+    # 刷新令牌按哈希索引查找，不进行密码校验；旧刷新令牌随即失效，返回新的刷新令牌
+    record, new_refresh_token = await rotate_refresh_token(session, refresh_token)
+    user_id, scopes = record.user_id, record.scopes.split()
+    user = await session.get(User, user_id)
+    if not user or not user.is_active:
+        raise HTTPException(
+            status_code=status.HTTP_401_UNAUTHORIZED,
+            detail="用户不存在或未激活",
+            headers={"WWW-Authenticate": "Bearer"},
+        )
+    await session.commit()
+    access_token = Token.create_token(
+        data={
+            "sub": str(user_id),
+            "scopes": scopes,
+            },
+        expires_delta=timedelta(minutes=ACCESS_TOKEN_EXPIRE_MINUTES)
+    )
+    return Token(access_token=access_token, token_type="bearer", refresh_token=new_refresh_token)
+
+@auth.post(
+    "/logout",
+    summary="注销刷新令牌",
+    )
+async def logout(
+    session: AsyncSessionDep,
+    refresh_token: str = Form(..., description="要注销的刷新令牌"),
+):
+    # 吊销该刷新令牌所在令牌族，已签发的访问令牌在到期前仍然有效
+    record = (await session.exec(
+        select(RefreshTokenDB).where(RefreshTokenDB.token_hash == hash_refresh_token(refresh_token))
+    )).first()
+    if record:
+        await revoke_refresh_tokens(session, family_id=record.family_id)
+        await session.commit()
+    return {"message": "已注销"}
 
 class EmailReceiverType(str, Enum):
     user = "user"
     isyourday = "isyourday"
 
 
+def receiver_model(receiver_type: EmailReceiverType) -> tuple[Any, str]:
+    """返回接收者的数据表模型及作为收件人名称的字段"""
+    match receiver_type:
+        case EmailReceiverType.isyourday:
+            from ..isyourday.models import VirtualUser
+            return VirtualUser, "real_name"
+        case EmailReceiverType.user:
+            return User, "username"
+        case _:
+            raise HTTPException(
+                status_code=status.HTTP_400_BAD_REQUEST,
+                detail="无效的用户搜索域"
+            )
+
+
 @auth.get(
     "/send-email/pending/{history_id}",
     summary="邮件发送接口，将挂起的请求发送"
     )
 async def send_email_pending_endpoint(
-    session: SessionDep,
+    session: AsyncSessionDep,
+    request: Request,
     history_id: UUID,
     background_tasks: BackgroundTasks = BackgroundTasks(),
-    request_user: User = Security(get_request_active_user, scopes=["auth:write"])
+    request_user: Principal = Security(get_request_active_user, scopes=["auth:write"])
 ):
-    history_record = session.get(EmailSendHistory, history_id)
+    history_record = await session.get(EmailSendHistory, history_id)
     if not history_record:
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND,
@@ -334,29 +411,32 @@ async def send_email_pending_endpoint(
     if history_record.attachments:
         attachment_ids = history_record.attachments.split(",")
         for file_id in attachment_ids:
-            file_db = session.get(FileDB, UUID(file_id))
+            file_db = await session.get(FileDB, UUID(file_id))
             if not file_db:
                 raise HTTPException(
                     status_code=status.HTTP_404_NOT_FOUND,
                     detail=f"附件文件ID {file_id} 不存在"
                 )
             attachments.append(file_db)
+    # 挂起的附件都已存储，超过大小阈值的发送下载链接
+    attachments, links = link_attachments(request, attachments, {file.id for file in attachments})
     
-    background_tasks.add_task(
-        send_email,
+    history_record.status = "sent"
+    session.add(history_record)
+    await session.commit()
+    
+    # 先提交状态再投递，避免覆盖 worker 写入的发送结果
+    await queue_email(
+        background_tasks,
         history_id,
         receiver_emails,
         receiver_names,
         request_user.username,
         history_record.subject,
-        history_record.content,
+        history_record.content + links,
         [file.id for file in attachments],
         store_upload_files=False  # 挂起请求不需要存储文件
     )
-    
-    history_record.status = "sent"
-    session.add(history_record)
-    session.commit()
     return {
         "message": "邮件已进入发送队列",
         "email_history_id": str(history_record.id)
@@ -367,12 +447,12 @@ async def send_email_pending_endpoint(
     summary="更新邮件发送历史记录",
     )
 async def update_email_send_history(
-    session: SessionDep,
+    session: AsyncSessionDep,
     history_id: UUID,
     update_data: EmailSendHistoryUpdate,
-    request_user: User = Security(get_request_active_user, scopes=["auth:write"])
+    request_user: Principal = Security(get_request_active_user, scopes=["auth:write"])
 ):
-    history_record = session.get(EmailSendHistory, history_id)
+    history_record = await session.get(EmailSendHistory, history_id)
     if not history_record:
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND,
@@ -389,8 +469,8 @@ async def update_email_send_history(
     update_dict = update_data.model_dump(exclude_unset=True)
     history_record.sqlmodel_update(update_dict)
     session.add(history_record)
-    session.commit()
-    session.refresh(history_record)
+    await session.commit()
+    await session.refresh(history_record)
     
     return history_record
 
@@ -401,20 +481,55 @@ class EmailHistorySearchType(str, Enum):
     receiver_name_search = "receiver_name_search"
     all_search = "all"
 
+# 须在 /send-email/history/{search_type} 之前注册，否则 export 会被当作 search_type 匹配
+@auth.get(
+    "/send-email/history/export",
+    summary="导出邮件发送历史",
+    response_class=StreamingResponse,
+)
+async def export_email_send_history(
+    request: Request,
+    format: ExportFormat = Query(ExportFormat.ndjson, description="数据格式：csv 或 ndjson"),
+    gzip: bool = Query(False, description="是否以 gzip 压缩（下载 .gz 文件）"),
+    since: datetime | None = Query(None, description="只导出在此时间及之后发送的邮件"),
+    global_export: bool = Query(False, description="是否导出所有用户的发送历史，此项需要管理员权限"),
+    request_user: Principal = Security(get_request_active_user, scopes=["auth:read_basic"]),
+) -> StreamingResponse:
+    """流式导出邮件发送历史，按 (sent_at, id) 排序"""
+    if not request_user.is_superuser and global_export:
+        raise HTTPException(
+            status_code=status.HTTP_403_FORBIDDEN,
+            detail="导出所有用户的邮件历史需要管理员权限"
+        )
+    criteria = []
+    if not global_export:
+        criteria.append(EmailSendHistory.sender_id == request_user.id)
+    if since:
+        criteria.append(EmailSendHistory.sent_at >= since)
+    return export_response(
+        EmailSendHistory, *criteria,
+        sort_key=(EmailSendHistory.sent_at, EmailSendHistory.id), format=format, filename="email_send_history",
+        gzip=gzip, bind=await read_engine(request),
+    )
+
 @auth.get(
     "/send-email/history/{search_type}",
     summary="获取邮件发送历史",
-    response_model=PaginatedResponse[EmailSendHistory]
+    response_model=PaginatedResponse[EmailSendHistoryPartial]
 )
 async def get_email_send_history(
-    session: SessionDep,
+    session: ReadSessionDep,
     search_type: EmailHistorySearchType,
     q: str | None = Query(None, description="搜索关键词"),
     skip: int = Query(0, ge=0, description="跳过的记录数"),
     limit: int = Query(10, le=100, description="返回的记录数"),
+    cursor: str | None = Query(None, description="分页游标，传入上一页返回的 next_cursor 使用键集分页（此时忽略 skip）"),
+    count: CountStrategy = Query(CountStrategy.exact, description="总数统计方式：exact 精确计数，estimate 估算，none 不统计"),
+    fields: str | None = Query(None, description="返回字段，逗号分隔（如 id,name），为空时返回全部字段"),
     global_search: bool = Query(False, description="是否全局搜索，此项需要管理员权限"),
-    request_user: User = Security(get_request_active_user, scopes=["auth:read_basic"]),
-) -> PaginatedResponse[EmailSendHistory]:
+    order: SearchOrder = Query(SearchOrder.rank, description="排序方式：rank 按相关度，仅在指定 q 时生效（不支持游标分页），time 按发送时间"),
+    request_user: Principal = Security(get_request_active_user, scopes=["auth:read_basic"]),
+) -> ORJSONResponse:
     query = select(EmailSendHistory)
     if not request_user.is_superuser and global_search:
         raise HTTPException(
@@ -424,36 +539,37 @@ async def get_email_send_history(
     if not global_search:
         query = query.where(EmailSendHistory.sender_id == request_user.id)
     
-    match search_type:
-        case EmailHistorySearchType.subject_search:
-            if q:
-                query = query.where(col(EmailSendHistory.subject).like(f"%{q}%"))
-        case EmailHistorySearchType.content_search:
-            if q:
-                query = query.where(col(EmailSendHistory.content).like(f"%{q}%"))
-        case EmailHistorySearchType.receiver_email_search:
-            if q:
-                query = query.where(col(EmailSendHistory.receiver_emails).like(f"%{q}%"))
-        case EmailHistorySearchType.receiver_name_search:
-            if q:
-                query = query.where(col(EmailSendHistory.receiver_names).like(f"%{q}%"))
-    
-    # 获取总数
-    total = len(session.exec(query).all())
-    
-    # 获取分页数据，按发送时间降序排列（从新到旧）
-    history_records = session.exec(
-        query.order_by(desc(EmailSendHistory.sent_at)).offset(skip).limit(limit)
-    ).all()
-    
-    return PaginatedResponse[EmailSendHistory].create(list(history_records), skip, limit, total)
+    # 默认按发送时间降序排列（从新到旧），指定关键词且按相关度排序时改为相关度排序
+    sort_key = (EmailSendHistory.sent_at, EmailSendHistory.id)
+    if q:
+        match search_type:
+            case EmailHistorySearchType.subject_search:
+                search_fields = ["subject"]
+            case EmailHistorySearchType.content_search:
+                search_fields = ["content"]
+            case EmailHistorySearchType.receiver_email_search:
+                search_fields = ["receiver_emails"]
+            case EmailHistorySearchType.receiver_name_search:
+                search_fields = ["receiver_names"]
+            case _:
+                search_fields = None
+        query = search(session, query, EmailSendHistory, q, search_fields)
+        if order == SearchOrder.rank:
+            sort_key = None
+    
+    page = await PaginatedResponse[EmailSendHistoryPartial].from_query_async(
+        session, query, skip, limit,
+        sort_key=sort_key, descending=True, cursor=cursor, count=count, fields=fields
+    )
+    return page.to_response()
 
 @auth.post(
     "/send-email/{receiver_type}",
     summary="邮件发送接口",
     )
 async def send_email_endpoint(
-    session: SessionDep,
+    session: AsyncSessionDep,
+    request: Request,
     receiver_type: EmailReceiverType,
     receiver: list[UUID] = Form(description="接收者用户ID列表"),
     subject: str = Form("Test Email", description="邮件主题", min_length=1),
@@ -462,15 +578,23 @@ async def send_email_endpoint(
     files_in_store: list[UUID] | None = None,
     store_upload_files: bool = Form(False, description="是否存储上传的文件到服务器"),
     background_tasks: BackgroundTasks = BackgroundTasks(),
-    request_user: User = Security(get_request_active_user, scopes=["auth:write"]),
-    send_directly: bool = Form(default=True, description="是否立即发送，False则pending")
+    request_user: Principal = Security(get_request_active_user, scopes=["auth:write"]),
+    send_directly: bool = Form(default=True, description="是否立即发送，False则pending"),
+    attachment_links: bool | None = Form(
+        default=None,
+        description="已存储的附件是否改为发送签名下载链接：true 全部发送链接，false 全部作为附件，不填时超过大小阈值的附件发送链接",
+    ),
 ):
     """
     files是用户上传的文件列表，files_in_store是已存储在服务器上的文件ID列表（注意需要权限）。
+    改为发送链接的附件以下载链接列表的形式附加在正文末尾（发送记录中保存原正文），收件人无需登录即可在有效期内下载；
+    未存储的上传文件始终作为附件发送。挂起的请求在发送时按大小阈值决定。
     """
     receiver_emails: list[str] = []
     receiver_names: list[str] = []
     attachments: list[FileDB] = []
+    # 已存储到数据库、可以发送下载链接的文件
+    linkable: set[UUID] = set()
     
     if not store_upload_files and not send_directly:
         raise HTTPException(
@@ -478,32 +602,18 @@ async def send_email_endpoint(
             detail="挂起请求需要将文件储存到服务器中才可使用"
         )
     
+    model, name_field = receiver_model(receiver_type)
+    # 一次（按块）查询全部接收者
+    receivers = await fetch_by_ids(session, model, receiver)
     for user_id in receiver:
-        try:
-            match receiver_type:
-                case EmailReceiverType.isyourday:
-                    from ..isyourday.models import VirtualUser
-                    user = session.exec(
-                        select(VirtualUser).where(VirtualUser.id == user_id)
-                    ).one()
-                    username = user.real_name
-                case EmailReceiverType.user:
-                    user = session.exec(
-                        select(User).where(User.id == user_id)
-                    ).one()
-                    username = user.username
-                case _:
-                    raise HTTPException(
-                        status_code=status.HTTP_400_BAD_REQUEST,
-                        detail="无效的用户搜索域"
-                    )
-        except Exception:
+        user = receivers.get(user_id)
+        if user is None:
             raise HTTPException(
                 status_code=status.HTTP_404_NOT_FOUND,
                 detail=f"用户ID {user_id} 不存在"
             )
         receiver_emails.append(user.email)
-        receiver_names.append(username or "未知用户")
+        receiver_names.append(getattr(user, name_field) or "未知用户")
     
     if files:
         upload_path = file_path_str(FILE_PATH.TEMP_PATH) if not store_upload_files else file_path_str(FILE_PATH.USER_PATH, request_user.id)
@@ -524,28 +634,30 @@ async def send_email_endpoint(
             # 如果需要存储文件到数据库
             if store_upload_files:
                 session.add(file_db)
+                linkable.add(file_db.id)
                 
     if store_upload_files:
-        session.commit()
+        await session.commit()
         for file_db in attachments:
             # 确保文件已刷新到数据库（仅对已存储的文件）
             if file_db in session:
-                session.refresh(file_db)
+                await session.refresh(file_db)
     
     for file_id in files_in_store or []:
-        file_db = session.get(FileDB, file_id)
+        file_db = await session.get(FileDB, file_id)
         if not file_db:
             raise HTTPException(
                 status_code=status.HTTP_404_NOT_FOUND,
                 detail=f"文件ID {file_id} 不存在"
             )
-        if not file_db.uploader == request_user:
+        if file_db.uploader_id != request_user.id:
             if not file_db.is_public and not request_user.is_superuser:
                 raise HTTPException(
                     status_code=status.HTTP_403_FORBIDDEN,
                     detail="没有权限访问该文件"
                 )
         attachments.append(file_db)
+        linkable.add(file_db.id)
     
     history_record = EmailSendHistory(
         receiver_type=str(receiver_type),
@@ -558,19 +670,20 @@ async def send_email_endpoint(
         status="pending"
     )
     session.add(history_record)
-    session.commit()
-    session.refresh(history_record)
+    await session.commit()
+    await session.refresh(history_record)
     
     if send_directly:
-        background_tasks.add_task(
-            send_email,
+        inline, links = link_attachments(request, attachments, linkable, attachment_links)
+        await queue_email(
+            background_tasks,
             history_record.id,
             receiver_emails,
             receiver_names,
             request_user.username,
             subject,
-            content,
-            [file.id for file in attachments],
+            content + links,
+            [file.id for file in inline],
             store_upload_files
         )
         return {
@@ -582,6 +695,105 @@ async def send_email_endpoint(
         "message": "邮件已记录为挂起状态，等待发送",
         "email_history_id": str(history_record.id)
     }
+
+
+@auth.post(
+    "/send-email/merge/{receiver_type}",
+    summary="邮件合并发送接口，为每个收件人分别渲染邮件",
+    )
+async def send_merged_email_endpoint(
+    session: AsyncSessionDep,
+    receiver_type: EmailReceiverType,
+    body: MailMergeRequest,
+    background_tasks: BackgroundTasks,
+    request_user: Principal = Security(get_request_active_user, scopes=["auth:write"]),
+):
+    """
+    subject 和 content 是 Jinja 模板，为每个收件人分别渲染，可以使用收件人的字段（如 {{ real_name }}、{{ email }}）。
+    收件人为 receiver 中的 id，未指定时为满足 query（全文检索）和 is_active 条件的全部接收者。
+    每个收件人写入一条发送记录，模板渲染失败的记录直接标记为失败。
+    """
+    if not request_user.is_superuser:
+        raise HTTPException(
+            status_code=status.HTTP_403_FORBIDDEN,
+            detail="此操作需要管理员权限"
+        )
+    if body.receiver is None and body.query is None and body.is_active is None:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="请指定收件人ID或筛选条件"
+        )
+    if body.receiver is not None and len(body.receiver) > EMAIL_MERGE_MAX_RECIPIENTS:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=f"收件人数量超过上限 {EMAIL_MERGE_MAX_RECIPIENTS}"
+        )
+    try:
+        template = MergeTemplate(body.subject, body.content)
+    except TemplateSyntaxError as e:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=f"模板语法错误（第 {e.lineno} 行）: {e.message}"
+        )
+
+    model, name_field = receiver_model(receiver_type)
+    # 模板可以使用的收件人字段，用户只提供公开信息
+    columns = [User.id, User.username, User.email, User.real_name] if model is User else list(model.__table__.columns)
+    criteria = [model.is_active == body.is_active] if body.is_active is not None else []
+    missing: list[UUID] = []
+    if body.receiver is not None:
+        rows = []
+        for chunk in chunked(body.receiver):
+            rows.extend((await session.exec(select(*columns).where(model.id.in_(chunk), *criteria))).all())
+        found = {row.id for row in rows}
+        missing = [user_id for user_id in dict.fromkeys(body.receiver) if user_id not in found]
+    else:
+        statement = select(*columns).where(*criteria)
+        statement = search(session, statement, model, body.query) if body.query else statement.order_by(model.id)
+        rows = (await session.exec(statement.limit(EMAIL_MERGE_MAX_RECIPIENTS + 1))).all()
+        if len(rows) > EMAIL_MERGE_MAX_RECIPIENTS:
+            raise HTTPException(
+                status_code=status.HTTP_400_BAD_REQUEST,
+                detail=f"收件人数量超过上限 {EMAIL_MERGE_MAX_RECIPIENTS}，请缩小筛选范围"
+            )
+
+    queued = failed = 0
+    now = datetime.now()
+    for start in range(0, len(rows), EMAIL_MERGE_BATCH_SIZE):
+        contexts = [row._asdict() for row in rows[start:start + EMAIL_MERGE_BATCH_SIZE]]
+        # 渲染是纯 CPU 操作，在线程中执行，不阻塞事件循环
+        rendered = await asyncio.to_thread(template.render_batch, contexts)
+        records = []
+        for context, result in zip(contexts, rendered):
+            ok = isinstance(result, tuple)
+            records.append({
+                "id": uuid4(),
+                "receiver_type": str(receiver_type),
+                "receiver_emails": context["email"],
+                "receiver_names": context[name_field] or "未知用户",
+                "sender_id": request_user.id,
+                "subject": result[0] if ok else body.subject,
+                "content": result[1] if ok else body.content,
+                "attachments": "",
+                "sent_at": now,
+                "status": "pending" if ok else "failed",
+                "reason": None if ok else result,
+            })
+        await bulk_insert(session, EmailSendHistory, records)
+        await session.commit()
+        pending = [record["id"] for record in records if record["status"] == "pending"]
+        if pending:
+            await queue_merged_emails(background_tasks, pending, request_user.username)
+        queued += len(pending)
+        failed += len(records) - len(pending)
+
+    return {
+        "message": "邮件已进入发送队列",
+        "total": len(rows),
+        "queued": queued,
+        "failed": failed,
+        "missing": [str(user_id) for user_id in missing],
+    }
     
 
 
@@ -591,10 +803,11 @@ async def send_email_endpoint(
     summary="更新用户信息",
     )
 async def update_user_basic_info(
-    session: SessionDep,
+    session: AsyncSessionDep,
+    request: Request,
     new_user_info: UserUpdate,
     user_pk: UUID | None = None,
-    request_user: User = Security(get_request_active_user, scopes=["auth:write"])
+    request_user: Principal = Security(get_request_active_user, scopes=["auth:write"])
 ):
     user_db = request_user
     if user_pk is None:
@@ -605,7 +818,7 @@ async def update_user_basic_info(
             detail="修改其他用户信息需要提升权限"
         )
     else:
-        user_db = session.get(User, user_pk)
+        user_db = await session.get(User, user_pk)
     if not user_db:
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND,
@@ -617,12 +830,17 @@ async def update_user_basic_info(
             detail="无效的邮箱格式"
         )
     if new_user_info.password:
-        new_user_info.password = hash_password(new_user_info.password)
+        # 与登录相同，按客户端地址和用户名限制触发密码哈希的请求频率
+        check_auth_rate_limit(request, request_user.username)
+        new_user_info.password = await hash_password_async(new_user_info.password)
+        # 修改密码后此前签发的刷新令牌全部失效
+        await revoke_refresh_tokens(session, user_id=user_db.id)
     new_user_data = new_user_info.model_dump(exclude_unset=True)
     user_db.sqlmodel_update(new_user_data)
     session.add(user_db)
-    session.commit()
-    session.refresh(user_db)
+    await session.commit()
+    await invalidate_principals(user_db.id)
+    await session.refresh(user_db)
     return UserPublic.from_user(user_db)
 
 @auth.delete(
@@ -630,16 +848,19 @@ async def update_user_basic_info(
     summary="删除用户",
     )
 async def delete_user(
-    session: SessionDep,
+    session: AsyncSessionDep,
     user_pk: list[UUID] = Query(..., description="用户ID列表"),
-    request_user: User = Security(get_request_active_user, scopes=["auth:delete"])
+    request_user: Principal = Security(get_request_active_user, scopes=["auth:delete"])
 ):
     successful_deletes = []
     failed_users = []
     skipped_users = []
     
-    for pk in user_pk:
-        user_db = session.get(User, pk)
+    users = await fetch_by_ids(session, User, user_pk)
+    deleted_ids = []
+    avatar_ids = []
+    for pk in dict.fromkeys(user_pk):
+        user_db = users.get(pk)
         if not user_db:
             failed_users.append({
                 "id": str(pk),
@@ -658,16 +879,30 @@ async def delete_user(
                 "reason": "非管理员无权删除其他用户"
             })
             continue
-        # 删除用户的头像文件
-        if user_db.avatar:
-            avatar_path = user_db.avatar.get_path()
-            if avatar_path.exists():
-                avatar_path.unlink()
-            session.delete(user_db.avatar)
-        session.delete(user_db)
+        if user_db.avatar_id:
+            avatar_ids.append(user_db.avatar_id)
+        deleted_ids.append(pk)
         successful_deletes.append(str(pk))
     
-    session.commit()
+    # 删除用户的头像文件
+    avatars = await fetch_by_ids(session, FileDB, avatar_ids)
+    for avatar in avatars.values():
+        avatar_path = avatar.get_path()
+        if avatar_path.exists():
+            avatar_path.unlink()
+    
+    # 批量删除不经过 ORM 级联，按原有关系依次处理：发送历史、激活码、刷新令牌随用户删除，
+    # 用户上传的文件保留并解除关联，其他用户引用被删头像时改为无头像
+    await bulk_delete_where(session, EmailSendHistory, EmailSendHistory.sender_id, deleted_ids)
+    await bulk_delete_where(session, ChallengeCodeDB, ChallengeCodeDB.user_id, deleted_ids)
+    await bulk_delete_where(session, RefreshTokenDB, RefreshTokenDB.user_id, deleted_ids)
+    await bulk_nullify(session, FileDB.uploader_id, deleted_ids)
+    await bulk_nullify(session, User.avatar_id, avatars)
+    await bulk_delete(session, User, deleted_ids)
+    await bulk_delete(session, FileDB, avatars)
+    
+    await session.commit()
+    await invalidate_principals(*[UUID(pk) for pk in successful_deletes])
     
     result = {
         "summary": {
@@ -692,7 +927,7 @@ async def delete_user(
 async def activate_user(
     code: str,
     request: Request,
-    session: SessionDep
+    session: AsyncSessionDep
 ):
     """
     通过激活码激活用户账户，返回HTML激活成功页面
@@ -701,10 +936,14 @@ async def activate_user(
     
     
     
-    # 查找激活码
-    challenge = session.exec(
-        select(ChallengeCodeDB).where(ChallengeCodeDB.code == code, ChallengeCodeDB.call_from == "register")
-    ).first()
+    # 取出并删除激活码（过期或已被使用的激活码取不到）
+    try:
+        challenge = await challenge_store.consume(session, code, "register")
+    except ChallengeUnavailable:
+        raise HTTPException(
+            status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+            detail="服务暂时不可用，请稍后重试"
+        )
     
     if not challenge:
         # 返回激活失败页面
@@ -718,22 +957,8 @@ async def activate_user(
             }
         )
     
-    # 检查激活码是否已过期 (激活码永不过期，可以根据需要调整)
-    if challenge.created_at < datetime.now() - timedelta(minutes=5):
-        session.delete(challenge)
-        session.commit()
-        return email_templates.TemplateResponse(
-            "activate_error.html.j2",
-            {
-                "request": request,
-                "error_title": "激活链接已过期",
-                "error_message": "激活链接已过期，请重新申请激活邮件",
-                "support_email": "support@example.com"
-            }
-        )
-    
     # 查找对应用户
-    user = session.get(User, challenge.user_id)
+    user = await session.get(User, challenge.user_id)
     if not user:
         return email_templates.TemplateResponse(
             "activate_error.html.j2",
@@ -747,9 +972,8 @@ async def activate_user(
     
     # 检查用户是否已激活
     if user.is_active:
-        # 删除已使用的激活码
-        session.delete(challenge)
-        session.commit()
+        # 提交激活码的删除
+        await session.commit()
         
         return email_templates.TemplateResponse(
             "activate_successful.html.j2",
@@ -764,11 +988,11 @@ async def activate_user(
             }
         )
     
-    # 激活用户并删除激活码
+    # 激活用户，与激活码的删除一起提交
     user.is_active = True
-    session.delete(challenge)
     session.add(user)
-    session.commit()
+    await session.commit()
+    await invalidate_principals(user.id)
     
     # 返回激活成功页面
     return email_templates.TemplateResponse(
@@ -790,7 +1014,7 @@ async def activate_user(
     summary="重新发送激活邮件"
 )
 async def resend_activation_email(
-    session: SessionDep,
+    session: AsyncSessionDep,
     background_tasks: BackgroundTasks,
     request: Request,
     email: str = Form(..., description="用户邮箱")
@@ -799,9 +1023,9 @@ async def resend_activation_email(
     重新发送激活邮件
     """
     # 查找用户
-    user = session.exec(
+    user = (await session.exec(
         select(User).where(User.email == email)
-    ).first()
+    )).first()
     
     if not user:
         raise HTTPException(
@@ -815,25 +1039,16 @@ async def resend_activation_email(
             detail="用户已激活，无需重复激活"
         )
     
-    # 删除旧的激活码
-    old_challenges = session.exec(
-        select(ChallengeCodeDB).where(ChallengeCodeDB.user_id == user.id, ChallengeCodeDB.call_from == "register")
-    ).all()
-    for challenge in old_challenges:
-        session.delete(challenge)
-    
-    # 生成新的激活码
-    new_challenge = ChallengeCodeDB(user_id=user.id, call_from="register")
-    session.add(new_challenge)
-    session.commit()
-    session.refresh(new_challenge)
+    # 生成新的激活码，旧的激活码随之失效
+    challenge_code = await challenge_store.issue(session, user.id, "register")
+    await session.commit()
     
     # 构建激活链接
-    activate_link = f"{request.url.scheme}://{request.url.netloc}/auth/activate/{new_challenge.code}"
+    activate_link = f"{request.url.scheme}://{request.url.netloc}/auth/activate/{challenge_code}"
     
     # 发送激活邮件
-    background_tasks.add_task(
-        send_email,
+    await queue_email(
+        background_tasks,
         None,
         [user.email],
         [user.username],
@@ -845,7 +1060,7 @@ async def resend_activation_email(
                 "activate_link": activate_link
             }
         ),
-        None  # 没有附件
+        priority=True
     )
     
     return {"message": "激活邮件已重新发送"}
@@ -855,7 +1070,7 @@ async def resend_activation_email(
     summary="发送密码重置邮件"
 )
 async def send_reset_password_email(
-    session: SessionDep,
+    session: AsyncSessionDep,
     background_tasks: BackgroundTasks,
     request: Request,
     email: str = Form(..., description="用户邮箱")
@@ -864,9 +1079,9 @@ async def send_reset_password_email(
     发送密码重置邮件
     """
     # 查找用户
-    user = session.exec(
+    user = (await session.exec(
         select(User).where(User.email == email)
-    ).first()
+    )).first()
     
     if not user:
         # 为了安全起见，即使用户不存在也返回成功消息
@@ -878,25 +1093,16 @@ async def send_reset_password_email(
             detail="账户未激活，请先激活账户"
         )
     
-    # 删除该用户的旧密码重置码
-    old_reset_codes = session.exec(
-        select(ChallengeCodeDB).where(ChallengeCodeDB.user_id == user.id, ChallengeCodeDB.call_from == "reset_password")
-    ).all()
-    for code in old_reset_codes:
-        session.delete(code)
-    
-    # 生成新的重置码
-    reset_code = ChallengeCodeDB(user_id=user.id, call_from="reset_password")
-    session.add(reset_code)
-    session.commit()
-    session.refresh(reset_code)
+    # 生成新的重置码，该用户旧的重置码随之失效
+    reset_code = await challenge_store.issue(session, user.id, "reset_password")
+    await session.commit()
     
     # 构建重置链接
-    reset_link = f"{request.url.scheme}://{request.url.netloc}/auth/reset-password/{reset_code.code}"
+    reset_link = f"{request.url.scheme}://{request.url.netloc}/auth/reset-password/{reset_code}"
     
     # 发送重置密码邮件
-    background_tasks.add_task(
-        send_email,
+    await queue_email(
+        background_tasks,
         None,
         [user.email],
         [user.username],
@@ -908,7 +1114,7 @@ async def send_reset_password_email(
                 "reset_link": reset_link
             }
         ),
-        None  # 没有附件
+        priority=True
     )
     
     return {"message": "如果该邮箱已注册，您将收到密码重置邮件"}
@@ -922,7 +1128,7 @@ async def send_reset_password_email(
 async def reset_password_page(
     code: str,
     request: Request,
-    session: SessionDep
+    session: AsyncSessionDep
 ):
     """
     显示密码重置页面
@@ -930,9 +1136,7 @@ async def reset_password_page(
     from datetime import datetime, timedelta
     
     # 查找重置码
-    reset_code = session.exec(
-        select(ChallengeCodeDB).where(ChallengeCodeDB.code == code, ChallengeCodeDB.call_from == "reset_password")
-    ).first()
+    reset_code = await challenge_store.get(session, code, "reset_password")
     
     if not reset_code:
         return email_templates.TemplateResponse(
@@ -945,10 +1149,8 @@ async def reset_password_page(
             }
         )
     
-    # 检查重置码是否过期
+    # 检查重置码是否过期（重置页面只在重置码生成后 5 分钟内可以打开）
     if reset_code.created_at < datetime.now() - timedelta(minutes=5):
-        session.delete(reset_code)
-        session.commit()
         return email_templates.TemplateResponse(
             "reset_error.html.j2",
             {
@@ -960,7 +1162,7 @@ async def reset_password_page(
         )
     
     # 查找对应用户
-    user = session.get(User, reset_code.user_id)
+    user = await session.get(User, reset_code.user_id)
     if not user:
         return email_templates.TemplateResponse(
             "reset_error.html.j2",
@@ -990,14 +1192,14 @@ async def reset_password_page(
 )
 async def reset_password_submit(
     code: str,
-    session: SessionDep,
+    request: Request,
+    session: AsyncSessionDep,
     new_password: str = Form(..., description="新密码"),
     confirm_password: str = Form(..., description="确认新密码")
 ):
     """
     执行密码重置
     """
-    from datetime import datetime, timedelta
     
     if new_password != confirm_password:
         raise HTTPException(
@@ -1032,10 +1234,8 @@ async def reset_password_submit(
             detail="密码必须包含至少一个特殊字符"
         )
     
-    # 查找重置码
-    reset_code = session.exec(
-        select(ChallengeCodeDB).where(ChallengeCodeDB.code == code, ChallengeCodeDB.call_from == "reset_password")
-    ).first()
+    # 先查找重置码（过期的重置码查找不到），无效的链接不进行密码哈希；使用时再原子地取出
+    reset_code = await challenge_store.get(session, code, "reset_password")
     
     if not reset_code:
         raise HTTPException(
@@ -1043,29 +1243,35 @@ async def reset_password_submit(
             detail="重置链接无效或已过期"
         )
     
-    # 检查重置码是否过期（24小时）
-    if reset_code.created_at < datetime.now() - timedelta(hours=24):
-        session.delete(reset_code)
-        session.commit()
-        raise HTTPException(
-            status_code=status.HTTP_400_BAD_REQUEST,
-            detail="重置链接已过期，请重新申请密码重置"
-        )
-    
     # 查找对应用户
-    user = session.get(User, reset_code.user_id)
+    user = await session.get(User, reset_code.user_id)
     if not user:
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND,
             detail="用户不存在"
         )
     
+    # 与登录相同，按客户端地址和用户名限制触发密码哈希的请求频率
+    check_auth_rate_limit(request, user.username)
+    
     # 更新用户密码
-    user.password = hash_password(new_password)
-    session.add(user)
+    user.password = await hash_password_async(new_password)
     
-    # 删除使用过的重置码
-    session.delete(reset_code)
-    session.commit()
+    # 取出并删除重置码：并发的请求中只有一个能取得，其余按链接无效处理
+    try:
+        consumed = await challenge_store.consume(session, code, "reset_password")
+    except ChallengeUnavailable:
+        raise HTTPException(
+            status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+            detail="服务暂时不可用，请稍后重试"
+        )
+    if consumed is None or consumed.user_id != user.id:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="重置链接无效或已过期"
+        )
+    session.add(user)
+    await revoke_refresh_tokens(session, user_id=user.id)
+    await session.commit()
     
     return {"message": "密码重置成功，请使用新密码登录"}
@@ -0,0 +1,125 @@
+"""
+激活码、密码重置码的存储
+配置了 REDIS_URL 时保存在 Redis 中，依靠键的过期时间自动清理；未配置或 Redis 不可用时保存在 ChallengeCodeDB 表中，
+过期的记录在生成新码时批量删除。查找时 Redis 未命中会再查一次数据库，以兼容启用 Redis 之前或 Redis 故障期间生成的码
+使用码时以 consume 原子地取出并删除，同一个码只能被一个请求使用
+"""
+import json
+import secrets
+import uuid
+from datetime import datetime, timedelta
+from typing import Optional
+
+from pydantic import BaseModel
+import redis.asyncio as redis
+from redis.exceptions import RedisError
+from sqlmodel import delete, select
+from sqlmodel.ext.asyncio.session import AsyncSession
+
+from .models import ChallengeCodeDB
+from .settings import CHALLENGE_CODE_TTL
+from ..settings import REDIS_URL
+
+
+class ChallengeUnavailable(Exception):
+    """无法确认码是否已被使用（Redis 不可用），不能继续使用该码"""
+
+
+class Challenge(BaseModel):
+    """查找到的激活码或密码重置码"""
+    code: str
+    call_from: str
+    user_id: uuid.UUID
+    created_at: datetime
+    in_db: bool = False
+
+
+class ChallengeStore:
+    """按用途（call_from）保存一次性验证码，每个用户每种用途只保留最新的一个"""
+
+    KEY_PREFIX = "challenge:"
+
+    def __init__(self, ttl: dict[str, int], redis_url: Optional[str] = None):
+        self.ttl = ttl
+        self._redis = redis.Redis.from_url(redis_url, socket_timeout=1, socket_connect_timeout=1) if redis_url else None
+
+    def _code_key(self, call_from: str, code: str) -> str:
+        return f"{self.KEY_PREFIX}{call_from}:code:{code}"
+
+    def _user_key(self, call_from: str, user_id: uuid.UUID) -> str:
+        return f"{self.KEY_PREFIX}{call_from}:user:{user_id}"
+
+    async def issue(self, session: AsyncSession, user_id: uuid.UUID, call_from: str) -> str:
+        """生成新码并使该用户此前同一用途的码失效，写入数据库时由调用方提交"""
+        code = secrets.token_urlsafe(24)
+        ttl = self.ttl[call_from]
+        if self._redis is not None:
+            value = json.dumps({"user_id": str(user_id), "created_at": datetime.now().isoformat()})
+            user_key = self._user_key(call_from, user_id)
+            try:
+                old_code = await self._redis.getset(user_key, code)
+                async with self._redis.pipeline(transaction=True) as pipe:
+                    if old_code:
+                        pipe.delete(self._code_key(call_from, old_code.decode()))
+                    pipe.expire(user_key, ttl)
+                    pipe.set(self._code_key(call_from, code), value, ex=ttl)
+                    await pipe.execute()
+                return code
+            except RedisError:
+                pass
+        # 删除该用户同一用途的旧码，顺带清理所有已过期的同用途记录
+        await session.exec(delete(ChallengeCodeDB).where(
+            ChallengeCodeDB.call_from == call_from,
+            (ChallengeCodeDB.user_id == user_id) | (ChallengeCodeDB.created_at < datetime.now() - timedelta(seconds=ttl)),
+        ))
+        session.add(ChallengeCodeDB(code=code, user_id=user_id, call_from=call_from))
+        return code
+
+    async def get(self, session: AsyncSession, code: str, call_from: str) -> Optional[Challenge]:
+        """查找未过期的码，不存在或已过期时返回 None"""
+        if self._redis is not None:
+            try:
+                value = await self._redis.get(self._code_key(call_from, code))
+            except RedisError:
+                value = None
+            if value:
+                data = json.loads(value)
+                return Challenge(code=code, call_from=call_from, user_id=data["user_id"], created_at=data["created_at"])
+        return await self.get_from_db(session, code, call_from)
+
+    async def get_from_db(self, session: AsyncSession, code: str, call_from: str) -> Optional[Challenge]:
+        record = (await session.exec(
+            select(ChallengeCodeDB).where(
+                ChallengeCodeDB.code == code,
+                ChallengeCodeDB.call_from == call_from,
+                ChallengeCodeDB.created_at >= datetime.now() - timedelta(seconds=self.ttl[call_from]),
+            )
+        )).first()
+        if not record:
+            return None
+        return Challenge(code=code, call_from=call_from, user_id=record.user_id, created_at=record.created_at, in_db=True)
+
+    async def consume(self, session: AsyncSession, code: str, call_from: str) -> Optional[Challenge]:
+        """
+        取出并删除未过期的码，不存在、已过期或已被其他请求使用时返回 None
+        Redis 中的码以 GETDEL 原子地取出；数据库中的码以删除的行数判断是否由本请求取得，删除由调用方与码的用途一起提交
+        Redis 不可用时抛出 ChallengeUnavailable
+        """
+        if self._redis is not None:
+            try:
+                value = await self._redis.getdel(self._code_key(call_from, code))
+            except RedisError as e:
+                raise ChallengeUnavailable(str(e)) from e
+            if value:
+                data = json.loads(value)
+                return Challenge(code=code, call_from=call_from, user_id=data["user_id"], created_at=data["created_at"])
+        challenge = await self.get_from_db(session, code, call_from)
+        if challenge is None:
+            return None
+        result = await session.exec(delete(ChallengeCodeDB).where(
+            ChallengeCodeDB.code == code, ChallengeCodeDB.call_from == call_from
+        ))
+        return challenge if result.rowcount == 1 else None
+
+
+challenge_store = ChallengeStore(CHALLENGE_CODE_TTL, REDIS_URL)
@@ -0,0 +1,106 @@
+"""
+邮件合并
+以同一组模板（主题和 HTML 正文均为 Jinja 模板）为每个收件人渲染个性化邮件，每个收件人一条发送记录：
+- 用户提交的模板在沙箱环境中渲染，不能访问内部属性或调用不安全的方法；正文中的变量自动转义 HTML
+- 按批渲染并批量写入发送记录，每批作为一个投递任务，在连接池的同一个连接上依次发送
+"""
+import uuid
+from typing import Any, Mapping, Sequence
+
+from fastapi import BackgroundTasks
+from jinja2.sandbox import SandboxedEnvironment
+from sqlmodel import Session, select, update
+
+from .models import EmailSendHistory
+from .settings import EMAIL_SENDER_ACCOUNT
+from .smtp import is_transient, smtp_pool
+from .utils import compose_email, publish_email_task
+from ..db_manager import engine
+
+# 正文为 HTML，变量自动转义；主题为纯文本
+_content_environment = SandboxedEnvironment(autoescape=True)
+_subject_environment = SandboxedEnvironment(autoescape=False)
+
+
+class MergeTemplate:
+    """编译后的主题模板和正文模板，语法错误时抛出 jinja2.TemplateSyntaxError"""
+
+    def __init__(self, subject: str, content: str):
+        self.subject = _subject_environment.from_string(subject)
+        self.content = _content_environment.from_string(content)
+
+    def render(self, context: Mapping[str, Any]) -> tuple[str, str]:
+        # 主题不能包含换行
+        subject = " ".join(self.subject.render(context).split())
+        return subject, self.content.render(context)
+
+    def render_batch(self, contexts: Sequence[Mapping[str, Any]]) -> list[tuple[str, str] | str]:
+        """逐个渲染，返回 (主题, 正文)，渲染失败时为错误说明（供线程池调用）"""
+        results: list[tuple[str, str] | str] = []
+        for context in contexts:
+            try:
+                results.append(self.render(context))
+            except Exception as e:
+                results.append(f"模板渲染失败: {e}")
+        return results
+
+
+def deliver_history_batch(history_ids: Sequence[uuid.UUID], sender_name: str, retry: bool = False) -> list[uuid.UUID]:
+    """
+    在同一个连接上发送一批发送记录（每条记录一个收件人）并更新状态，已发送成功的记录跳过
+    retry 为 True 时临时性失败的记录标记为 retrying 并返回其 id，由调用方稍后重试；否则标记为 failed
+    """
+    with Session(engine) as session:
+        records = session.exec(
+            select(
+                EmailSendHistory.id, EmailSendHistory.receiver_emails, EmailSendHistory.receiver_names,
+                EmailSendHistory.subject, EmailSendHistory.content,
+            ).where(EmailSendHistory.id.in_(history_ids), EmailSendHistory.status != "success")
+        ).all()
+        if not records:
+            return []
+        session.exec(
+            update(EmailSendHistory)
+            .where(EmailSendHistory.id.in_([record.id for record in records]))
+            .values(status="sending")
+        )
+        session.commit()
+
+    errors = smtp_pool.send_batch([
+        (
+            EMAIL_SENDER_ACCOUNT,
+            [record.receiver_emails],
+            compose_email([record.receiver_emails], [record.receiver_names], sender_name, record.subject, record.content),
+        )
+        for record in records
+    ])
+
+    transient: list[uuid.UUID] = []
+    with Session(engine) as session:
+        sent = [record.id for record, error in zip(records, errors) if error is None]
+        if sent:
+            session.exec(update(EmailSendHistory).where(EmailSendHistory.id.in_(sent)).values(status="success", reason=None))
+        for record, error in zip(records, errors):
+            if error is None:
+                continue
+            retrying = retry and is_transient(error)
+            if retrying:
+                transient.append(record.id)
+            session.exec(
+                update(EmailSendHistory)
+                .where(EmailSendHistory.id == record.id)
+                .values(status="retrying" if retrying else "failed", reason=f"邮件发送失败: {error}")
+            )
+        session.commit()
+    return transient
+
+
+async def queue_merged_emails(background_tasks: BackgroundTasks, history_ids: list[uuid.UUID], sender_name: str) -> None:
+    """
+    投递一批已写入的发送记录：启用 Celery 时发布到批量队列，否则在当前进程的后台任务（线程池）中发送
+    发送记录需在调用前提交
+    """
+    batch = {"history_ids": [str(history_id) for history_id in history_ids], "sender_name": sender_name}
+    if await publish_email_task("send_merged_emails", batch):
+        return
+    background_tasks.add_task(deliver_history_batch, history_ids, sender_name)
@@ -0,0 +1,92 @@
+"""
+流式写出邮件
+邮件头和正文在内存中生成，附件从磁盘（或已编码附件缓存）逐块读取、Base64 编码后依次写入 SpooledMessage：
+不超过 EMAIL_SPOOL_MAX_MEMORY_MB 的邮件保留在内存中，更大的邮件写入临时文件。
+写入的内容已是 SMTP DATA 的格式（CRLF 换行，行首的点加倍），发送时逐块写入连接，
+构造和发送邮件的内存占用与附件大小无关
+"""
+import re
+import tempfile
+import urllib.parse
+import uuid
+from email.message import Message
+from email.mime.base import MIMEBase
+from email.policy import compat32
+from typing import Iterator, Sequence
+
+from .attachments import attachment_cache
+from .settings import EMAIL_SPOOL_MAX_MEMORY_MB
+from ..file.models import FileDB
+
+# 与原先 as_string() 相同的格式，换行改为 CRLF
+_POLICY = compat32.clone(linesep="\r\n")
+_LEADING_DOT = re.compile(rb"^\.", re.MULTILINE)
+
+
+class SpooledMessage:
+    """按 SMTP DATA 格式写出的邮件，以 CRLF 结尾"""
+
+    def __init__(self, max_memory: int = int(EMAIL_SPOOL_MAX_MEMORY_MB * 1024 * 1024)):
+        self._file = tempfile.SpooledTemporaryFile(max_size=max_memory)
+        self.size = 0
+
+    def write(self, data: bytes) -> None:
+        self._file.write(data)
+        self.size += len(data)
+
+    def chunks(self, chunk_size: int = 64 * 1024) -> Iterator[bytes]:
+        """从头逐块读取邮件内容，可以多次读取（如发送给多组收件人）"""
+        self._file.seek(0)
+        while chunk := self._file.read(chunk_size):
+            yield chunk
+
+    def close(self) -> None:
+        self._file.close()
+
+    def __enter__(self) -> "SpooledMessage":
+        return self
+
+    def __exit__(self, *exc_info) -> None:
+        self.close()
+
+
+def _attachment_headers(filename: str) -> bytes:
+    part = MIMEBase("application", "octet-stream")
+    part["Content-Transfer-Encoding"] = "base64"
+    # 确保文件名编码正确，支持中文文件名
+    encoded_filename = urllib.parse.quote(filename, safe='')
+    part.add_header(
+        "Content-Disposition",
+        f"attachment; filename*=utf-8''{encoded_filename}",
+    )
+    return part.as_bytes(policy=_POLICY)
+
+
+def write_message(message: Message, attachments: Sequence[FileDB] = ()) -> SpooledMessage:
+    """
+    写出 message（compose_email 构造的 multipart 邮件）并在末尾逐块加入 attachments 中的文件
+    阻塞读取文件，供线程池和同步代码调用；读取失败时抛出 OSError
+    """
+    spooled = SpooledMessage()
+    try:
+        if not attachments:
+            data = message.as_bytes(policy=_POLICY)
+            spooled.write(_LEADING_DOT.sub(b"..", data if data.endswith(b"\r\n") else data + b"\r\n"))
+            return spooled
+        boundary = f"==============={uuid.uuid4().hex}=="
+        message.set_boundary(boundary)
+        data = message.as_bytes(policy=_POLICY)
+        # 去掉结束分隔符，附件写在其后
+        closing = f"--{boundary}--".encode()
+        spooled.write(_LEADING_DOT.sub(b"..", data[:data.rindex(closing)]))
+        for file in attachments:
+            spooled.write(f"--{boundary}\r\n".encode() + _attachment_headers(file.name))
+            # Base64 编码的行不会以点开头，只需把换行改为 CRLF
+            for chunk in attachment_cache.stream(file.md5, file.get_path()):
+                spooled.write(chunk.replace(b"\n", b"\r\n"))
+            spooled.write(b"\r\n")
+        spooled.write(closing + b"\r\n")
+        return spooled
+    except BaseException:
+        spooled.close()
+        raise
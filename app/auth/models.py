@@ -1,11 +1,13 @@
-from sqlmodel import Field, SQLModel, Relationship, Text
-from pydantic import BaseModel
+from sqlmodel import Field, SQLModel, Relationship, Text, Index
+from pydantic import BaseModel, ConfigDict
 from datetime import datetime, timedelta, timezone
 import jwt
 import uuid
 from typing import TYPE_CHECKING, List, Optional
 
 from .settings import SECRET_KEY, ALGORITHM
+from ..models import partial_model
+from ..search import searchable
 if TYPE_CHECKING:
     from ..file.models import FileDB
 
@@ -67,6 +69,10 @@ class User(UserBase, table=True):
         back_populates="user",
         cascade_delete=True
     )
+    refresh_tokens: List["RefreshTokenDB"] = Relationship(
+        back_populates="user",
+        cascade_delete=True
+    )
     
     files: List["FileDB"] = Relationship(
         back_populates="uploader",
@@ -105,6 +111,17 @@ class UserPublic(BaseModel):
         )
 
 
+class Principal(BaseModel):
+    """登录态用户的精简信息，由令牌和用户记录得到，会被缓存，因此不可修改"""
+    model_config = ConfigDict(frozen=True)
+
+    id: uuid.UUID
+    username: str
+    is_active: bool
+    is_superuser: bool
+    scopes: tuple[str, ...] = ()
+
+
 class UserUpdate(SQLModel):
     """Model for updating user information."""
     username: str | None = None
@@ -123,10 +140,23 @@ class EmailSendHistoryUpdate(SQLModel):
     attachments: str | None = None
 
 
+class MailMergeRequest(SQLModel):
+    """Request body for sending emails rendered separately for each receiver."""
+    subject: str = Field(min_length=1, description="Jinja template of the email subject")
+    content: str = Field(min_length=1, description="Jinja template of the email content (HTML)")
+    receiver: list[uuid.UUID] | None = Field(
+        default=None,
+        description="IDs of the receivers; when omitted, all receivers matching the filters"
+    )
+    query: str | None = Field(default=None, description="Full-text search filter on receivers")
+    is_active: bool | None = Field(default=None, description="Filter receivers by active status")
+
+
 class Token(BaseModel):
     """Token model for user authentication."""
     access_token: str
     token_type: str = "bearer"
+    refresh_token: str | None = None
 
     @staticmethod
     def create_token(data: dict, expires_delta: timedelta | None = None):
@@ -155,6 +185,10 @@ def random_code_generator(length: int = 30) -> str:
 
 class ChallengeCodeDB(SQLModel, table=True):
     """Model for storing challenge codes."""
+    __table_args__ = (
+        Index("ix_challengecodedb_call_from_code", "call_from", "code"),
+        Index("ix_challengecodedb_user_id_call_from", "user_id", "call_from"),
+    )
     id: uuid.UUID = Field(default_factory=uuid.uuid4, primary_key=True)
     code: str = Field(default_factory=random_code_generator, index=True, unique=True, nullable=False, description="Challenge code")
     call_from: str | None = Field(
@@ -167,8 +201,25 @@ class ChallengeCodeDB(SQLModel, table=True):
     user: User = Relationship(back_populates="challenge_codes")  # Assuming User has a relationship defined
 
 
+class RefreshTokenDB(SQLModel, table=True):
+    """Model for storing refresh tokens (only the SHA-256 hash of the token is stored)."""
+    id: uuid.UUID = Field(default_factory=uuid.uuid4, primary_key=True)
+    token_hash: str = Field(index=True, unique=True, nullable=False, description="SHA-256 hex digest of the refresh token")
+    family_id: uuid.UUID = Field(index=True, nullable=False, description="ID shared by all tokens rotated from the same login")
+    user_id: uuid.UUID = Field(foreign_key="user.id", ondelete="CASCADE", index=True, nullable=False, description="ID of the user the token belongs to")
+    scopes: str = Field(default="", nullable=False, description="Granted scopes, space-separated")
+    created_at: datetime = Field(default_factory=datetime.now, nullable=False, description="Creation timestamp of the token")
+    expires_at: datetime = Field(nullable=False, description="Expiration timestamp of the token")
+    revoked_at: datetime | None = Field(default=None, description="Timestamp when the token was rotated or revoked")
+
+    user: User = Relationship(back_populates="refresh_tokens")
+
+
 class EmailSendHistory(SQLModel, table=True):
     """Model for storing email sending history."""
+    __table_args__ = (
+        Index("ix_emailsendhistory_sender_id_sent_at_id", "sender_id", "sent_at", "id"),
+    )
     id: uuid.UUID = Field(default_factory=uuid.uuid4, primary_key=True)
     receiver_type: str = Field(
         description="Email user search type"
@@ -200,3 +251,9 @@ class EmailSendHistory(SQLModel, table=True):
         default=None,
         description="Reason for failure if the email sending failed"
     )
+
+
+EmailSendHistoryPartial = partial_model(EmailSendHistory)
+
+searchable(User, "username")
+searchable(EmailSendHistory, "subject", "content", "receiver_emails", "receiver_names")
@@ -3,6 +3,35 @@ SECRET_KEY = os.getenv("SECRET_KEY", "default_secret_key")
 
 ALGORITHM = "HS256"
 ACCESS_TOKEN_EXPIRE_MINUTES = 60
+# 刷新令牌的有效期（天），每次刷新都会轮换为新的刷新令牌
+REFRESH_TOKEN_EXPIRE_DAYS = int(os.getenv("REFRESH_TOKEN_EXPIRE_DAYS", 30))
+
+# 激活码、密码重置码的有效期（秒），保存在 Redis 中时即为键的过期时间
+CHALLENGE_CODE_TTL = {
+    "register": int(os.getenv("ACTIVATION_CODE_TTL", 5 * 60)),
+    "reset_password": int(os.getenv("RESET_PASSWORD_CODE_TTL", 24 * 60 * 60)),
+}
+
+# bcrypt 计算成本（log2 轮数），修改后旧密码会在用户下次登录时按新成本重新哈希
+BCRYPT_ROUNDS = int(os.getenv("BCRYPT_ROUNDS", 12))
+# 执行密码哈希的线程数，同时进行的哈希计算不超过该数量（bcrypt 计算时释放 GIL，可多核并行）
+PASSWORD_HASH_WORKERS = int(os.getenv("PASSWORD_HASH_WORKERS", os.cpu_count() or 2))
+# 等待哈希线程的请求数上限和最长等待时间（秒），超出时返回 429
+PASSWORD_HASH_QUEUE_SIZE = int(os.getenv("PASSWORD_HASH_QUEUE_SIZE", 32))
+PASSWORD_HASH_QUEUE_TIMEOUT = float(os.getenv("PASSWORD_HASH_QUEUE_TIMEOUT", 5))
+
+# 登录、注册请求的频率限制（令牌桶）：允许的突发次数与每分钟恢复的次数，分别按用户名和客户端地址计算
+AUTH_USERNAME_BURST = int(os.getenv("AUTH_USERNAME_BURST", 5))
+AUTH_USERNAME_PER_MINUTE = float(os.getenv("AUTH_USERNAME_PER_MINUTE", 10))
+AUTH_IP_BURST = int(os.getenv("AUTH_IP_BURST", 20))
+AUTH_IP_PER_MINUTE = float(os.getenv("AUTH_IP_PER_MINUTE", 60))
+
+# 已校验令牌的缓存时间（秒，不超过令牌自身的有效期）、登录态用户信息的缓存时间（秒）及各自的条目上限
+# 未配置 REDIS_URL 时用户信息的失效只作用于修改它的进程：其他工作进程和 dev.py 等命令行脚本的修改（如停用用户）
+# 最长 PRINCIPAL_CACHE_TTL 秒后才生效；为此管理员的信息在未配置 Redis 时不缓存，撤销管理员权限立即生效
+TOKEN_CACHE_TTL = int(os.getenv("TOKEN_CACHE_TTL", 300))
+PRINCIPAL_CACHE_TTL = int(os.getenv("PRINCIPAL_CACHE_TTL", 60))
+AUTH_CACHE_SIZE = int(os.getenv("AUTH_CACHE_SIZE", 4096))
 
 OAUTH2_SCOPE = {
     "auth:read_basic": "允许获取账户的基本信息（不含敏感信息）",
@@ -21,4 +50,46 @@ OAUTH2_SCOPE = {
 EMAIL_SENDER_ACCOUNT = os.getenv("EMAIL_SENDER_ACCOUNT", "default_email_sender_account")
 EMAIL_SENDER_PASSWORD = os.getenv("EMAIL_SENDER_PASSWORD", "default_email_sender_password")
 EMAIL_SENDER_SMTP = os.getenv("EMAIL_SENDER_SMTP", "default_smtp_server")
-EMAIL_SENDER_PORT = int(os.getenv("EMAIL_SENDER_PORT", 465))
\ No newline at end of file
+EMAIL_SENDER_PORT = int(os.getenv("EMAIL_SENDER_PORT", 465))
+# 是否以 SSL 直连（一般为 465 端口）；为 false 时使用普通连接，服务端支持时以 STARTTLS 升级
+EMAIL_SENDER_SSL = os.getenv("EMAIL_SENDER_SSL", "true").lower() in ("1", "true", "yes")
+
+# SMTP 连接池：每个进程保持的已登录连接数上限（即同时发送的邮件数上限）、网络操作超时（秒）
+SMTP_POOL_SIZE = int(os.getenv("SMTP_POOL_SIZE", 4))
+SMTP_TIMEOUT = float(os.getenv("SMTP_TIMEOUT", 30))
+# 空闲超过该时间（秒）的连接在使用前以 NOOP 检查，空闲超过 SMTP_POOL_IDLE_TIMEOUT 的连接直接重建（服务端通常会断开长时间空闲的连接）
+SMTP_POOL_CHECK_INTERVAL = float(os.getenv("SMTP_POOL_CHECK_INTERVAL", 30))
+SMTP_POOL_IDLE_TIMEOUT = float(os.getenv("SMTP_POOL_IDLE_TIMEOUT", 300))
+# 每个连接发送的邮件数上限，达到后关闭重建
+SMTP_POOL_MAX_MESSAGES = int(os.getenv("SMTP_POOL_MAX_MESSAGES", 100))
+
+# 是否通过 Celery 投递邮件（默认配置了 REDIS_BROKER_URL 时启用）；未启用或消息队列不可用时在当前进程的后台任务中发送
+EMAIL_USE_CELERY = os.getenv("EMAIL_USE_CELERY", "true" if os.getenv("REDIS_BROKER_URL") else "false").lower() in ("1", "true", "yes")
+# 邮件队列：激活、重置密码等系统邮件走优先队列，用户发送的邮件走批量队列，两者由不同的 worker 消费互不影响
+EMAIL_PRIORITY_QUEUE = os.getenv("EMAIL_PRIORITY_QUEUE", "email_priority")
+EMAIL_BULK_QUEUE = os.getenv("EMAIL_BULK_QUEUE", "email_bulk")
+# 批量队列每个 worker 的发送频率上限（Celery rate_limit 格式，如 60/m）
+EMAIL_BULK_RATE_LIMIT = os.getenv("EMAIL_BULK_RATE_LIMIT", "60/m")
+# 一封邮件的收件人按该数量分组投递（同一连接上依次发送），避免超过服务商单封邮件的收件人上限
+EMAIL_MAX_RECIPIENTS_PER_MESSAGE = int(os.getenv("EMAIL_MAX_RECIPIENTS_PER_MESSAGE", 50))
+# 临时性失败（4xx、连接断开等）的重试次数，重试间隔从 EMAIL_RETRY_BACKOFF 秒起指数增长，不超过 EMAIL_RETRY_BACKOFF_MAX 秒
+EMAIL_MAX_RETRIES = int(os.getenv("EMAIL_MAX_RETRIES", 5))
+EMAIL_RETRY_BACKOFF = float(os.getenv("EMAIL_RETRY_BACKOFF", 30))
+EMAIL_RETRY_BACKOFF_MAX = float(os.getenv("EMAIL_RETRY_BACKOFF_MAX", 3600))
+
+# 邮件合并（逐个收件人渲染模板的批量发送）：每批渲染、写入发送记录和投递的邮件数，单次请求的收件人上限
+EMAIL_MERGE_BATCH_SIZE = int(os.getenv("EMAIL_MERGE_BATCH_SIZE", 100))
+EMAIL_MERGE_MAX_RECIPIENTS = int(os.getenv("EMAIL_MERGE_MAX_RECIPIENTS", 10000))
+# 邮件合并任务每个 worker 的频率上限（每个任务投递一批邮件）
+EMAIL_MERGE_RATE_LIMIT = os.getenv("EMAIL_MERGE_RATE_LIMIT", "10/m")
+
+# 已编码附件缓存（按文件 MD5 保存 Base64 编码结果）：磁盘目录、内存中的容量上限（MB）与磁盘上的容量上限（MB）
+EMAIL_ATTACHMENT_CACHE_PATH = os.getenv("EMAIL_ATTACHMENT_CACHE_PATH", "./media/cache/attachments")
+EMAIL_ATTACHMENT_CACHE_MEMORY_MB = float(os.getenv("EMAIL_ATTACHMENT_CACHE_MEMORY_MB", 64))
+EMAIL_ATTACHMENT_CACHE_DISK_MB = float(os.getenv("EMAIL_ATTACHMENT_CACHE_DISK_MB", 1024))
+
+# 写出邮件时，不超过该大小（MB）的邮件保留在内存中，更大的邮件写入临时文件后逐块发送
+EMAIL_SPOOL_MAX_MEMORY_MB = float(os.getenv("EMAIL_SPOOL_MAX_MEMORY_MB", 1))
+
+# 超过该大小（MB）的已存储附件改为在邮件正文中发送签名下载链接（有效期见 FILE_SIGNED_URL_EXPIRE_HOURS），发送请求可单独指定
+EMAIL_ATTACHMENT_LINK_THRESHOLD_MB = float(os.getenv("EMAIL_ATTACHMENT_LINK_THRESHOLD_MB", 10))
@@ -0,0 +1,288 @@
+"""
+SMTP 连接池
+保持已登录的 SMTP 连接供后续邮件复用，省去每封邮件的 TLS 握手和 AUTH：
+- 取出空闲超过 check_interval 的连接时先发送 NOOP 检查，检查失败或空闲超过 idle_timeout 的连接关闭后重新建立
+- 复用的连接在发送时发现已被服务端断开，重新连接后重试一次
+- 每个连接发送 max_messages 封邮件后关闭重建（部分服务商限制单个会话的发信数）
+smtplib 是阻塞的，发送在连接池专用的线程池中执行，不阻塞事件循环；线程数即连接数上限，
+同时发送的邮件不超过 size 封，其余在线程池队列中等待，所有网络操作受 timeout 限制
+"""
+import asyncio
+import smtplib
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from email.message import Message
+from typing import Any, Optional, Sequence
+
+from .mime import SpooledMessage
+from .settings import (
+    EMAIL_SENDER_ACCOUNT, EMAIL_SENDER_PASSWORD, EMAIL_SENDER_SMTP, EMAIL_SENDER_PORT, EMAIL_SENDER_SSL,
+    SMTP_POOL_SIZE, SMTP_TIMEOUT, SMTP_POOL_CHECK_INTERVAL, SMTP_POOL_IDLE_TIMEOUT, SMTP_POOL_MAX_MESSAGES,
+)
+
+
+def is_transient(error: OSError) -> bool:
+    """判断发送错误是否为临时性的（4xx 应答、连接断开、网络错误），临时性错误可以重试"""
+    if isinstance(error, smtplib.SMTPRecipientsRefused):
+        return all(400 <= code < 500 for code, _ in error.recipients.values())
+    if isinstance(error, smtplib.SMTPResponseException):
+        return 400 <= error.smtp_code < 500
+    if isinstance(error, smtplib.SMTPServerDisconnected):
+        return True
+    return not isinstance(error, smtplib.SMTPException)
+
+
+class _Connection:
+    """池中的一个已登录连接"""
+
+    def __init__(self, server: smtplib.SMTP):
+        self.server = server
+        self.messages = 0
+        self.reused = False
+        self.last_used = time.monotonic()
+
+
+class SMTPPool:
+    """已登录 SMTP 连接的连接池"""
+
+    def __init__(
+        self,
+        host: str,
+        port: int,
+        username: Optional[str] = None,
+        password: Optional[str] = None,
+        *,
+        use_ssl: bool = True,
+        size: int = 4,
+        timeout: float = 30.0,
+        check_interval: float = 30.0,
+        idle_timeout: float = 300.0,
+        max_messages: int = 100,
+    ):
+        self.host = host
+        self.port = port
+        self.username = username
+        self.password = password
+        self.use_ssl = use_ssl
+        self.size = size
+        self.timeout = timeout
+        self.check_interval = check_interval
+        self.idle_timeout = idle_timeout
+        self.max_messages = max_messages
+        self.connects = 0
+        self.reconnects = 0
+        self.health_checks = 0
+        self.sent = 0
+        self.failed = 0
+        self.in_use = 0
+        self._idle: list[_Connection] = []
+        self._lock = threading.Lock()
+        self._executor = ThreadPoolExecutor(max_workers=size, thread_name_prefix="smtp")
+
+    def _connect(self) -> _Connection:
+        if self.use_ssl:
+            server = smtplib.SMTP_SSL(self.host, self.port, timeout=self.timeout)
+        else:
+            server = smtplib.SMTP(self.host, self.port, timeout=self.timeout)
+        try:
+            server.ehlo()
+            if not self.use_ssl and server.has_extn("starttls"):
+                server.starttls()
+                server.ehlo()
+            if self.username:
+                server.login(self.username, self.password or "")
+        except BaseException:
+            server.close()
+            raise
+        with self._lock:
+            self.connects += 1
+        return _Connection(server)
+
+    def _discard(self, conn: _Connection, quit: bool = False) -> None:
+        """关闭连接，quit 为 True 时先向服务端发送 QUIT"""
+        if quit:
+            try:
+                conn.server.quit()
+                return
+            except (smtplib.SMTPException, OSError):
+                pass
+        conn.server.close()
+
+    def _acquire(self) -> _Connection:
+        while True:
+            with self._lock:
+                conn = self._idle.pop() if self._idle else None
+            if conn is None:
+                return self._connect()
+            idle = time.monotonic() - conn.last_used
+            if idle > self.idle_timeout:
+                self._discard(conn)
+                continue
+            if idle > self.check_interval:
+                with self._lock:
+                    self.health_checks += 1
+                try:
+                    code, _ = conn.server.noop()
+                except (smtplib.SMTPException, OSError):
+                    code = None
+                if code != 250:
+                    self._discard(conn)
+                    continue
+            conn.reused = True
+            return conn
+
+    def _release(self, conn: _Connection) -> None:
+        if conn.server.sock is None:
+            # smtplib 在连接断开或服务端返回 421 时已关闭连接
+            return
+        if conn.messages >= self.max_messages:
+            self._discard(conn, quit=True)
+            return
+        conn.last_used = time.monotonic()
+        with self._lock:
+            self._idle.append(conn)
+
+    @staticmethod
+    def _send_spooled(server: smtplib.SMTP, from_addr: str, to_addrs: list[str], msg: SpooledMessage) -> dict:
+        """与 smtplib.SMTP.sendmail 相同，但邮件内容从 msg 逐块写入连接，不在内存中拼接整封邮件"""
+        server.ehlo_or_helo_if_needed()
+        options = [f"SIZE={msg.size}"] if server.does_esmtp and server.has_extn("size") else []
+        code, resp = server.mail(from_addr, options)
+        if code != 250:
+            if code == 421:
+                server.close()
+            else:
+                server._rset()
+            raise smtplib.SMTPSenderRefused(code, resp, from_addr)
+        refused = {}
+        for address in to_addrs:
+            code, resp = server.rcpt(address)
+            if code not in (250, 251):
+                refused[address] = (code, resp)
+            if code == 421:
+                server.close()
+                raise smtplib.SMTPRecipientsRefused(refused)
+        if len(refused) == len(to_addrs):
+            server._rset()
+            raise smtplib.SMTPRecipientsRefused(refused)
+        server.putcmd("data")
+        code, resp = server.getreply()
+        if code != 354:
+            raise smtplib.SMTPDataError(code, resp)
+        for chunk in msg.chunks():
+            server.send(chunk)
+        server.send(b".\r\n")
+        code, resp = server.getreply()
+        if code != 250:
+            if code == 421:
+                server.close()
+            else:
+                server._rset()
+            raise smtplib.SMTPDataError(code, resp)
+        return refused
+
+    def _sendmail(self, conn: _Connection, from_addr: str, to_addrs: list[str], msg: str | SpooledMessage) -> None:
+        try:
+            if isinstance(msg, SpooledMessage):
+                refused = self._send_spooled(conn.server, from_addr, to_addrs, msg)
+            else:
+                refused = conn.server.sendmail(from_addr, to_addrs, msg)
+        except OSError as e:
+            # 收件人被拒等错误不影响连接（smtplib 已发送 RSET）；连接断开、超时等网络错误时关闭连接
+            # （SMTPException 也是 OSError 的子类）
+            if isinstance(e, smtplib.SMTPServerDisconnected) or not isinstance(e, smtplib.SMTPException):
+                conn.server.close()
+            raise
+        conn.messages += 1
+        conn.reused = False
+        if refused:
+            # 部分收件人被拒时邮件已发送给其余收件人，以只含被拒收件人的错误报告
+            raise smtplib.SMTPRecipientsRefused(refused)
+
+    def send_batch(
+        self, messages: Sequence[tuple[str, list[str], Message | str | SpooledMessage]]
+    ) -> list[Optional[OSError]]:
+        """
+        在同一个连接上依次发送多封邮件（连接达到 max_messages 或断开时中途更换），返回每封邮件的错误，发送成功的为 None
+        无法建立连接时其余邮件不再尝试，均记为同一错误（供线程池和同步代码调用）
+        """
+        errors: list[Optional[OSError]] = []
+        conn: Optional[_Connection] = None
+        with self._lock:
+            self.in_use += 1
+        try:
+            for from_addr, to_addrs, message in messages:
+                msg = message.as_string() if isinstance(message, Message) else message
+                try:
+                    if conn is None:
+                        conn = self._acquire()
+                    try:
+                        self._sendmail(conn, from_addr, to_addrs, msg)
+                    except smtplib.SMTPServerDisconnected:
+                        # 刚取出的空闲连接通常是在检查间隔内被服务端关闭了，重连后重试一次
+                        if not conn.reused:
+                            raise
+                        with self._lock:
+                            self.reconnects += 1
+                        conn = None
+                        conn = self._connect()
+                        self._sendmail(conn, from_addr, to_addrs, msg)
+                except OSError as e:
+                    errors.append(e)
+                    if conn is None:
+                        errors.extend([e] * (len(messages) - len(errors)))
+                else:
+                    errors.append(None)
+                if conn is not None and (conn.server.sock is None or conn.messages >= self.max_messages):
+                    self._release(conn)
+                    conn = None
+                if len(errors) == len(messages):
+                    break
+        finally:
+            if conn is not None:
+                self._release(conn)
+            with self._lock:
+                self.in_use -= 1
+                self.sent += errors.count(None)
+                self.failed += len(messages) - errors.count(None)
+        return errors
+
+    def send_message(self, from_addr: str, to_addrs: list[str], message: Message | str | SpooledMessage) -> None:
+        """阻塞发送一封邮件，失败时抛出 smtplib.SMTPException 或 OSError（供线程池和同步代码调用）"""
+        error = self.send_batch([(from_addr, to_addrs, message)])[0]
+        if error is not None:
+            raise error
+
+    async def send(self, from_addr: str, to_addrs: list[str], message: Message | str | SpooledMessage) -> None:
+        """在连接池线程中发送一封邮件，不阻塞事件循环"""
+        await asyncio.get_running_loop().run_in_executor(
+            self._executor, self.send_message, from_addr, to_addrs, message
+        )
+
+    def close(self) -> None:
+        """关闭全部空闲连接"""
+        with self._lock:
+            idle, self._idle = self._idle, []
+        for conn in idle:
+            self._discard(conn, quit=True)
+
+    def stats(self) -> dict[str, Any]:
+        with self._lock:
+            return {
+                "size": self.size,
+                "idle": len(self._idle),
+                "in_use": self.in_use,
+                "connects": self.connects,
+                "reconnects": self.reconnects,
+                "health_checks": self.health_checks,
+                "sent": self.sent,
+                "failed": self.failed,
+            }
+
+
+smtp_pool = SMTPPool(
+    EMAIL_SENDER_SMTP, EMAIL_SENDER_PORT, EMAIL_SENDER_ACCOUNT, EMAIL_SENDER_PASSWORD,
+    use_ssl=EMAIL_SENDER_SSL, size=SMTP_POOL_SIZE, timeout=SMTP_TIMEOUT, check_interval=SMTP_POOL_CHECK_INTERVAL,
+    idle_timeout=SMTP_POOL_IDLE_TIMEOUT, max_messages=SMTP_POOL_MAX_MESSAGES,
+)
@@ -1,27 +1,72 @@
 from uuid import UUID
 import uuid
-from fastapi import UploadFile
-from fastapi import Depends, HTTPException, status
+from fastapi import BackgroundTasks, UploadFile
+from fastapi import Depends, HTTPException, Request, status
 from fastapi.security import OAuth2PasswordBearer, SecurityScopes
 import jwt
 from jwt import InvalidTokenError
-from sqlmodel import select
-import urllib.parse
+from sqlmodel import select, update
+from sqlmodel.ext.asyncio.session import AsyncSession
 import pathlib
 
 import smtplib
 from email.mime.text import MIMEText
-from email.mime.base import MIMEBase
 from email.mime.multipart import MIMEMultipart
 from email.header import Header
 from email.utils import formataddr, formatdate
-from email import encoders
 import encodings.idna
+import asyncio
+import hashlib
+import html
+import secrets
+import time
+from datetime import datetime, timedelta
+from concurrent.futures import ThreadPoolExecutor
+from kombu.exceptions import OperationalError
+from passlib.context import CryptContext
 
-from .settings import EMAIL_SENDER_ACCOUNT, EMAIL_SENDER_PASSWORD, EMAIL_SENDER_SMTP, EMAIL_SENDER_PORT, OAUTH2_SCOPE, SECRET_KEY, ALGORITHM
-from .models import EmailSendHistory, TokenData, User
+from .settings import (
+    EMAIL_SENDER_ACCOUNT, EMAIL_USE_CELERY, EMAIL_ATTACHMENT_LINK_THRESHOLD_MB, OAUTH2_SCOPE, SECRET_KEY, ALGORITHM,
+    REFRESH_TOKEN_EXPIRE_DAYS, TOKEN_CACHE_TTL, PRINCIPAL_CACHE_TTL, AUTH_CACHE_SIZE, BCRYPT_ROUNDS, PASSWORD_HASH_WORKERS,
+    PASSWORD_HASH_QUEUE_SIZE, PASSWORD_HASH_QUEUE_TIMEOUT,
+    AUTH_USERNAME_BURST, AUTH_USERNAME_PER_MINUTE, AUTH_IP_BURST, AUTH_IP_PER_MINUTE,
+)
+from .models import EmailSendHistory, Principal, RefreshTokenDB, TokenData, User
+from .mime import write_message
+from .smtp import smtp_pool
+from ..admission import AdmissionLimiter, TokenBucketLimiter, too_many_requests
+from ..cache import SharedInvalidation, TTLCache
 from ..file.models import FileDB
-from ..db_manager import Session, engine, SessionDep
+from ..file.settings import FILE_SIGNED_URL_EXPIRE_HOURS
+from ..file.utils import signed_download_url
+from ..db_manager import create_async_session, AsyncSessionDep
+
+def compose_email(
+    receiver_emails: list[str],
+    receiver_name: list[str],
+    sender_name: str,
+    subject: str,
+    content: str,
+) -> MIMEMultipart:
+    """构造 HTML 邮件（不含附件，附件由 write_message 在写出邮件时逐块加入）"""
+    message = MIMEMultipart()
+    message.attach(MIMEText(content, "html", "utf-8"))
+
+    # 使用formataddr确保From字段格式正确
+    message["From"] = formataddr((sender_name, EMAIL_SENDER_ACCOUNT))
+    # 为To字段也使用正确的格式
+    to_addresses = [formataddr((name, email)) for name, email in zip(receiver_name, receiver_emails)]
+    message["To"] = ", ".join(to_addresses)
+    message["Subject"] = Header(subject, "utf-8").encode()
+    
+    # 添加邮件头以提高送达率和专业性
+    message["Reply-To"] = EMAIL_SENDER_ACCOUNT
+    message["Return-Path"] = EMAIL_SENDER_ACCOUNT
+    message["Message-ID"] = f"<{uuid.uuid4()}@{EMAIL_SENDER_ACCOUNT.split('@')[1]}>"
+    message["Date"] = formatdate(localtime=True)
+    message["MIME-Version"] = "1.0"
+    return message
+
 
 async def send_email(
     history_id: UUID | None,
@@ -33,8 +78,8 @@ async def send_email(
     attachment_ids: list[UUID] | None = None,
     store_upload_files: bool = False
 ):
-    with Session(engine) as session:
-        history_record = session.get(EmailSendHistory, history_id) if history_id else None
+    async with create_async_session() as session:
+        history_record = await session.get(EmailSendHistory, history_id) if history_id else None
         if history_id and not history_record:
             raise HTTPException(
                 status_code=status.HTTP_404_NOT_FOUND,
@@ -45,108 +90,183 @@ async def send_email(
                 history_record.status = "failed"
                 history_record.reason = "收件人和收件人名称数量不匹配"
                 session.add(history_record)
-                session.commit()
-                session.refresh(history_record)
+                await session.commit()
+                await session.refresh(history_record)
                 return
-        message = MIMEMultipart()
-        message.attach(MIMEText(content, "html", "utf-8"))
+        files: list[FileDB] = []
         if attachment_ids:
             for file_id in attachment_ids:
-                try:
-                    # 从数据库获取文件对象
-                    file = session.get(FileDB, file_id)
-                    if not file:
-                        if history_record:
-                            history_record.status = "failed"
-                            history_record.reason = f"附件文件不存在: {file_id}"
-                            session.add(history_record)
-                            session.commit()
-                            session.refresh(history_record)
-                            return
-                        continue
-                    
-                    part = MIMEBase("application", "octet-stream")
-                    file_content = await file.read()
-                    part.set_payload(file_content)
-                    # 对附件进行Base64编码
-                    encoders.encode_base64(part)
-                    # 确保文件名编码正确，支持中文文件名
-                    encoded_filename = urllib.parse.quote(file.name, safe='')
-                    part.add_header(
-                        "Content-Disposition",
-                        f"attachment; filename*=utf-8''{encoded_filename}",
-                    )
-                    message.attach(part)
-                    # 如果不需要存储文件，则在发送后删除临时文件
-                    if not store_upload_files:
-                        try:
-                            file_path = file.get_path()
-                            if file_path.exists():
-                                file_path.unlink()
-                        except Exception:
-                            pass  # 忽略删除临时文件的错误
-                except Exception as e:
-                    # 清理临时文件
-                    if not store_upload_files and attachment_ids:
-                        for cleanup_file_id in attachment_ids:
-                            try:
-                                cleanup_file = session.get(FileDB, cleanup_file_id)
-                                if cleanup_file:
-                                    file_path = cleanup_file.get_path()
-                                    if file_path.exists():
-                                        file_path.unlink()
-                            except Exception:
-                                pass
+                # 从数据库获取文件对象
+                file = await session.get(FileDB, file_id)
+                if not file:
                     if history_record:
                         history_record.status = "failed"
-                        history_record.reason = f"附件处理失败: {file_id} - {str(e)}"
+                        history_record.reason = f"附件文件不存在: {file_id}"
                         session.add(history_record)
-                        session.commit()
-                        session.refresh(history_record)
+                        await session.commit()
+                        await session.refresh(history_record)
                         return
-        
-        # 使用formataddr确保From字段格式正确
-        message["From"] = formataddr((sender_name, EMAIL_SENDER_ACCOUNT))
-        # 为To字段也使用正确的格式
-        to_addresses = [formataddr((name, email)) for name, email in zip(receiver_name, receiver_emails)]
-        message["To"] = ", ".join(to_addresses)
-        message["Subject"] = Header(subject, "utf-8").encode()
-        
-        # 添加邮件头以提高送达率和专业性
-        message["Reply-To"] = EMAIL_SENDER_ACCOUNT
-        message["Return-Path"] = EMAIL_SENDER_ACCOUNT
-        message["Message-ID"] = f"<{uuid.uuid4()}@{EMAIL_SENDER_ACCOUNT.split('@')[1]}>"
-        message["Date"] = formatdate(localtime=True)
-        message["MIME-Version"] = "1.0"
-        
+                    continue
+                files.append(file)
+
+        message = compose_email(receiver_emails, receiver_name, sender_name, subject, content)
         try:
-            with smtplib.SMTP_SSL(EMAIL_SENDER_SMTP, EMAIL_SENDER_PORT) as server:
-                server.login(EMAIL_SENDER_ACCOUNT, EMAIL_SENDER_PASSWORD)
-                server.sendmail(
-                    from_addr=EMAIL_SENDER_ACCOUNT,
-                    to_addrs=receiver_emails,
-                    msg=message.as_string()
-                )
-                if history_record:
-                    history_record.status = "success"
-                    session.add(history_record)
-                    session.commit()
-                    session.refresh(history_record)
-        except smtplib.SMTPException as e:
+            # 附件从磁盘逐块读取、编码并写入临时文件，放到线程中执行
+            spooled = await asyncio.to_thread(write_message, message, files)
+        except Exception as e:
+            if history_record:
+                history_record.status = "failed"
+                history_record.reason = f"附件处理失败: {str(e)}"
+                session.add(history_record)
+                await session.commit()
+                await session.refresh(history_record)
+            return
+        finally:
+            # 如果不需要存储文件，则在写入邮件后删除临时文件
+            if not store_upload_files:
+                for file in files:
+                    try:
+                        file.get_path().unlink(missing_ok=True)
+                    except Exception:
+                        pass  # 忽略删除临时文件的错误
+
+        try:
+            # 经连接池复用已登录的连接发送，在连接池线程中执行，不阻塞事件循环
+            await smtp_pool.send(EMAIL_SENDER_ACCOUNT, receiver_emails, spooled)
+            if history_record:
+                history_record.status = "success"
+                session.add(history_record)
+                await session.commit()
+                await session.refresh(history_record)
+        except (smtplib.SMTPException, OSError) as e:
             if history_record:
                 history_record.status = "failed"
                 history_record.reason = f"邮件发送失败: {str(e)}"
                 session.add(history_record)
-                session.commit()
-                session.refresh(history_record)
+                await session.commit()
+                await session.refresh(history_record)
                 return
+        finally:
+            spooled.close()
+
+
+async def publish_email_task(name: str, kwargs: dict) -> bool:
+    """
+    启用 Celery 时把 app.tasks.email_tasks 中的任务 name 发布到消息队列，返回是否发布成功
+    未启用或消息队列不可用时返回 False，由调用方在当前进程中发送
+    """
+    if not EMAIL_USE_CELERY:
+        return False
+    # 延迟导入，未启用 Celery 时不加载任务模块
+    from ..tasks import email_tasks
+    try:
+        # 发布消息是阻塞的网络操作，放到线程中执行；不在发布失败时重试，直接退回后台任务
+        await asyncio.to_thread(getattr(email_tasks, name).apply_async, kwargs=kwargs, retry=False)
+        return True
+    except OperationalError:
+        return False
+
+
+async def queue_email(
+    background_tasks: BackgroundTasks,
+    history_id: UUID | None,
+    receiver_emails: list[str],
+    receiver_name: list[str],
+    sender_name: str,
+    subject: str,
+    content: str,
+    attachment_ids: list[UUID] | None = None,
+    store_upload_files: bool = False,
+    priority: bool = False,
+) -> None:
+    """
+    投递邮件：启用 Celery 时发布到邮件队列，由 worker 发送并更新发送记录（priority 为 True 时进入优先队列）；
+    未启用或消息队列不可用时在当前进程的后台任务中发送（进程重启时丢失，不重试）
+    发送记录需在调用前提交，否则 worker 可能读不到
+    """
+    email = {
+        "history_id": str(history_id) if history_id else None,
+        "receiver_emails": receiver_emails,
+        "receiver_names": receiver_name,
+        "sender_name": sender_name,
+        "subject": subject,
+        "content": content,
+        "attachment_ids": [str(file_id) for file_id in attachment_ids or []],
+        "store_upload_files": store_upload_files,
+    }
+    if await publish_email_task("send_priority_email" if priority else "send_bulk_email", email):
+        return
+    background_tasks.add_task(
+        send_email, history_id, receiver_emails, receiver_name, sender_name, subject, content,
+        attachment_ids, store_upload_files
+    )
+
+
+def link_attachments(
+    request: Request,
+    attachments: list[FileDB],
+    linkable: set[UUID],
+    use_links: bool | None = None,
+) -> tuple[list[FileDB], str]:
+    """
+    把较大的附件改为签名下载链接，减少经 SMTP 发送的数据量（Base64 编码后增大约 1/3，且很多邮箱限制邮件大小）：
+    use_links 为 None 时超过 EMAIL_ATTACHMENT_LINK_THRESHOLD_MB 的附件发送链接，True / False 时全部发送链接 / 全部作为附件；
+    只有 linkable 中的（已存储到数据库的）文件可以发送链接，临时上传的文件发送后即删除，始终作为附件
+    返回仍作为附件发送的文件和附加到正文末尾的链接列表（HTML，没有链接时为空字符串）
+    """
+    threshold = EMAIL_ATTACHMENT_LINK_THRESHOLD_MB * 1024 * 1024
+    inline: list[FileDB] = []
+    links: list[str] = []
+    for file in attachments:
+        if file.id in linkable and (file.size > threshold if use_links is None else use_links):
+            url = html.escape(signed_download_url(request, file.id))
+            size = f"{file.size / 1024 / 1024:.1f} MB" if file.size >= 1024 * 1024 else f"{file.size / 1024:.1f} KB"
+            links.append(f'<li><a href="{url}">{html.escape(file.name)}</a>（{size}）</li>')
+        else:
+            inline.append(file)
+    if not links:
+        return inline, ""
+    return inline, f"<hr><p>以下附件请在 {FILE_SIGNED_URL_EXPIRE_HOURS:g} 小时内通过链接下载：</p><ul>{''.join(links)}</ul>"
 
 
 oauth2_scheme = OAuth2PasswordBearer(tokenUrl="/auth/login", scopes=OAUTH2_SCOPE, auto_error=False)
 
 
-async def get_request_user(session: SessionDep, security_scopes: SecurityScopes, token: str = Depends(oauth2_scheme)) -> User | None:
-    """ 获取当前登陆态用户 """
+# 已校验令牌的载荷（键为令牌）与登录态用户的精简信息（键为用户 id）
+token_cache = TTLCache(maxsize=AUTH_CACHE_SIZE, ttl=TOKEN_CACHE_TTL)
+principal_cache = TTLCache(maxsize=AUTH_CACHE_SIZE, ttl=PRINCIPAL_CACHE_TTL)
+principal_invalidation = SharedInvalidation("principal", principal_cache)
+
+
+async def invalidate_principals(*user_ids: UUID) -> None:
+    """用户被修改、删除、激活或变更权限后调用，使缓存的登录态用户信息失效"""
+    await principal_invalidation.invalidate_async(*user_ids)
+
+
+def decode_token(token: str) -> TokenData:
+    """校验并解析令牌，结果缓存至令牌过期（最长 TOKEN_CACHE_TTL 秒）"""
+    token_data = token_cache.get(token)
+    if token_data is not None:
+        return token_data
+    payload = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
+    user_id = payload.get("sub")
+    if user_id is None:
+        raise InvalidTokenError("令牌缺少 sub")
+    try:
+        user_uuid = UUID(user_id)
+    except ValueError:
+        raise InvalidTokenError("令牌 sub 不是有效的 UUID")
+    token_data = TokenData(scopes=payload.get("scopes", []), user_id=user_uuid)
+    ttl = TOKEN_CACHE_TTL
+    if "exp" in payload:
+        ttl = min(ttl, payload["exp"] - time.time())
+    if ttl > 0:
+        token_cache.set(token, token_data, ttl=ttl)
+    return token_data
+
+
+async def get_request_user(session: AsyncSessionDep, security_scopes: SecurityScopes, token: str = Depends(oauth2_scheme)) -> Principal | None:
+    """ 获取当前登陆态用户，令牌和用户信息命中缓存时不查询数据库 """
     if security_scopes.scopes:
         authenticate_value = f'Bearer scope="{security_scopes.scope_str}"'
     else:
@@ -159,26 +279,23 @@ async def get_request_user(session: SessionDep, security_scopes: SecurityScopes,
         headers={"WWW-Authenticate": authenticate_value},
     )
     try:
-        payload = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
-        user_id = payload.get("sub")
-        if user_id is None:
-            raise credentials_exception
-        token_scopes = payload.get("scopes", [])
-        try:
-            user_uuid = UUID(user_id)
-        except ValueError:
-            # 如果UUID转换失败，抛出认证异常
-            raise credentials_exception
-        token_data = TokenData(scopes=token_scopes, user_id=user_uuid)
+        token_data = decode_token(token)
     except InvalidTokenError:
         raise credentials_exception
-    user = session.get(User, token_data.user_id)
-    if user is None:
-        raise HTTPException(
-            status_code=status.HTTP_401_UNAUTHORIZED,
-            detail="用户不存在或已注销",
-            headers={"WWW-Authenticate": authenticate_value},
-        )
+    await principal_invalidation.sync()
+    principal = principal_cache.get(token_data.user_id)
+    if principal is None:
+        user = await session.get(User, token_data.user_id)
+        if user is None:
+            raise HTTPException(
+                status_code=status.HTTP_401_UNAUTHORIZED,
+                detail="用户不存在或已注销",
+                headers={"WWW-Authenticate": authenticate_value},
+            )
+        principal = Principal(id=user.id, username=user.username, is_active=user.is_active, is_superuser=user.is_superuser)
+        # 未配置 Redis 时其他进程（如 dev.py 撤销管理员权限）的失效通知无法送达，管理员不缓存，每次从数据库读取
+        if not principal.is_superuser or principal_invalidation.shared:
+            principal_cache.set(user.id, principal)
     missing_scopes = set(security_scopes.scopes) - set(token_data.scopes)
     if len(missing_scopes) != 0:
         raise HTTPException(
@@ -186,10 +303,10 @@ async def get_request_user(session: SessionDep, security_scopes: SecurityScopes,
             detail=f"权限不足，此操作需要token额外具有下面权限: {', '.join(missing_scopes)}",
             headers={"WWW-Authenticate": authenticate_value},
         )
-    return user
+    return principal.model_copy(update={"scopes": tuple(token_data.scopes)})
 
 
-async def get_request_active_user(session: SessionDep, security_scopes: SecurityScopes, token: str = Depends(oauth2_scheme)) -> User:
+async def get_request_active_user(session: AsyncSessionDep, security_scopes: SecurityScopes, token: str = Depends(oauth2_scheme)) -> Principal:
     """ 获取当前登陆态的活跃用户 """
     user = await get_request_user(session, security_scopes, token)
     if user is None:
@@ -205,19 +322,113 @@ async def get_request_active_user(session: SessionDep, security_scopes: Security
     return user
 
 
+# 轮数上下限均为 BCRYPT_ROUNDS，成本不同的已有哈希在校验时会被标记为需要更新
+pwd_context = CryptContext(
+    schemes=["bcrypt"],
+    deprecated="auto",
+    bcrypt__default_rounds=BCRYPT_ROUNDS,
+    bcrypt__min_rounds=BCRYPT_ROUNDS,
+    bcrypt__max_rounds=BCRYPT_ROUNDS,
+)
+# bcrypt 计算耗时较长，在独立的线程池中执行，避免阻塞事件循环
+password_executor = ThreadPoolExecutor(max_workers=PASSWORD_HASH_WORKERS, thread_name_prefix="password-hash")
+# 进入线程池前先取得名额，使排队的哈希请求有上限，突发请求不会无限堆积而拖慢同一进程的其他接口
+password_limiter = AdmissionLimiter(PASSWORD_HASH_WORKERS, PASSWORD_HASH_QUEUE_SIZE, PASSWORD_HASH_QUEUE_TIMEOUT)
+
+# 登录、注册请求的令牌桶，在查询数据库和计算哈希之前检查
+username_buckets = TokenBucketLimiter(AUTH_USERNAME_BURST, AUTH_USERNAME_PER_MINUTE / 60)
+ip_buckets = TokenBucketLimiter(AUTH_IP_BURST, AUTH_IP_PER_MINUTE / 60)
+
+
 def hash_password(password: str):
     """Hash the password using bcrypt."""
-    from passlib.context import CryptContext
-    pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
     return pwd_context.hash(password)
 
 
 def verify_password(plain_password: str, hashed_password: str) -> bool:
     """Verify the provided password against the stored hash."""
-    from passlib.context import CryptContext
-    pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
     return pwd_context.verify(plain_password, hashed_password)
-    
+
+
+async def hash_password_async(password: str) -> str:
+    """在密码哈希线程池中计算哈希，排队已满时抛出 429"""
+    async with password_limiter.slot():
+        return await asyncio.get_running_loop().run_in_executor(password_executor, pwd_context.hash, password)
+
+
+async def verify_and_update_password(plain_password: str, hashed_password: str) -> tuple[bool, str | None]:
+    """在密码哈希线程池中校验密码，校验通过且哈希成本与当前配置不一致时同时返回新的哈希，排队已满时抛出 429"""
+    async with password_limiter.slot():
+        return await asyncio.get_running_loop().run_in_executor(
+            password_executor, pwd_context.verify_and_update, plain_password, hashed_password
+        )
+
+
+def check_auth_rate_limit(request: Request, username: str) -> None:
+    """按客户端地址和用户名限制登录、注册、修改和重置密码请求的频率，超出时抛出 429"""
+    client = request.client.host if request.client else ""
+    for buckets, key in ((ip_buckets, client), (username_buckets, username.lower())):
+        retry_after = buckets.consume(key)
+        if retry_after:
+            raise too_many_requests(retry_after)
+
+
+def hash_refresh_token(token: str) -> str:
+    """刷新令牌是高熵随机串，保存和查找时使用其 SHA-256 摘要即可，无需 bcrypt"""
+    return hashlib.sha256(token.encode()).hexdigest()
+
+
+def issue_refresh_token(session: AsyncSession, user_id: UUID, scopes: list[str], family_id: UUID | None = None) -> str:
+    """生成刷新令牌并加入会话（由调用方提交），返回令牌明文"""
+    token = secrets.token_urlsafe(32)
+    session.add(RefreshTokenDB(
+        token_hash=hash_refresh_token(token),
+        family_id=family_id or uuid.uuid4(),
+        user_id=user_id,
+        scopes=" ".join(scopes),
+        expires_at=datetime.now() + timedelta(days=REFRESH_TOKEN_EXPIRE_DAYS),
+    ))
+    return token
+
+
+async def rotate_refresh_token(session: AsyncSession, token: str) -> tuple[RefreshTokenDB, str]:
+    """
+    校验并轮换刷新令牌，返回旧令牌记录和新令牌明文（由调用方提交）
+    已轮换或吊销的令牌被再次使用时视为泄露，吊销其所在令牌族的全部令牌
+    """
+    credentials_exception = HTTPException(
+        status_code=status.HTTP_401_UNAUTHORIZED,
+        detail="刷新令牌无效或已过期",
+        headers={"WWW-Authenticate": "Bearer"},
+    )
+    record = (await session.exec(
+        select(RefreshTokenDB).where(RefreshTokenDB.token_hash == hash_refresh_token(token))
+    )).first()
+    if not record or record.expires_at < datetime.now():
+        raise credentials_exception
+    # 以条件更新标记旧令牌，同一令牌的并发刷新只有一个能成功
+    result = await session.exec(
+        update(RefreshTokenDB)
+        .where(RefreshTokenDB.id == record.id, RefreshTokenDB.revoked_at.is_(None))
+        .values(revoked_at=datetime.now())
+    )
+    if result.rowcount != 1:
+        await revoke_refresh_tokens(session, family_id=record.family_id)
+        await session.commit()
+        raise credentials_exception
+    new_token = issue_refresh_token(session, record.user_id, record.scopes.split(), record.family_id)
+    return record, new_token
+
+
+async def revoke_refresh_tokens(session: AsyncSession, *, user_id: UUID | None = None, family_id: UUID | None = None) -> None:
+    """吊销某个用户或某个令牌族下尚未吊销的刷新令牌（由调用方提交）"""
+    statement = update(RefreshTokenDB).where(RefreshTokenDB.revoked_at.is_(None)).values(revoked_at=datetime.now())
+    if user_id is not None:
+        statement = statement.where(RefreshTokenDB.user_id == user_id)
+    if family_id is not None:
+        statement = statement.where(RefreshTokenDB.family_id == family_id)
+    await session.exec(statement)
+
 
 def email_format_check(email: str) -> bool:
     """Check if the email format is valid, true is OK"""
@@ -0,0 +1,83 @@
+"""
+批量操作
+按 id 列表分块执行 IN (...) 查询、更新和删除，以及多行 INSERT，代替逐条 session.get / session.add / session.delete 的大量往返。
+批量语句绕过 ORM 的级联和全文检索索引同步，调用方需自行处理子记录，本模块负责维护被插入、删除实体的索引记录
+"""
+from typing import Any, Iterable, Iterator, Sequence, TypeVar
+
+from sqlmodel import delete, insert, select, update
+from sqlmodel.ext.asyncio.session import AsyncSession
+
+from .search import add_to_index, is_searchable, remove_from_index
+from .settings import SQL_BULK_CHUNK_SIZE
+
+T = TypeVar("T")
+
+
+def chunked(items: Iterable[T], size: int = SQL_BULK_CHUNK_SIZE) -> Iterator[list[T]]:
+    """去除重复项（保持原有顺序）后按 size 分块"""
+    items = list(dict.fromkeys(items))
+    for start in range(0, len(items), size):
+        yield items[start:start + size]
+
+
+async def fetch_by_ids(session: AsyncSession, model: Any, ids: Iterable[Any], *criteria: Any) -> dict[Any, Any]:
+    """按 id 分块查询实体，返回 id 到实体的映射，不存在或不满足 criteria 的 id 不在结果中"""
+    found = {}
+    for chunk in chunked(ids):
+        rows = (await session.exec(select(model).where(model.id.in_(chunk), *criteria))).all()
+        found.update((row.id, row) for row in rows)
+    return found
+
+
+async def existing_ids(session: AsyncSession, model: Any, ids: Iterable[Any], *criteria: Any) -> set[Any]:
+    """按 id 分块查询，只返回存在且满足 criteria 的 id"""
+    found = set()
+    for chunk in chunked(ids):
+        found.update((await session.exec(select(model.id).where(model.id.in_(chunk), *criteria))).all())
+    return found
+
+
+async def bulk_insert(session: AsyncSession, model: Any, rows: Sequence[dict[str, Any]]) -> None:
+    """
+    分块以 executemany（支持的数据库上合并为多行 INSERT）写入记录及其索引记录
+    rows 为列名到值的映射，需包含主键等由 default_factory 生成的列（构造数据表模型实例时每个默认值工厂都要检查签名，大批量时开销明显）
+    """
+    for start in range(0, len(rows), SQL_BULK_CHUNK_SIZE):
+        chunk = rows[start:start + SQL_BULK_CHUNK_SIZE]
+        # 使用表级 INSERT 而非 ORM 批量插入：后者选择连接时不传入语句，读写分离的会话会误选读引擎
+        await session.exec(insert(model.__table__), params=chunk)
+        await session.run_sync(add_to_index, model, chunk)
+
+
+async def bulk_delete(session: AsyncSession, model: Any, ids: Iterable[Any]) -> int:
+    """按 id 分块删除实体及其索引记录，返回删除的行数"""
+    deleted = 0
+    for chunk in chunked(ids):
+        result = await session.exec(
+            delete(model).where(model.id.in_(chunk)).execution_options(synchronize_session=False)
+        )
+        deleted += result.rowcount
+        await session.run_sync(remove_from_index, model, chunk)
+    return deleted
+
+
+async def bulk_delete_where(session: AsyncSession, model: Any, column: Any, values: Iterable[Any]) -> int:
+    """删除 column 的取值在 values 中的全部记录（如按外键删除子记录），返回删除的行数"""
+    deleted = 0
+    for chunk in chunked(values):
+        if is_searchable(model):
+            # 需要被删实体的 id 才能删除其索引记录
+            deleted += await bulk_delete(session, model, (await session.exec(select(model.id).where(column.in_(chunk)))).all())
+            continue
+        result = await session.exec(delete(model).where(column.in_(chunk)).execution_options(synchronize_session=False))
+        deleted += result.rowcount
+    return deleted
+
+
+async def bulk_nullify(session: AsyncSession, column: Any, values: Iterable[Any]) -> None:
+    """将 column 的取值在 values 中的记录置为 NULL（解除对将被删除实体的外键引用）"""
+    for chunk in chunked(values):
+        await session.exec(
+            update(column.class_).where(column.in_(chunk)).values({column.key: None}).execution_options(synchronize_session=False)
+        )
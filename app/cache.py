@@ -0,0 +1,133 @@
+"""
+进程内缓存工具
+提供带过期时间和容量上限的线程安全缓存，以及跨进程的缓存失效通知
+"""
+import asyncio
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Hashable, Optional
+
+import redis
+from redis.exceptions import RedisError
+
+from .settings import REDIS_URL
+
+
+class TTLCache:
+    """带过期时间（TTL）和容量上限的 LRU 缓存，线程安全"""
+
+    def __init__(self, maxsize: int = 1024, ttl: float = 30.0):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self._data: OrderedDict[Hashable, tuple[float, Any]] = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key: Hashable, default: Any = None) -> Any:
+        """读取缓存，过期或不存在时返回 default"""
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is None or entry[0] < time.monotonic():
+                if entry is not None:
+                    del self._data[key]
+                self.misses += 1
+                return default
+            self._data.move_to_end(key)
+            self.hits += 1
+            return entry[1]
+
+    def set(self, key: Hashable, value: Any, ttl: float | None = None) -> None:
+        """写入缓存，超出容量时淘汰最久未使用的条目"""
+        expires_at = time.monotonic() + (self.ttl if ttl is None else ttl)
+        with self._lock:
+            self._data[key] = (expires_at, value)
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+
+    def pop(self, key: Hashable, default: Any = None) -> Any:
+        """删除并返回缓存条目"""
+        with self._lock:
+            entry = self._data.pop(key, None)
+            return default if entry is None else entry[1]
+
+    def clear(self) -> None:
+        """清空缓存"""
+        with self._lock:
+            self._data.clear()
+
+    def __len__(self) -> int:
+        return len(self._data)
+
+    def stats(self) -> dict:
+        """返回命中统计"""
+        return {
+            "size": len(self._data),
+            "maxsize": self.maxsize,
+            "hits": self.hits,
+            "misses": self.misses,
+        }
+
+
+class SharedInvalidation:
+    """跨进程的缓存失效通知
+
+    失效时除删除本进程的缓存条目外，还会递增 Redis 中的计数器；各进程最多每 interval 秒读取一次计数器，
+    发现变化时清空本地缓存。未配置 REDIS_URL 时只作用于本进程（shared 为 False）
+    Redis 客户端是同步的：异步代码使用 invalidate_async 和 sync，Redis 操作在线程中执行，不阻塞事件循环
+    """
+
+    def __init__(self, name: str, cache: TTLCache, interval: float = 1.0, redis_url: Optional[str] = REDIS_URL):
+        self.key = f"cache:epoch:{name}"
+        self.cache = cache
+        self.interval = interval
+        self._epoch: Any = None
+        self._checked_at = 0.0
+        self._lock = threading.Lock()
+        self._redis = redis.Redis.from_url(redis_url, socket_timeout=0.5, socket_connect_timeout=0.5) if redis_url else None
+
+    @property
+    def shared(self) -> bool:
+        """失效通知能否到达其他进程"""
+        return self._redis is not None
+
+    def _notify(self) -> None:
+        try:
+            self._redis.incr(self.key)
+        except RedisError:
+            pass
+
+    def invalidate(self, *keys: Hashable) -> None:
+        """删除本进程的缓存条目，并通知其他进程清空缓存（阻塞，供命令行脚本等同步代码调用）"""
+        for key in keys:
+            self.cache.pop(key)
+        if self._redis is not None:
+            self._notify()
+
+    async def invalidate_async(self, *keys: Hashable) -> None:
+        """同 invalidate，通知在线程中发送"""
+        for key in keys:
+            self.cache.pop(key)
+        if self._redis is not None:
+            await asyncio.to_thread(self._notify)
+
+    async def sync(self) -> None:
+        """检查其他进程是否发出了失效通知，距上次检查不足 interval 秒时直接返回"""
+        if self._redis is None:
+            return
+        now = time.monotonic()
+        with self._lock:
+            if now - self._checked_at < self.interval:
+                return
+            self._checked_at = now
+        try:
+            epoch = await asyncio.to_thread(self._redis.get, self.key)
+        except RedisError:
+            # 无法确认时清空缓存，宁可多查询数据库
+            self.cache.clear()
+            return
+        if epoch != self._epoch:
+            self.cache.clear()
+            self._epoch = epoch
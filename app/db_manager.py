@@ -1,15 +1,325 @@
+import itertools
 import os
+import threading
+import time
 from sqlmodel import create_engine, SQLModel, Session, select
-from fastapi import Depends
-from typing import Annotated
+from sqlmodel.ext.asyncio.session import AsyncSession
+from sqlalchemy import event, exc
+from sqlalchemy.engine import Engine, make_url
+from sqlalchemy.sql.dml import UpdateBase
+from sqlalchemy.ext.asyncio import AsyncEngine, create_async_engine
+from sqlalchemy.pool import AsyncAdaptedQueuePool, Pool, QueuePool
+from fastapi import Depends, Request
+import jwt
+import redis.asyncio as redis
+from redis.exceptions import RedisError
+from typing import Annotated, Any, Optional
 import importlib
 import sys
 from pathlib import Path
 
-from .settings import SQL_DEBUG_ECHO, SQL_BACKEND
+from .settings import (
+    SQL_DEBUG_ECHO, SQL_BACKEND, SQL_ASYNC_BACKEND, SQL_REPLICA_BACKENDS, SQL_REPLICA_STICKY_SECONDS, REDIS_URL,
+    SQL_POOL_SIZE, SQL_POOL_MAX_OVERFLOW, SQL_POOL_RECYCLE, SQL_POOL_TIMEOUT, SQL_POOL_PRE_PING,
+    SQLITE_JOURNAL_MODE, SQLITE_SYNCHRONOUS, SQLITE_BUSY_TIMEOUT, SQLITE_MMAP_SIZE, SQLITE_CACHE_SIZE,
+    SQLITE_FOREIGN_KEYS, SQLITE_WRITE_QUEUE, SQLITE_WRITE_TIMEOUT,
+)
+from .cache import TTLCache
+from .search import create_search_indexes
 
-connect_args = {"check_same_thread": False}
-engine = create_engine(SQL_BACKEND, echo=SQL_DEBUG_ECHO)
+
+class PoolMetrics:
+    """连接池的取用统计：取出次数、等待连接的耗时和超时次数"""
+
+    def __init__(self):
+        self.checkouts = 0
+        self.timeouts = 0
+        self.wait_total = 0.0
+        self.wait_max = 0.0
+        self._lock = threading.Lock()
+
+    def record(self, wait: float, timeout: bool = False) -> None:
+        with self._lock:
+            if timeout:
+                self.timeouts += 1
+            else:
+                self.checkouts += 1
+            self.wait_total += wait
+            self.wait_max = max(self.wait_max, wait)
+
+    def snapshot(self, pool: Pool) -> dict[str, Any]:
+        """返回连接池当前状态与累计统计"""
+        with self._lock:
+            data = {
+                "checkouts": self.checkouts,
+                "timeouts": self.timeouts,
+                "wait_time_total_ms": round(self.wait_total * 1000, 3),
+                "wait_time_avg_ms": round(self.wait_total / self.checkouts * 1000, 3) if self.checkouts else 0.0,
+                "wait_time_max_ms": round(self.wait_max * 1000, 3),
+            }
+        if isinstance(pool, QueuePool):
+            data.update({
+                "size": pool.size(),
+                "checked_in": pool.checkedin(),
+                "checked_out": pool.checkedout(),
+                "overflow": max(pool.overflow(), 0),
+                "max_overflow": pool._max_overflow,
+            })
+        return data
+
+
+# 各引擎连接池的统计，键为连接池的名称（"sync" / "async" / "async_writer" / "replica0" ...）
+pool_metrics: dict[str, PoolMetrics] = {}
+
+
+class _TimedPoolMixin:
+    """在取出连接时记录等待时间的连接池，统计记录在 pool_metrics[metrics_name] 中（由 timed_pool_class 指定）"""
+
+    metrics_name = "default"
+
+    def _do_get(self):
+        metrics = pool_metrics.setdefault(self.metrics_name, PoolMetrics())
+        start = time.perf_counter()
+        try:
+            connection = super()._do_get()
+        except exc.TimeoutError:
+            metrics.record(time.perf_counter() - start, timeout=True)
+            raise
+        metrics.record(time.perf_counter() - start)
+        return connection
+
+
+class TimedQueuePool(_TimedPoolMixin, QueuePool):
+    pass
+
+
+class TimedAsyncAdaptedQueuePool(_TimedPoolMixin, AsyncAdaptedQueuePool):
+    pass
+
+
+def timed_pool_class(name: str, is_async: bool = False) -> type[Pool]:
+    """返回将取用统计记录在 pool_metrics[name] 中的连接池类（连接池由引擎创建，名称通过类属性传入）"""
+    base = TimedAsyncAdaptedQueuePool if is_async else TimedQueuePool
+    return type(base.__name__, (base,), {"metrics_name": name})
+
+
+def engine_options(url: str, is_async: bool = False, name: Optional[str] = None) -> dict[str, Any]:
+    """根据数据库地址生成引擎参数，连接池参数取自 settings；name 为连接池的名称，默认为 async / sync"""
+    parsed = make_url(url)
+    name = name or ("async" if is_async else "sync")
+    options: dict[str, Any] = {
+        "echo": SQL_DEBUG_ECHO,
+        "pool_logging_name": name,
+    }
+    if parsed.get_backend_name() == "sqlite":
+        if not is_async:
+            options["connect_args"] = {"check_same_thread": False}
+        if parsed.database in (None, "", ":memory:"):
+            # 内存数据库使用方言默认的单连接池
+            return options
+    options.update({
+        "poolclass": timed_pool_class(name, is_async),
+        "pool_size": SQL_POOL_SIZE,
+        "max_overflow": SQL_POOL_MAX_OVERFLOW,
+        "pool_recycle": SQL_POOL_RECYCLE,
+        "pool_timeout": SQL_POOL_TIMEOUT,
+        # SQLite 文件连接不会被服务端断开，无需在取出时检测
+        "pool_pre_ping": SQL_POOL_PRE_PING and parsed.get_backend_name() != "sqlite",
+    })
+    return options
+
+
+def is_sqlite_file(url: str) -> bool:
+    """数据库地址是否为 SQLite 文件数据库"""
+    parsed = make_url(url)
+    return parsed.get_backend_name() == "sqlite" and parsed.database not in (None, "", ":memory:")
+
+
+def sqlite_pragmas() -> list[str]:
+    """SQLite 连接上需要设置的 PRAGMA，取自 settings"""
+    return [
+        f"PRAGMA journal_mode={SQLITE_JOURNAL_MODE}",
+        f"PRAGMA synchronous={SQLITE_SYNCHRONOUS}",
+        f"PRAGMA busy_timeout={SQLITE_BUSY_TIMEOUT}",
+        f"PRAGMA mmap_size={SQLITE_MMAP_SIZE}",
+        f"PRAGMA cache_size={SQLITE_CACHE_SIZE}",
+        f"PRAGMA foreign_keys={'ON' if SQLITE_FOREIGN_KEYS else 'OFF'}",
+    ]
+
+
+def configure_sqlite_engine(engine: Engine, writer: bool = False) -> None:
+    """为 SQLite 引擎注册连接事件，在每个新连接上设置 PRAGMA
+
+    写引擎的事务以 BEGIN IMMEDIATE 开启，在事务开始时即取得写锁，
+    避免先读后写的事务在升级写锁时因快照过期而直接失败（不会等待 busy_timeout）
+    """
+    @event.listens_for(engine, "connect")
+    def set_sqlite_pragmas(dbapi_connection, connection_record):
+        if writer:
+            # 关闭驱动隐式开启事务的行为，改由下面的 begin 事件显式开启
+            dbapi_connection.isolation_level = None
+        cursor = dbapi_connection.cursor()
+        for pragma in sqlite_pragmas():
+            cursor.execute(pragma)
+        cursor.close()
+
+    if writer:
+        @event.listens_for(engine, "begin")
+        def begin_immediate(conn):
+            conn.exec_driver_sql("BEGIN IMMEDIATE")
+
+
+class RoutingSession(Session):
+    """按语句类型选择引擎的会话：flush 以及 INSERT/UPDATE/DELETE 语句使用写引擎，其余查询使用默认引擎
+
+    事务中一旦写入，随后的查询也使用写引擎，直到提交或回滚，以便读到本事务已 flush 但未提交的修改
+    """
+
+    def __init__(self, *args, writer: Optional[Engine] = None, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.writer = writer
+        # 当前事务是否已在写引擎上写入
+        self.writing = False
+
+    def get_bind(self, mapper=None, clause=None, **kwargs):
+        if self.writer is not None and (self.writing or self._flushing or isinstance(clause, UpdateBase)):
+            self.writing = True
+            return self.writer
+        return super().get_bind(mapper=mapper, clause=clause, **kwargs)
+
+
+@event.listens_for(RoutingSession, "after_transaction_end")
+def _end_writing(session: RoutingSession, transaction: Any) -> None:
+    # 最外层事务结束（提交或回滚）后，查询恢复使用默认引擎
+    if transaction.parent is None:
+        session.writing = False
+
+
+# 同步引擎仅供 Celery 任务和命令行工具使用，接口统一使用 async_engine
+engine = create_engine(SQL_BACKEND, **engine_options(SQL_BACKEND))
+
+# 同步数据库驱动对应的异步驱动
+ASYNC_DRIVERS = {
+    "sqlite": "sqlite+aiosqlite",
+    "mysql": "mysql+aiomysql",
+}
+
+
+def async_database_url(url: str) -> str:
+    """根据同步数据库地址推导使用异步驱动的地址"""
+    parsed = make_url(url)
+    driver = ASYNC_DRIVERS.get(parsed.get_backend_name())
+    if driver is None:
+        return url
+    return parsed.set(drivername=driver).render_as_string(hide_password=False)
+
+
+ASYNC_SQL_BACKEND = SQL_ASYNC_BACKEND or async_database_url(SQL_BACKEND)
+async_engine = create_async_engine(ASYNC_SQL_BACKEND, **engine_options(ASYNC_SQL_BACKEND, is_async=True))
+
+# SQLite 文件数据库下，接口的写事务经由只有一个连接的写引擎依次执行（等待写连接即排队），
+# 查询使用 async_engine 的连接池，在 WAL 模式下读不会被写阻塞
+async_write_engine = None
+if is_sqlite_file(SQL_BACKEND):
+    configure_sqlite_engine(engine)
+if is_sqlite_file(ASYNC_SQL_BACKEND):
+    configure_sqlite_engine(async_engine.sync_engine)
+    if SQLITE_WRITE_QUEUE:
+        async_write_engine = create_async_engine(ASYNC_SQL_BACKEND, **{
+            **engine_options(ASYNC_SQL_BACKEND, is_async=True, name="async_writer"),
+            "pool_size": 1,
+            "max_overflow": 0,
+            "pool_timeout": SQLITE_WRITE_TIMEOUT,
+        })
+        configure_sqlite_engine(async_write_engine.sync_engine, writer=True)
+
+
+# 只读副本，按轮询方式分配给只读请求
+async_replica_engines: list[AsyncEngine] = []
+for i, url in enumerate(SQL_REPLICA_BACKENDS):
+    replica_url = async_database_url(url)
+    replica = create_async_engine(replica_url, **engine_options(replica_url, is_async=True, name=f"replica{i}"))
+    if is_sqlite_file(replica_url):
+        configure_sqlite_engine(replica.sync_engine)
+    async_replica_engines.append(replica)
+_replica_cycle = itertools.cycle(async_replica_engines)
+
+
+def get_pool_status() -> dict[str, Any]:
+    """当前进程内各引擎连接池的状态"""
+    pools = [("sync", engine.pool), ("async", async_engine.sync_engine.pool)]
+    if async_write_engine is not None:
+        pools.append(("async_writer", async_write_engine.sync_engine.pool))
+    pools += [(f"replica{i}", replica.sync_engine.pool) for i, replica in enumerate(async_replica_engines)]
+    return {name: pool_metrics.setdefault(name, PoolMetrics()).snapshot(pool) for name, pool in pools}
+
+
+async def dispose_engines() -> None:
+    """关闭全部异步引擎的连接池"""
+    for async_engine_ in (async_engine, async_write_engine, *async_replica_engines):
+        if async_engine_ is not None:
+            await async_engine_.dispose()
+
+
+class PrimaryStickiness:
+    """记录各请求方最近一次写入，粘滞时间内该请求方的只读请求使用主库
+
+    配置了 REDIS_URL 时记录保存在 Redis 中，由各工作进程共享；否则只在进程内记录
+    """
+
+    KEY_PREFIX = "db:sticky:"
+
+    def __init__(self, ttl: float, redis_url: Optional[str] = None):
+        self.ttl = ttl
+        self._local = TTLCache(maxsize=10000, ttl=ttl)
+        self._redis = redis.Redis.from_url(redis_url, socket_timeout=1, socket_connect_timeout=1) if redis_url else None
+
+    async def mark(self, principal: str) -> None:
+        self._local.set(principal, True)
+        if self._redis is not None:
+            try:
+                await self._redis.set(self.KEY_PREFIX + principal, 1, px=int(self.ttl * 1000))
+            except RedisError:
+                pass
+
+    async def is_sticky(self, principal: str) -> bool:
+        if self._local.get(principal):
+            return True
+        if self._redis is None:
+            return False
+        try:
+            return bool(await self._redis.exists(self.KEY_PREFIX + principal))
+        except RedisError:
+            # 无法确认时使用主库
+            return True
+
+
+stickiness = PrimaryStickiness(SQL_REPLICA_STICKY_SECONDS, REDIS_URL)
+
+
+def request_principal(request: Request) -> str:
+    """标识请求方：优先取令牌中的用户 id，未登录时取客户端地址"""
+    scheme, _, token = request.headers.get("authorization", "").partition(" ")
+    if scheme.lower() == "bearer" and token:
+        try:
+            # 只用于选择数据库，不校验签名（伪造的令牌最多使请求改用主库），令牌校验仍由认证依赖完成
+            user_id = jwt.decode(token, options={"verify_signature": False}).get("sub")
+        except jwt.InvalidTokenError:
+            user_id = None
+        if user_id:
+            return f"user:{user_id}"
+    return f"client:{request.client.host if request.client else ''}"
+
+
+@event.listens_for(Session, "after_flush")
+def _mark_flush_write(session: Session, flush_context: Any) -> None:
+    session.info["has_writes"] = True
+
+
+@event.listens_for(Session, "do_orm_execute")
+def _mark_bulk_write(orm_execute_state: Any) -> None:
+    if orm_execute_state.is_update or orm_execute_state.is_delete or orm_execute_state.is_insert:
+        orm_execute_state.session.info["has_writes"] = True
 
 
 def get_session():
@@ -17,6 +327,43 @@ def get_session():
             yield session
 
 
+def create_async_session(bind: Optional[AsyncEngine] = None) -> AsyncSession:
+    """创建异步数据库会话，提交后不使对象过期，避免在事件循环中触发隐式加载
+
+    bind 为只读副本时，查询使用副本，误写入的语句仍发往主库
+    """
+    writer = async_write_engine or (async_engine if bind is not None else None)
+    if writer is None:
+        return AsyncSession(async_engine, expire_on_commit=False)
+    return AsyncSession(
+        bind or async_engine, expire_on_commit=False,
+        sync_session_class=RoutingSession, writer=writer.sync_engine,
+    )
+
+
+async def get_async_session(request: Request):
+    async with create_async_session() as session:
+        try:
+            yield session
+        finally:
+            # 记录写入，使该请求方随后的只读请求在粘滞时间内使用主库
+            if async_replica_engines and session.info.get("has_writes"):
+                await stickiness.mark(request_principal(request))
+
+
+async def read_engine(request: Request) -> Optional[AsyncEngine]:
+    """只读请求使用的引擎：配置了只读副本时轮询使用副本，最近有写入的请求方返回 None（使用主库）"""
+    if not async_replica_engines or await stickiness.is_sticky(request_principal(request)):
+        return None
+    return next(_replica_cycle)
+
+
+async def get_read_session(request: Request):
+    """只读数据库会话：配置了只读副本时轮询使用副本，最近有写入的请求方仍使用主库"""
+    async with create_async_session(await read_engine(request)) as session:
+        yield session
+
+
 def collect_all_models():
     import typer
     from rich import print
@@ -58,10 +405,14 @@ def collect_all_models():
 
 
 def create_db_and_tables():
-        collect_all_models().create_all(engine)   
+        collect_all_models().create_all(engine)
+        create_search_indexes(engine)
 
 
 SessionDep = Annotated[Session, Depends(get_session)]
+AsyncSessionDep = Annotated[AsyncSession, Depends(get_async_session)]
+# 只读接口使用的会话，可能读到只读副本上略有延迟的数据
+ReadSessionDep = Annotated[AsyncSession, Depends(get_read_session)]
 
 if __name__ == "__main__":
     import typer
@@ -1,7 +1,8 @@
 from enum import Enum
 from fastapi import Depends, HTTPException, status, Form, Query, BackgroundTasks, Security, APIRouter, UploadFile, Request, Body
 from fastapi.responses import StreamingResponse, Response
-from sqlmodel import select, col
+from sqlalchemy import func
+from sqlmodel import select
 import uuid
 import os
 import pathlib
@@ -15,12 +16,15 @@ from datetime import datetime
 from typing import Iterator, Tuple, Optional
 
 from ..auth.utils import get_request_user, get_request_active_user
-from ..auth.models import User
-from ..models import PaginatedResponse
-from ..db_manager import SessionDep
+from ..auth.models import Principal, User
+from ..models import PaginatedResponse, CountStrategy, SearchOrder
+from ..search import search
+from ..responses import ORJSONResponse
+from ..bulk import bulk_delete, bulk_nullify, chunked, fetch_by_ids
+from ..db_manager import AsyncSessionDep, ReadSessionDep
 from .settings import MAX_FILE_SIZE_LIMIT_MB, STREAM_UPLOAD_LIMIT_MB
-from .utils import file_path, FILE_PATH, file_path_str, parse_range_header, create_file_iterator, process_large_file_upload, process_large_file_upload_raw, process_standard_file_upload_raw
-from .models import FileDB
+from .utils import file_path, FILE_PATH, file_path_str, verify_download_signature, parse_range_header, create_file_iterator, process_large_file_upload, process_large_file_upload_raw, process_standard_file_upload_raw
+from .models import FileDB, FileDBPartial
 
 
 file_manager_router = APIRouter(
@@ -35,14 +39,17 @@ class FileRangeRole(str, Enum):
     all = "all"
     global_files = "global"
 
-@file_manager_router.get("/list/{file_range}", response_model=PaginatedResponse[FileDB], summary="获取文件列表")
+@file_manager_router.get("/list/{file_range}", response_model=PaginatedResponse[FileDBPartial], summary="获取文件列表")
 async def get_files(
-    session: SessionDep,
+    session: ReadSessionDep,
     file_range: FileRangeRole,
     skip: int = Query(0, ge=0, description="跳过的记录数"),
     limit: int = Query(10, le=100, description="返回的记录数"),
-    request_user: User | None = Security(get_request_user, scopes=["file:read"])
-) -> PaginatedResponse[FileDB]:
+    cursor: Optional[str] = Query(None, description="分页游标，传入上一页返回的 next_cursor 使用键集分页（此时忽略 skip）"),
+    count: CountStrategy = Query(CountStrategy.exact, description="总数统计方式：exact 精确计数，estimate 估算，none 不统计"),
+    fields: Optional[str] = Query(None, description="返回字段，逗号分隔（如 id,name），为空时返回全部字段"),
+    request_user: Principal | None = Security(get_request_user, scopes=["file:read"])
+) -> ORJSONResponse:
     """获取文件列表，通过file_range参数控制返回的文件范围，global_files表示全局文件（需要管理员权限）"""
     match file_range:
         case FileRangeRole.public:
@@ -77,24 +84,27 @@ async def get_files(
                 )
             query = select(FileDB)
     
-    # 获取总数
-    total = len(session.exec(query).all())
-    
-    # 获取分页数据
-    files = session.exec(query.offset(skip).limit(limit)).all()
-    return PaginatedResponse[FileDB].create(list(files), skip, limit, total)
+    page = await PaginatedResponse[FileDBPartial].from_query_async(
+        session, query, skip, limit,
+        sort_key=(FileDB.upload_time, FileDB.id), cursor=cursor, count=count, fields=fields
+    )
+    return page.to_response()
 
 
-@file_manager_router.get("/search", response_model=PaginatedResponse[FileDB], summary="搜索文件")
+@file_manager_router.get("/search", response_model=PaginatedResponse[FileDBPartial], summary="搜索文件")
 async def search_files(
-    session: SessionDep,
-    request_user: User | None = Depends(get_request_user),
+    session: ReadSessionDep,
+    request_user: Principal | None = Depends(get_request_user),
     q: str = Query(..., description="搜索文件名关键词"),
     skip: int = Query(0, ge=0),
     limit: int = Query(10, le=100),
+    cursor: Optional[str] = Query(None, description="分页游标，传入上一页返回的 next_cursor 使用键集分页（此时忽略 skip）"),
+    count: CountStrategy = Query(CountStrategy.exact, description="总数统计方式：exact 精确计数，estimate 估算，none 不统计"),
+    fields: Optional[str] = Query(None, description="返回字段，逗号分隔（如 id,name），为空时返回全部字段"),
     public_only: bool = Query(False, description="仅搜索公开文件，未登录时仅可搜索公开文件"),
-    global_search: bool = Query(False, description="是否全局搜索（包括非公开文件和其他用户文件），开启此项需要管理员权限")
-) -> PaginatedResponse[FileDB]:
+    global_search: bool = Query(False, description="是否全局搜索（包括非公开文件和其他用户文件），开启此项需要管理员权限"),
+    order: SearchOrder = Query(SearchOrder.rank, description="排序方式：rank 按相关度（不支持游标分页），time 按上传时间"),
+) -> ORJSONResponse:
     """搜索文件，逻辑是先根据关键词搜索文件名，然后根据文件域限过滤结果"""
     if global_search and (not request_user or not request_user.is_superuser):
         raise HTTPException(
@@ -111,35 +121,33 @@ async def search_files(
         # 第二次约束，用户未登录或选择只搜公开文件
         query = query.where(FileDB.is_public == True)
     
-    query = query.where(col(FileDB.name).like(f"%{q}%"))
-    
-    # 获取总数
-    total = len(session.exec(query).all())
+    query = search(session, query, FileDB, q)
     
-    # 获取分页数据
-    query = query.offset(skip).limit(limit)
-    files = session.exec(query).all()
-    
-    return PaginatedResponse[FileDB].create(list(files), skip, limit, total)
+    page = await PaginatedResponse[FileDBPartial].from_query_async(
+        session, query, skip, limit,
+        sort_key=(FileDB.upload_time, FileDB.id) if order == SearchOrder.time else None,
+        cursor=cursor, count=count, fields=fields
+    )
+    return page.to_response()
 
 
 @file_manager_router.get("/stats", summary="获取文件统计信息")
 async def get_file_stats(
-    session: SessionDep,
-    request_user: User = Security(get_request_active_user, scopes=["file:read"])
+    session: ReadSessionDep,
+    request_user: Principal = Security(get_request_active_user, scopes=["file:read"])
 ):
     """获取文件统计信息"""
     # 用户上传的总文件数
-    total_files = session.exec(
+    total_files = (await session.exec(
         select(FileDB).where(FileDB.uploader_id == request_user.id)
-    ).all()
+    )).all()
     
     # 用户公开文件数
-    public_files = session.exec(
+    public_files = (await session.exec(
         select(FileDB).where(
             (FileDB.uploader_id == request_user.id) & (FileDB.is_public == True)
         )
-    ).all()
+    )).all()
     
     # 计算总文件大小
     total_size = sum(file.size for file in total_files)
@@ -156,8 +164,8 @@ async def get_file_stats(
 @file_manager_router.get("/upload/status/{file_id}", summary="查询分片上传状态")
 async def get_upload_status(
     file_id: str,
-    session: SessionDep,
-    request_user: User = Security(get_request_active_user, scopes=["file:read"]),
+    session: ReadSessionDep,
+    request_user: Principal = Security(get_request_active_user, scopes=["file:read"]),
 ):
     """查询分片上传状态"""
     try:
@@ -197,11 +205,11 @@ async def get_upload_status(
 @file_manager_router.get("/{file_id}", response_model=FileDB, summary="获取单个文件信息")
 async def get_file(
     file_id: uuid.UUID,
-    session: SessionDep,
-    request_user: User | None = Security(get_request_user, scopes=["file:read"]),
+    session: ReadSessionDep,
+    request_user: Principal | None = Security(get_request_user, scopes=["file:read"]),
 ) -> FileDB:
     """获取单个文件信息"""
-    file_db = session.get(FileDB, file_id)
+    file_db = await session.get(FileDB, file_id)
     
     if not file_db:
         raise HTTPException(
@@ -230,11 +238,19 @@ async def get_file(
 async def download_file(
     file_id: uuid.UUID,
     request: Request,
-    session: SessionDep,
-    request_user: User | None = Security(get_request_user, scopes=["file:read"]),
+    session: ReadSessionDep,
+    request_user: Principal | None = Security(get_request_user, scopes=["file:read"]),
+    expires: Optional[int] = Query(None, description="签名下载链接的过期时间戳"),
+    signature: Optional[str] = Query(None, description="签名下载链接的签名，有效时无需登录"),
 ):
-    """下载文件，支持断点续传和分片传输"""
-    file_db = session.get(FileDB, file_id)
+    """下载文件，支持断点续传和分片传输；带有效签名（如邮件中的附件链接）时无需登录"""
+    signed = signature is not None and verify_download_signature(file_id, expires, signature)
+    if signature is not None and not signed:
+        raise HTTPException(
+            status_code=status.HTTP_403_FORBIDDEN,
+            detail="下载链接无效或已过期"
+        )
+    file_db = await session.get(FileDB, file_id)
     
     if not file_db:
         raise HTTPException(
@@ -243,7 +259,7 @@ async def download_file(
         )
     
     # 检查访问权限
-    if not file_db.is_public:
+    if not file_db.is_public and not signed:
         if not request_user:
             raise HTTPException(
                 status_code=status.HTTP_401_UNAUTHORIZED,
@@ -340,11 +356,19 @@ async def download_file(
 @file_manager_router.head("/{file_id}/download", summary="获取文件下载信息（用于断点续传）")
 async def get_download_info(
     file_id: uuid.UUID,
-    session: SessionDep,
-    request_user: User | None = Security(get_request_user, scopes=["file:read"]),
+    session: ReadSessionDep,
+    request_user: Principal | None = Security(get_request_user, scopes=["file:read"]),
+    expires: Optional[int] = Query(None, description="签名下载链接的过期时间戳"),
+    signature: Optional[str] = Query(None, description="签名下载链接的签名，有效时无需登录"),
 ):
     """获取文件下载信息，支持HEAD请求用于断点续传"""
-    file_db = session.get(FileDB, file_id)
+    signed = signature is not None and verify_download_signature(file_id, expires, signature)
+    if signature is not None and not signed:
+        raise HTTPException(
+            status_code=status.HTTP_403_FORBIDDEN,
+            detail="下载链接无效或已过期"
+        )
+    file_db = await session.get(FileDB, file_id)
     
     if not file_db:
         raise HTTPException(
@@ -353,7 +377,7 @@ async def get_download_info(
         )
     
     # 检查访问权限
-    if not file_db.is_public:
+    if not file_db.is_public and not signed:
         if not request_user:
             raise HTTPException(
                 status_code=status.HTTP_401_UNAUTHORIZED,
@@ -412,11 +436,11 @@ async def get_download_info(
 async def stream_file(
     file_id: uuid.UUID,
     request: Request,
-    session: SessionDep,
-    request_user: User | None = Security(get_request_user, scopes=["file:read"]),
+    session: ReadSessionDep,
+    request_user: Principal | None = Security(get_request_user, scopes=["file:read"]),
 ):
     """流式下载文件，适用于在线预览（如视频、音频、图片），头像，动态图片等也使用此接口"""
-    file_db = session.get(FileDB, file_id)
+    file_db = await session.get(FileDB, file_id)
     
     if not file_db:
         raise HTTPException(
@@ -506,8 +530,8 @@ async def stream_file(
 @file_manager_router.post("/upload", response_model=dict, summary="上传文件（支持大文件优化）")
 async def upload_files(
     files: list[UploadFile],
-    session: SessionDep,
-    request_user: User = Security(get_request_active_user, scopes=["file:upload"]),
+    session: AsyncSessionDep,
+    request_user: Principal = Security(get_request_active_user, scopes=["file:upload"]),
     is_public: bool = Form(False, description="是否公开文件"),
     use_streaming: bool = Form(True, description="是否使用流式处理（推荐大文件使用）"),
 ) -> dict:
@@ -555,10 +579,10 @@ async def upload_files(
                 # 保存到数据库 - 使用独立事务
                 try:
                     session.add(file_db)
-                    session.commit()
-                    session.refresh(file_db)
+                    await session.commit()
+                    await session.refresh(file_db)
                 except Exception as db_error:
-                    session.rollback()
+                    await session.rollback()
                     # 清理已上传的文件
                     try:
                         _path = file_db.get_path()
@@ -615,8 +639,8 @@ async def upload_files(
 
 @file_manager_router.post("/upload/chunk", summary="分片上传文件")
 async def upload_file_chunk(
-    session: SessionDep,
-    request_user: User = Security(get_request_active_user, scopes=["file:upload"]),
+    session: AsyncSessionDep,
+    request_user: Principal = Security(get_request_active_user, scopes=["file:upload"]),
     file: UploadFile = Form(...),
     chunk_index: int = Form(..., description="分片索引（从0开始）"),
     total_chunks: int = Form(..., description="总分片数"),
@@ -699,8 +723,8 @@ async def upload_file_chunk(
             )
                 
             session.add(file_db)
-            session.commit()
-            session.refresh(file_db)
+            await session.commit()
+            await session.refresh(file_db)
             
             response_data["file_info"] = file_db
             response_data["message"] = "文件上传成功"
@@ -723,13 +747,13 @@ async def upload_file_chunk(
 @file_manager_router.patch("/{file_id}", response_model=FileDB, summary="更新文件信息")
 async def update_file_info(
     file_id: uuid.UUID,
-    session: SessionDep,
-    request_user: User = Security(get_request_active_user, scopes=["file:write"]),
+    session: AsyncSessionDep,
+    request_user: Principal = Security(get_request_active_user, scopes=["file:write"]),
     name: str | None = Form(None, description="新文件名"),
     is_public: bool | None = Form(None, description="是否公开"),
 ) -> FileDB:
     """更新文件信息（文件名、公开状态等）"""
-    file_db = session.get(FileDB, file_id)
+    file_db = await session.get(FileDB, file_id)
     
     if not file_db:
         raise HTTPException(
@@ -767,13 +791,13 @@ async def update_file_info(
         file_db.updated_at = datetime.now()
         
         session.add(file_db)
-        session.commit()
-        session.refresh(file_db)
+        await session.commit()
+        await session.refresh(file_db)
         
         return file_db
         
     except Exception as e:
-        session.rollback()
+        await session.rollback()
         raise HTTPException(
             status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
             detail=f"更新文件信息失败: {str(e)}"
@@ -784,12 +808,12 @@ async def update_file_info(
 async def replace_file_content(
     file_id: uuid.UUID,
     new_file: UploadFile,
-    session: SessionDep,
-    request_user: User = Security(get_request_active_user, scopes=["file:write", "file:upload"]),
+    session: AsyncSessionDep,
+    request_user: Principal = Security(get_request_active_user, scopes=["file:write", "file:upload"]),
     use_streaming: bool = Form(True, description="是否使用流式处理"),
 ) -> FileDB:
     """替换文件内容，保持文件ID不变"""
-    file_db = session.get(FileDB, file_id)
+    file_db = await session.get(FileDB, file_id)
     
     if not file_db:
         raise HTTPException(
@@ -848,15 +872,15 @@ async def replace_file_content(
         file_db.upload_time = datetime.now()
         
         session.add(file_db)
-        session.commit()
-        session.refresh(file_db)
+        await session.commit()
+        await session.refresh(file_db)
         
         return file_db
         
     except HTTPException:
         raise
     except Exception as e:
-        session.rollback()
+        await session.rollback()
         raise HTTPException(
             status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
             detail=f"替换文件内容失败: {str(e)}"
@@ -865,8 +889,8 @@ async def replace_file_content(
 
 @file_manager_router.delete("/batch", summary="批量删除文件")
 async def delete_files_batch(
-    session: SessionDep,
-    request_user: User = Security(get_request_active_user, scopes=["file:delete"]),
+    session: AsyncSessionDep,
+    request_user: Principal = Security(get_request_active_user, scopes=["file:delete"]),
     file_ids: list[uuid.UUID] = Body(..., description="要删除的文件ID列表"),
     force: bool = Query(False, description="强制删除（即使物理文件不存在）")
 ):
@@ -880,9 +904,17 @@ async def delete_files_batch(
     deleted_files = []
     failed_files = []
     
-    for file_id in file_ids:
+    # 一次查询取得全部文件记录，以及每个 MD5 当前被多少条记录引用
+    files = await fetch_by_ids(session, FileDB, file_ids)
+    md5_refs = {}
+    for chunk in chunked({file_db.md5 for file_db in files.values()}):
+        md5_refs.update((await session.exec(
+            select(FileDB.md5, func.count()).where(FileDB.md5.in_(chunk)).group_by(FileDB.md5)
+        )).all())
+    
+    for file_id in dict.fromkeys(file_ids):
         try:
-            file_db = session.get(FileDB, file_id)
+            file_db = files.get(file_id)
             
             if not file_db:
                 failed_files.append({
@@ -901,13 +933,8 @@ async def delete_files_batch(
                     })
                     continue
             
-            # 检查是否有其他文件使用相同的MD5
-            files_with_same_md5 = session.exec(
-                select(FileDB).where(FileDB.md5 == file_db.md5)
-            ).all()
-            
-            # 删除物理文件
-            if len(files_with_same_md5) <= 1:
+            # 没有其他文件使用相同的MD5时删除物理文件
+            if md5_refs[file_db.md5] <= 1:
                 file_path = file_db.get_path()
                 if file_path.exists():
                     file_path.unlink()
@@ -919,8 +946,7 @@ async def delete_files_batch(
                     })
                     continue
             
-            # 删除数据库记录
-            session.delete(file_db)
+            md5_refs[file_db.md5] -= 1
             deleted_files.append({
                 "file_id": str(file_id),
                 "file_name": file_db.name
@@ -933,9 +959,13 @@ async def delete_files_batch(
             })
     
     try:
-        session.commit()
+        # 删除数据库记录，使用这些文件作为头像的用户改为无头像
+        deleted_ids = [uuid.UUID(item["file_id"]) for item in deleted_files]
+        await bulk_nullify(session, User.avatar_id, deleted_ids)
+        await bulk_delete(session, FileDB, deleted_ids)
+        await session.commit()
     except Exception as e:
-        session.rollback()
+        await session.rollback()
         raise HTTPException(
             status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
             detail=f"批量删除提交失败: {str(e)}"
@@ -950,8 +980,8 @@ async def delete_files_batch(
 
 @file_manager_router.post("/cleanup/orphaned", summary="清理孤立文件")
 async def cleanup_orphaned_files(
-    session: SessionDep,
-    request_user: User = Security(get_request_active_user, scopes=["file:delete"]),
+    session: AsyncSessionDep,
+    request_user: Principal = Security(get_request_active_user, scopes=["file:delete"]),
     dry_run: bool = Query(True, description="仅模拟运行，不实际删除"),
     global_cleanup: bool = Query(False, description="是否清理所有用户的孤立文件，此项需要管理员权限")
 ):
@@ -976,11 +1006,11 @@ async def cleanup_orphaned_files(
     
     # 获取用户的所有文件记录
     if global_cleanup:
-        user_files = session.exec(select(FileDB)).all()
+        user_files = (await session.exec(select(FileDB))).all()
     else:
-        user_files = session.exec(
+        user_files = (await session.exec(
             select(FileDB).where(FileDB.uploader_id == request_user.id)
-        ).all()
+        )).all()
     
     cleaned_count = 0
     
@@ -997,10 +1027,10 @@ async def cleanup_orphaned_files(
                 })
             if not dry_run:
                 # 如果物理文件不存在，但数据库记录存在，删除数据库记录
-                session.delete(file)
+                await session.delete(file)
                 cleaned_count += 1
     
-    session.commit()
+    await session.commit()
     
     # 创建MD5到文件名的映射
     db_files = {f"{file.md5}_{file.name}" for file in user_files}
@@ -1036,8 +1066,8 @@ async def cleanup_orphaned_files(
 
 @file_manager_router.post("/cleanup/temp", summary="清理临时文件")
 async def cleanup_temp_files(
-    session: SessionDep,
-    request_user: User = Security(get_request_active_user, scopes=["file:delete"]),
+    session: AsyncSessionDep,
+    request_user: Principal = Security(get_request_active_user, scopes=["file:delete"]),
     max_age_hours: int = Query(24, description="清理超过指定小时数的临时文件"),
     dry_run: bool = Query(True, description="仅模拟运行，不实际删除"),
     global_cleanup: bool = Query(False, description="是否清理所有用户的临时文件，此项需要管理员权限")
@@ -1091,9 +1121,9 @@ async def cleanup_temp_files(
 
 @file_manager_router.get("/storage/usage", summary="获取存储使用情况")
 async def get_storage_usage(
-    session: SessionDep,
+    session: ReadSessionDep,
     global_usage: bool = Query(False, description="是否获取全局存储使用情况（需要管理员权限）"),
-    request_user: User = Security(get_request_active_user, scopes=["file:read"]),
+    request_user: Principal = Security(get_request_active_user, scopes=["file:read"]),
 ):
     """获取用户存储使用情况详细信息"""
     # 获取用户所有文件
@@ -1103,11 +1133,11 @@ async def get_storage_usage(
                 status_code=status.HTTP_403_FORBIDDEN,
                 detail="需要管理员权限才能获取全局存储使用情况"
             )
-        user_files = session.exec(select(FileDB)).all()
+        user_files = (await session.exec(select(FileDB))).all()
     else:
-        user_files = session.exec(
+        user_files = (await session.exec(
             select(FileDB).where(FileDB.uploader_id == request_user.id)
-        ).all()
+        )).all()
     
     # 按文件类型分组统计
     file_types = {}
@@ -1,5 +1,6 @@
-from sqlmodel import SQLModel, Field, Relationship
+from sqlmodel import SQLModel, Field, Relationship, Index
 from fastapi import UploadFile
+import asyncio
 import uuid
 from datetime import datetime
 from typing import TYPE_CHECKING, Optional
@@ -8,12 +9,19 @@ import hashlib
 from sqlmodel import Session
 
 from .settings import FILE_PATH
+from ..models import partial_model
+from ..search import searchable
 
 if TYPE_CHECKING:
-    from ..auth.models import User
+    from ..auth.models import Principal, User
 
 class FileDB(SQLModel, table=True):
     """File model for storing file metadata."""
+    __table_args__ = (
+        # /file/list 与 /file/search 的私有、公开文件过滤，按 (upload_time, id) 排序
+        Index("ix_filedb_uploader_id_upload_time", "uploader_id", "upload_time", "id"),
+        Index("ix_filedb_is_public_upload_time_id", "is_public", "upload_time", "id"),
+    )
     
     id: uuid.UUID = Field(
         default_factory=uuid.uuid4,
@@ -60,7 +68,7 @@ class FileDB(SQLModel, table=True):
         return hashlib.md5(res).hexdigest() == self.md5
     
     @classmethod
-    async def from_upload_file(cls, upload_file: UploadFile, uploader: Optional["User"] = None, path = "./media") -> "FileDB":
+    async def from_upload_file(cls, upload_file: UploadFile, uploader: Optional["Principal"] = None, path = "./media") -> "FileDB":
         """Create a FileDB instance from an UploadFile."""
         # 读取文件内容
         file_content = await upload_file.read()
@@ -101,8 +109,8 @@ class FileDB(SQLModel, table=True):
         file_path = path.joinpath(self.md5 + "_" + self.name)
         if not file_path.exists():
             raise FileNotFoundError(f"文件不存在: {file_path}")
-        with open(file_path, "rb") as f:
-            return f.read()
+        # 在线程中读取，避免大文件阻塞事件循环
+        return await asyncio.to_thread(file_path.read_bytes)
     
     async def delete(self, session: Session) -> None:
         """Delete the file from the specified path."""
@@ -116,4 +124,9 @@ class FileDB(SQLModel, table=True):
             session.delete(self)
             session.commit()
         else:
-            raise FileNotFoundError(f"文件不存在: {file_path}")
\ No newline at end of file
+            raise FileNotFoundError(f"文件不存在: {file_path}")
+
+
+FileDBPartial = partial_model(FileDB)
+
+searchable(FileDB, "name")
@@ -1,7 +1,12 @@
+import os
 from enum import Enum
 
 MAX_FILE_SIZE_LIMIT_MB = 4096
 STREAM_UPLOAD_LIMIT_MB = 10 # 上传时大于此大小则优化为流式上传
+# 签名下载链接（如邮件中的大附件链接）的有效期（小时）
+FILE_SIGNED_URL_EXPIRE_HOURS = float(os.getenv("FILE_SIGNED_URL_EXPIRE_HOURS", 72))
+# 签名下载链接使用的站点地址（如 https://example.com），未设置时使用请求的地址（部署在反向代理后时应设置）
+FILE_SIGNED_URL_BASE = os.getenv("FILE_SIGNED_URL_BASE", "")
 
 class FILE_PATH(str, Enum):
     """Enum for file storage paths."""
@@ -3,22 +3,27 @@
 在应用启动时创建必要的目录结构
 """
 import hashlib
+import hmac
 import pathlib
 import re
 import tempfile
+import time
+import urllib.parse
+import uuid
 from typing import Iterator, Optional, Tuple
-from fastapi import HTTPException, UploadFile, status
+from fastapi import HTTPException, Request, UploadFile, status
 from sqlmodel import select
 import typer
 from rich import print
 from rich.console import Console
 from rich.table import Table
 
-from app.auth.models import User
-from app.db_manager import SessionDep
+from app.auth.models import Principal
+from app.auth.settings import SECRET_KEY
+from app.db_manager import AsyncSessionDep
 from app.file.models import FileDB
 
-from .settings import FILE_PATH, MAX_FILE_SIZE_LIMIT_MB
+from .settings import FILE_PATH, MAX_FILE_SIZE_LIMIT_MB, FILE_SIGNED_URL_EXPIRE_HOURS, FILE_SIGNED_URL_BASE
 
 console = Console()
 
@@ -51,6 +56,33 @@ def file_path_str(parent_path: str, path = None, resolve: bool = False) -> str:
     return str(_path)
 
 
+def sign_download(file_id: uuid.UUID, expires: int) -> str:
+    """计算文件下载链接的签名（HMAC-SHA256），expires 为过期时间戳（秒）"""
+    message = f"file-download:{file_id}:{expires}".encode()
+    return hmac.new(SECRET_KEY.encode(), message, hashlib.sha256).hexdigest()
+
+
+def verify_download_signature(file_id: uuid.UUID, expires: Optional[int], signature: str) -> bool:
+    """校验签名下载链接：签名正确且未过期（不查询数据库）"""
+    if expires is None or expires < time.time():
+        return False
+    return hmac.compare_digest(sign_download(file_id, expires), signature)
+
+
+def signed_download_url(request: Request, file_id: uuid.UUID, expires: Optional[int] = None) -> str:
+    """
+    生成无需登录即可下载文件的链接，默认有效期 FILE_SIGNED_URL_EXPIRE_HOURS 小时
+    持有链接即可下载，只应发给有权获得该文件的人
+    """
+    if expires is None:
+        expires = int(time.time() + FILE_SIGNED_URL_EXPIRE_HOURS * 3600)
+    query = urllib.parse.urlencode({"expires": expires, "signature": sign_download(file_id, expires)})
+    if FILE_SIGNED_URL_BASE:
+        path = request.app.url_path_for("download_file", file_id=str(file_id))
+        return f"{FILE_SIGNED_URL_BASE.rstrip('/')}{path}?{query}"
+    return f"{request.url_for('download_file', file_id=str(file_id))}?{query}"
+
+
 
 def parse_range_header(range_header: str, file_size: int) -> Tuple[int, int]:
     """解析HTTP Range请求头"""
@@ -97,7 +129,7 @@ def create_file_iterator(file_path: pathlib.Path, start: int = 0, end: Optional[
                 remaining -= len(chunk)
 
 
-async def process_large_file_upload(file: UploadFile, request_user: User, is_public: bool, session: SessionDep) -> FileDB:
+async def process_large_file_upload(file: UploadFile, request_user: Principal, is_public: bool, session: AsyncSessionDep) -> FileDB:
     """处理大文件上传的内部函数"""
     # 创建用户目录
     user_path = file_path_str(FILE_PATH.USER_PATH, request_user.id)
@@ -135,9 +167,9 @@ async def process_large_file_upload(file: UploadFile, request_user: User, is_pub
         file_md5 = md5_hash.hexdigest()
         
         # 检查是否已存在相同MD5的文件
-        existing_file = session.exec(
+        existing_file = (await session.exec(
             select(FileDB).where(FileDB.md5 == file_md5)
-        ).first()
+        )).first()
         
         if existing_file:
             # 删除临时文件，返回现有记录
@@ -159,8 +191,8 @@ async def process_large_file_upload(file: UploadFile, request_user: User, is_pub
         )
         
         session.add(file_db)
-        session.commit()
-        session.refresh(file_db)
+        await session.commit()
+        await session.refresh(file_db)
         
         return file_db
         
@@ -0,0 +1,234 @@
+"""
+流式批量导入
+边接收请求体边解析 CSV / NDJSON，按批交给调用方校验和写入，整个文件不会同时保存在内存中：
+- CSV：第一行为表头，支持带引号（含换行）的字段，空字段视为未提供
+- NDJSON：每行一个 JSON 对象，空行忽略
+导入结果按行报告失败原因，错误条目超过上限时只统计数量；
+写入前按数据表检查必填列，某一批写入数据库失败时回滚该批并将其中各行记为失败，不影响其他批次
+"""
+import codecs
+import csv
+from enum import Enum
+from typing import Any, AsyncIterator, Awaitable, Callable, Optional
+
+import orjson
+from fastapi import HTTPException, Request, status
+from pydantic import ValidationError
+from sqlalchemy.exc import SQLAlchemyError
+from sqlmodel.ext.asyncio.session import AsyncSession
+
+from .bulk import bulk_insert
+from .settings import IMPORT_BATCH_SIZE, IMPORT_MAX_LINE_LENGTH, IMPORT_MAX_REPORTED_ERRORS
+
+
+class ImportFormat(str, Enum):
+    """导入数据格式"""
+    csv = "csv"
+    ndjson = "ndjson"
+
+
+# Content-Type 与导入格式的对应关系
+CONTENT_TYPES = {
+    "text/csv": ImportFormat.csv,
+    "application/csv": ImportFormat.csv,
+    "application/x-ndjson": ImportFormat.ndjson,
+    "application/ndjson": ImportFormat.ndjson,
+    "application/jsonl": ImportFormat.ndjson,
+    "application/json-lines": ImportFormat.ndjson,
+}
+
+
+class ImportAborted(Exception):
+    """数据无法继续解析（编码错误、缺少表头、行过长等），导入在该行停止"""
+
+    def __init__(self, line: int, message: str):
+        super().__init__(message)
+        self.line = line
+        self.message = message
+
+
+class ImportReport:
+    """导入结果统计"""
+
+    def __init__(self, max_errors: int = IMPORT_MAX_REPORTED_ERRORS):
+        self.max_errors = max_errors
+        self.total = 0
+        self.imported = 0
+        self.failed = 0
+        self.errors: list[dict[str, Any]] = []
+        self.aborted: Optional[dict[str, Any]] = None
+
+    def fail(self, line: int, error: str) -> None:
+        """记录一行导入失败"""
+        self.failed += 1
+        if len(self.errors) < self.max_errors:
+            self.errors.append({"line": line, "error": error})
+
+    def result(self) -> dict[str, Any]:
+        return {
+            "total": self.total,
+            "imported": self.imported,
+            "failed": self.failed,
+            # 解析错误在读取时记录，校验错误在整批处理时记录，按行号排序后返回
+            "errors": sorted(self.errors, key=lambda error: error["line"]),
+            "errors_truncated": self.failed > len(self.errors),
+            "aborted": self.aborted,
+        }
+
+
+def resolve_format(request: Request, format: Optional[ImportFormat]) -> ImportFormat:
+    """确定导入格式：优先使用显式指定的格式，否则根据 Content-Type 判断"""
+    if format is not None:
+        return format
+    content_type = request.headers.get("content-type", "").split(";")[0].strip().lower()
+    if content_type in CONTENT_TYPES:
+        return CONTENT_TYPES[content_type]
+    raise HTTPException(
+        status_code=status.HTTP_415_UNSUPPORTED_MEDIA_TYPE,
+        detail="不支持的数据格式，请使用 CSV（text/csv）或 NDJSON（application/x-ndjson），或通过 format 参数指定"
+    )
+
+
+def validation_message(error: ValidationError) -> str:
+    """将校验错误整理为一行说明"""
+    return "; ".join(
+        f"{'.'.join(str(part) for part in item['loc']) or '数据'}: {item['msg']}" for item in error.errors()
+    )
+
+
+def missing_columns(model: Any, row: dict[str, Any]) -> list[str]:
+    """返回 row 缺少的必填列：NOT NULL 列的值为空，或未提供且没有默认值"""
+    return [
+        column.name for column in model.__table__.columns
+        if not column.nullable and (
+            row[column.name] is None if column.name in row
+            else column.default is None and column.server_default is None
+        )
+    ]
+
+
+async def insert_rows(session: AsyncSession, model: Any, rows: list[tuple[int, dict[str, Any]]], report: ImportReport) -> None:
+    """
+    批量写入一批 (行号, 列值) 并提交，缺少必填列的行记为失败；
+    写入失败（如违反约束）时回滚整批，批内各行记为失败
+    """
+    valid = []
+    for line, row in rows:
+        missing = missing_columns(model, row)
+        if missing:
+            report.fail(line, f"缺少必填字段: {', '.join(missing)}")
+        else:
+            valid.append((line, row))
+    if not valid:
+        return
+    try:
+        await bulk_insert(session, model, [row for _, row in valid])
+        await session.commit()
+    except SQLAlchemyError as e:
+        await session.rollback()
+        error = f"写入数据库失败: {getattr(e, 'orig', None) or e}"
+        for line, _ in valid:
+            report.fail(line, error)
+        return
+    report.imported += len(valid)
+
+
+async def _iter_lines(request: Request) -> AsyncIterator[tuple[int, str]]:
+    """逐行产出请求体内容及其行号（从 1 开始），去除行尾换行符和 UTF-8 BOM"""
+    decoder = codecs.getincrementaldecoder("utf-8-sig")()
+    buffer = ""
+    line_no = 0
+    async for chunk in request.stream():
+        try:
+            buffer += decoder.decode(chunk)
+        except UnicodeDecodeError as e:
+            raise ImportAborted(line_no + 1 + buffer.count("\n") + chunk[:e.start].count(b"\n"), "数据不是有效的 UTF-8 编码")
+        # 只按 \n 分行：\u2028 等字符可能出现在 JSON 字符串或 CSV 字段中
+        *lines, buffer = buffer.split("\n")
+        if len(buffer) > IMPORT_MAX_LINE_LENGTH:
+            raise ImportAborted(line_no + 1, f"单行长度超过 {IMPORT_MAX_LINE_LENGTH} 个字符")
+        for line in lines:
+            line_no += 1
+            yield line_no, line.rstrip("\r")
+    try:
+        buffer += decoder.decode(b"", final=True)
+    except UnicodeDecodeError:
+        raise ImportAborted(line_no + 1, "数据不是有效的 UTF-8 编码")
+    if buffer:
+        yield line_no + 1, buffer.rstrip("\r")
+
+
+async def _iter_csv(request: Request) -> AsyncIterator[tuple[int, dict[str, Any] | str]]:
+    header: Optional[list[str]] = None
+    record, start = "", 0
+    async for line_no, line in _iter_lines(request):
+        # 引号内的换行属于字段内容，引号数量为奇数时记录尚未结束
+        if record:
+            record += "\n" + line
+        else:
+            record, start = line, line_no
+        if record.count('"') % 2:
+            if len(record) > IMPORT_MAX_LINE_LENGTH:
+                raise ImportAborted(start, f"单行长度超过 {IMPORT_MAX_LINE_LENGTH} 个字符")
+            continue
+        text, record = record, ""
+        if not text.strip():
+            continue
+        values = next(csv.reader([text]))
+        if header is None:
+            header = [name.strip() for name in values]
+            continue
+        if len(values) != len(header):
+            yield start, f"列数（{len(values)}）与表头（{len(header)}）不一致"
+            continue
+        yield start, {name: value for name, value in zip(header, values) if value != ""}
+    if record:
+        raise ImportAborted(start, "引号未闭合")
+    if header is None:
+        raise ImportAborted(1, "缺少表头")
+
+
+async def _iter_ndjson(request: Request) -> AsyncIterator[tuple[int, dict[str, Any] | str]]:
+    async for line_no, line in _iter_lines(request):
+        if not line.strip():
+            continue
+        try:
+            value = orjson.loads(line)
+        except orjson.JSONDecodeError as e:
+            yield line_no, f"JSON 格式错误: {e}"
+            continue
+        if not isinstance(value, dict):
+            yield line_no, "每行必须是一个 JSON 对象"
+            continue
+        yield line_no, value
+
+
+async def run_import(
+    request: Request,
+    format: ImportFormat,
+    process_batch: Callable[[list[tuple[int, dict[str, Any]]], ImportReport], Awaitable[None]],
+    batch_size: int = IMPORT_BATCH_SIZE,
+) -> dict[str, Any]:
+    """
+    流式解析请求体，每积累 batch_size 行调用一次 process_batch(batch, report)
+    batch 为 (行号, 字段字典) 列表，process_batch 负责校验、写入并在 report 中记录成功和失败的行
+    """
+    report = ImportReport()
+    records = _iter_csv(request) if format == ImportFormat.csv else _iter_ndjson(request)
+    batch: list[tuple[int, dict[str, Any]]] = []
+    try:
+        async for line_no, record in records:
+            report.total += 1
+            if isinstance(record, str):
+                report.fail(line_no, record)
+                continue
+            batch.append((line_no, record))
+            if len(batch) >= batch_size:
+                await process_batch(batch, report)
+                batch = []
+    except ImportAborted as e:
+        # 停止位置之前已解析的行仍然导入
+        report.aborted = {"line": e.line, "error": e.message}
+    if batch:
+        await process_batch(batch, report)
+    return report.result()
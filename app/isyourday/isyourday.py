@@ -1,47 +1,52 @@
-from fastapi import APIRouter, Depends, HTTPException, status, Form, Query, BackgroundTasks, UploadFile, Security
-from sqlmodel import col, select
-from pydantic import BaseModel
+from fastapi import APIRouter, Depends, HTTPException, status, Form, Query, BackgroundTasks, UploadFile, Security, Request
+from sqlmodel import select
+from fastapi.responses import StreamingResponse
+from pydantic import BaseModel, ValidationError
 from datetime import datetime
 import uuid
 from typing import Optional
 
-from ..db_manager import SessionDep
-from ..auth.utils import get_request_active_user
-from ..auth.models import User
-from ..models import PaginatedResponse
-from .models import EventPublic, VirtualUser, VirtualUserPublic, Event
+from ..bulk import bulk_delete, bulk_delete_where, existing_ids
+from ..exporter import ExportFormat, export_response
+from ..importer import ImportFormat, ImportReport, insert_rows, resolve_format, run_import, validation_message
+from ..db_manager import AsyncSessionDep, ReadSessionDep, read_engine
+from ..auth.utils import get_request_active_user, email_format_check
+from ..auth.models import Principal
+from ..models import PaginatedResponse, CountStrategy, SearchOrder
+from ..search import search
+from ..responses import ORJSONResponse
+from .models import EventPublic, VirtualUser, VirtualUserPublic, VirtualUserPartial, Event, EventPartial
 
 is_your_day_router = APIRouter(
     prefix="/isyourday",
     tags=["IsYourDay"],
 )
 
-@is_your_day_router.get("/users", response_model=PaginatedResponse[VirtualUser], summary="获取虚拟用户列表")
+@is_your_day_router.get("/users", response_model=PaginatedResponse[VirtualUserPartial], summary="获取虚拟用户列表")
 async def get_virtual_users(
-    session: SessionDep,
+    session: ReadSessionDep,
     skip: int = Query(0, ge=0, description="跳过的记录数"),
     limit: int = Query(default=10, le=100, description="返回的记录数"),
-    request_user: User = Security(get_request_active_user, scopes=["isyourday:read"]),
-) -> PaginatedResponse[VirtualUser]:
-    """获取虚拟用户列表"""
-    # 获取总数
-    total_query = select(VirtualUser)
-    total = len(session.exec(total_query).all())
-    
-    # 获取分页数据
-    users = session.exec(
-        select(VirtualUser).offset(skip).limit(limit)
-    ).all()
-    return PaginatedResponse[VirtualUser].create(list(users), skip, limit, total)
+    cursor: Optional[str] = Query(None, description="分页游标，传入上一页返回的 next_cursor 使用键集分页（此时忽略 skip）"),
+    count: CountStrategy = Query(CountStrategy.exact, description="总数统计方式：exact 精确计数，estimate 估算，none 不统计"),
+    fields: Optional[str] = Query(None, description="返回字段，逗号分隔（如 id,name），为空时返回全部字段"),
+    request_user: Principal = Security(get_request_active_user, scopes=["isyourday:read"]),
+) -> ORJSONResponse:
+    """获取虚拟用户列表，按 (created_at, id) 排序"""
+    page = await PaginatedResponse[VirtualUserPartial].from_query_async(
+        session, select(VirtualUser), skip, limit,
+        sort_key=(VirtualUser.created_at, VirtualUser.id), cursor=cursor, count=count, fields=fields
+    )
+    return page.to_response()
 
 @is_your_day_router.get("/user/{user_id}", response_model=VirtualUser, summary="获取单个虚拟用户")
 async def get_virtual_user(
     user_id: uuid.UUID,
-    session: SessionDep,
-    request_user: User = Security(get_request_active_user, scopes=["isyourday:read"]),
+    session: ReadSessionDep,
+    request_user: Principal = Security(get_request_active_user, scopes=["isyourday:read"]),
 ) -> VirtualUser:
     """根据ID获取单个虚拟用户"""
-    user = session.get(VirtualUser, user_id)
+    user = await session.get(VirtualUser, user_id)
     if not user:
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND,
@@ -52,18 +57,18 @@ async def get_virtual_user(
 @is_your_day_router.post("/user", summary="创建虚拟用户")
 async def create_virtual_user(
     user_data: list[VirtualUserPublic],
-    session: SessionDep,
-    request_user: User = Security(get_request_active_user, scopes=["isyourday:write"]),
+    session: AsyncSessionDep,
+    request_user: Principal = Security(get_request_active_user, scopes=["isyourday:write"]),
 ) -> list[VirtualUser]:
     """创建新的虚拟用户"""
     db_users = []
     # 检查邮箱是否已存在
     for data in user_data:
-        existing_user = session.exec(
+        existing_user = (await session.exec(
             select(VirtualUser).where(
                 VirtualUser.email == data.email
             )
-        ).first()
+        )).first()
         if existing_user:
             raise HTTPException(
                 status_code=status.HTTP_400_BAD_REQUEST,
@@ -74,20 +79,157 @@ async def create_virtual_user(
         db_user = VirtualUser(**data.model_dump())
         session.add(db_user)
         db_users.append(db_user)
-    session.commit()
+    await session.commit()
     for db_user in db_users:
-        session.refresh(db_user)
+        await session.refresh(db_user)
     return db_users
 
 
-@is_your_day_router.get("/users/search", response_model=PaginatedResponse[VirtualUser], summary="搜索虚拟用户")
+@is_your_day_router.post("/users/import", summary="批量导入虚拟用户")
+async def import_virtual_users(
+    request: Request,
+    session: AsyncSessionDep,
+    format: Optional[ImportFormat] = Query(None, description="数据格式：csv 或 ndjson，为空时根据 Content-Type 判断"),
+    request_user: Principal = Security(get_request_active_user, scopes=["isyourday:write"]),
+) -> dict:
+    """
+    从请求体流式导入虚拟用户，字段与创建虚拟用户接口一致，CSV 第一行为表头
+    每批导入后立即提交，邮箱已存在或格式错误的行跳过并在结果中列出
+    """
+    async def process_batch(batch: list[tuple[int, dict]], report: ImportReport) -> None:
+        rows = []
+        for line, record in batch:
+            try:
+                data = VirtualUserPublic.model_validate(record)
+            except ValidationError as e:
+                report.fail(line, validation_message(e))
+                continue
+            if not email_format_check(data.email):
+                report.fail(line, "无效的邮箱格式")
+                continue
+            rows.append((line, data))
+        
+        # 之前批次导入的用户已提交，一次查询即可检查整批邮箱
+        registered = set((await session.exec(
+            select(VirtualUser.email).where(VirtualUser.email.in_([data.email for _, data in rows]))
+        )).all())
+        db_users = []
+        now = datetime.now()
+        for line, data in rows:
+            if data.email in registered:
+                report.fail(line, "邮箱已被注册")
+                continue
+            registered.add(data.email)
+            db_users.append((line, {**data.model_dump(), "id": uuid.uuid4(), "created_at": now, "updated_at": now}))
+        
+        await insert_rows(session, VirtualUser, db_users, report)
+    
+    return await run_import(request, resolve_format(request, format), process_batch)
+
+
+@is_your_day_router.post("/events/import", summary="批量导入用户事件")
+async def import_user_events(
+    request: Request,
+    session: AsyncSessionDep,
+    format: Optional[ImportFormat] = Query(None, description="数据格式：csv 或 ndjson，为空时根据 Content-Type 判断"),
+    request_user: Principal = Security(get_request_active_user, scopes=["isyourday:write"]),
+) -> dict:
+    """
+    从请求体流式导入事件，字段与创建用户事件接口一致，另需 user_id 或 user_email 指定所属虚拟用户
+    每批导入后立即提交，所属虚拟用户不存在或数据错误的行跳过并在结果中列出
+    """
+    async def process_batch(batch: list[tuple[int, dict]], report: ImportReport) -> None:
+        rows = []
+        for line, record in batch:
+            try:
+                data = EventPublic.model_validate(record)
+                user_id = uuid.UUID(str(record["user_id"])) if record.get("user_id") else None
+            except ValidationError as e:
+                report.fail(line, validation_message(e))
+                continue
+            except ValueError:
+                report.fail(line, "user_id 格式错误")
+                continue
+            user_email = record.get("user_email")
+            if user_id is None and not user_email:
+                report.fail(line, "缺少 user_id 或 user_email")
+                continue
+            rows.append((line, data, user_id, user_email))
+        
+        # 整批解析所属虚拟用户
+        user_ids = await existing_ids(session, VirtualUser, [user_id for _, _, user_id, _ in rows if user_id])
+        emails = [user_email for _, _, user_id, user_email in rows if not user_id]
+        email_to_id = dict((await session.exec(
+            select(VirtualUser.email, VirtualUser.id).where(VirtualUser.email.in_(emails))
+        )).all()) if emails else {}
+        db_events = []
+        now = datetime.now()
+        for line, data, user_id, user_email in rows:
+            if user_id is None:
+                user_id = email_to_id.get(user_email)
+            elif user_id not in user_ids:
+                user_id = None
+            if user_id is None:
+                report.fail(line, "虚拟用户不存在")
+                continue
+            db_events.append((line, {**data.model_dump(), "id": uuid.uuid4(), "user_id": user_id, "created_at": now}))
+        
+        await insert_rows(session, Event, db_events, report)
+    
+    return await run_import(request, resolve_format(request, format), process_batch)
+
+
+@is_your_day_router.get("/users/export", response_class=StreamingResponse, summary="导出虚拟用户")
+async def export_virtual_users(
+    request: Request,
+    format: ExportFormat = Query(ExportFormat.ndjson, description="数据格式：csv 或 ndjson"),
+    gzip: bool = Query(False, description="是否以 gzip 压缩（下载 .gz 文件）"),
+    since: Optional[datetime] = Query(None, description="只导出在此时间及之后创建或更新的虚拟用户"),
+    request_user: Principal = Security(get_request_active_user, scopes=["isyourday:read"]),
+) -> StreamingResponse:
+    """流式导出全部虚拟用户，按 (updated_at, id) 排序，可将最后一行的 updated_at 作为下次增量导出的 since"""
+    criteria = [VirtualUser.updated_at >= since] if since else []
+    return export_response(
+        VirtualUser, *criteria,
+        sort_key=(VirtualUser.updated_at, VirtualUser.id), format=format, filename="virtual_users",
+        gzip=gzip, bind=await read_engine(request),
+    )
+
+
+@is_your_day_router.get("/events/export", response_class=StreamingResponse, summary="导出用户事件")
+async def export_user_events(
+    request: Request,
+    format: ExportFormat = Query(ExportFormat.ndjson, description="数据格式：csv 或 ndjson"),
+    gzip: bool = Query(False, description="是否以 gzip 压缩（下载 .gz 文件）"),
+    since: Optional[datetime] = Query(None, description="只导出在此时间及之后创建的事件"),
+    user_id: Optional[uuid.UUID] = Query(None, description="只导出指定虚拟用户的事件"),
+    request_user: Principal = Security(get_request_active_user, scopes=["isyourday:read"]),
+) -> StreamingResponse:
+    """流式导出事件，按 (created_at, id) 排序"""
+    criteria = []
+    if since:
+        criteria.append(Event.created_at >= since)
+    if user_id:
+        criteria.append(Event.user_id == user_id)
+    return export_response(
+        Event, *criteria,
+        sort_key=(Event.created_at, Event.id), format=format, filename="events",
+        gzip=gzip, bind=await read_engine(request),
+    )
+
+
+@is_your_day_router.get("/users/search", response_model=PaginatedResponse[VirtualUserPartial], summary="搜索虚拟用户")
 async def search_virtual_users(
-    session: SessionDep,
+    session: ReadSessionDep,
     query: Optional[str] = Query(None, description="搜索关键词"),
     skip: int = Query(0, ge=0, description="跳过的记录数"),
     limit: int = Query(10, le=100, description="返回的记录数"),
-    request_user: User = Security(get_request_active_user, scopes=["isyourday:read"]),
-) -> PaginatedResponse[VirtualUser]:
+    cursor: Optional[str] = Query(None, description="分页游标，传入上一页返回的 next_cursor 使用键集分页（此时忽略 skip）"),
+    count: CountStrategy = Query(CountStrategy.exact, description="总数统计方式：exact 精确计数，estimate 估算，none 不统计"),
+    fields: Optional[str] = Query(None, description="返回字段，逗号分隔（如 id,name），为空时返回全部字段"),
+    order: SearchOrder = Query(SearchOrder.rank, description="排序方式：rank 按相关度（不支持游标分页），time 按创建时间"),
+    request_user: Principal = Security(get_request_active_user, scopes=["isyourday:read"]),
+) -> ORJSONResponse:
     """搜索虚拟用户"""
     if not request_user.is_superuser:
         raise HTTPException(
@@ -96,31 +238,28 @@ async def search_virtual_users(
         )
     
     if not query:
-        return PaginatedResponse[VirtualUser].create([], skip, limit, 0)
+        return PaginatedResponse[VirtualUserPartial].create([], skip, limit, 0).to_response()
     
     # 构建查询
-    search_query = select(VirtualUser).where(
-        col(VirtualUser.real_name).like(f"%{query}%")
-    )
-    
-    # 获取总数
-    total = len(session.exec(search_query).all())
+    search_query = search(session, select(VirtualUser), VirtualUser, query)
     
-    # 获取分页数据
-    users = session.exec(search_query.offset(skip).limit(limit)).all()
-    
-    return PaginatedResponse[VirtualUser].create(list(users), skip, limit, total)
+    page = await PaginatedResponse[VirtualUserPartial].from_query_async(
+        session, search_query, skip, limit,
+        sort_key=(VirtualUser.created_at, VirtualUser.id) if order == SearchOrder.time else None,
+        cursor=cursor, count=count, fields=fields
+    )
+    return page.to_response()
 
 
 @is_your_day_router.patch("/user/{user_id}", summary="更新虚拟用户")
 async def update_virtual_user(
     user_id: uuid.UUID,
     user_data: VirtualUserPublic,
-    session: SessionDep,
-    request_user: User = Security(get_request_active_user, scopes=["isyourday:write"]),
+    session: AsyncSessionDep,
+    request_user: Principal = Security(get_request_active_user, scopes=["isyourday:write"]),
 ) -> VirtualUser:
     """更新虚拟用户信息"""
-    user = session.get(VirtualUser, user_id)
+    user = await session.get(VirtualUser, user_id)
     if not user:
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND,
@@ -129,9 +268,9 @@ async def update_virtual_user(
     
     # 如果更新邮箱，检查是否已存在
     if user_data.email and user_data.email != user.email:
-        existing_user = session.exec(
+        existing_user = (await session.exec(
             select(VirtualUser).where(VirtualUser.email == user_data.email)
-        ).first()
+        )).first()
         if existing_user:
             raise HTTPException(
                 status_code=status.HTTP_400_BAD_REQUEST,
@@ -144,15 +283,15 @@ async def update_virtual_user(
     user.sqlmodel_update(update_data)
     
     session.add(user)
-    session.commit()
-    session.refresh(user)
+    await session.commit()
+    await session.refresh(user)
     return user
 
 @is_your_day_router.delete("/users/batch", summary="批量删除删除虚拟用户")
 async def delete_virtual_user(
     user_id: list[uuid.UUID],
-    session: SessionDep,
-    request_user: User = Security(get_request_active_user, scopes=["isyourday:delete"]),
+    session: AsyncSessionDep,
+    request_user: Principal = Security(get_request_active_user, scopes=["isyourday:delete"]),
 ) -> dict:
     """删除虚拟用户"""
     if not request_user.is_superuser:
@@ -160,28 +299,34 @@ async def delete_virtual_user(
             status_code=status.HTTP_403_FORBIDDEN,
             detail="此操作需要管理员权限"
         )
-    for uid in user_id:
-        user = session.get(VirtualUser, uid)
-        if not user:
-            raise HTTPException(
-                status_code=status.HTTP_404_NOT_FOUND,
-                detail="用户不存在"
-            )
-        session.delete(user)
-    session.commit()
+    found = await existing_ids(session, VirtualUser, user_id)
+    if len(found) != len(set(user_id)):
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="用户不存在"
+        )
+    # 先删除用户的事件，再删除用户
+    await bulk_delete_where(session, Event, Event.user_id, found)
+    await bulk_delete(session, VirtualUser, found)
+    await session.commit()
     return {"message": "成功删除用户"}
 
 
-@is_your_day_router.get("/user/{user_id}/events", response_model=PaginatedResponse[Event], summary="获取用户事件列表")
+@is_your_day_router.get("/user/{user_id}/events", response_model=PaginatedResponse[EventPartial], summary="获取用户事件列表")
 async def get_user_events(
     user_id: uuid.UUID,
-    session: SessionDep,
+    session: ReadSessionDep,
     skip: int = Query(0, ge=0, description="跳过的记录数"),
     limit: int = Query(10, le=100, description="返回的记录数"),
-    request_user: User = Security(get_request_active_user, scopes=["isyourday:read"]),
-) -> PaginatedResponse[Event]:
+    cursor: Optional[str] = Query(None, description="分页游标，传入上一页返回的 next_cursor 使用键集分页（此时忽略 skip）"),
+    count: CountStrategy = Query(CountStrategy.exact, description="总数统计方式：exact 精确计数，estimate 估算，none 不统计"),
+    fields: Optional[str] = Query(None, description="返回字段，逗号分隔（如 id,name），为空时返回全部字段"),
+    q: Optional[str] = Query(None, description="搜索事件标题和描述的关键词"),
+    order: SearchOrder = Query(SearchOrder.rank, description="排序方式：rank 按相关度，仅在指定 q 时生效（不支持游标分页），time 按创建时间"),
+    request_user: Principal = Security(get_request_active_user, scopes=["isyourday:read"]),
+) -> ORJSONResponse:
     """获取指定用户的事件列表"""
-    user = session.get(VirtualUser, user_id)
+    user = await session.get(VirtualUser, user_id)
     if not user:
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND,
@@ -190,24 +335,28 @@ async def get_user_events(
     
     # 构建查询
     events_query = select(Event).where(Event.user_id == user_id)
+    sort_key = (Event.created_at, Event.id)
+    if q:
+        events_query = search(session, events_query, Event, q)
+        if order == SearchOrder.rank:
+            sort_key = None
     
-    # 获取总数
-    total = len(session.exec(events_query).all())
-    
-    # 获取分页数据
-    events = session.exec(events_query.offset(skip).limit(limit)).all()
-    return PaginatedResponse[Event].create(list(events), skip, limit, total)
+    page = await PaginatedResponse[EventPartial].from_query_async(
+        session, events_query, skip, limit,
+        sort_key=sort_key, cursor=cursor, count=count, fields=fields
+    )
+    return page.to_response()
 
 
 @is_your_day_router.post("/user/{user_id}/events", summary="创建用户事件")
 async def create_user_event(
     user_id: uuid.UUID,
     event_data: EventPublic,
-    session: SessionDep,
-    request_user: User = Security(get_request_active_user, scopes=["isyourday:write"]),
+    session: AsyncSessionDep,
+    request_user: Principal = Security(get_request_active_user, scopes=["isyourday:write"]),
 ) -> Event:
     """为指定用户创建事件"""
-    user = session.get(VirtualUser, user_id)
+    user = await session.get(VirtualUser, user_id)
     if not user:
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND,
@@ -216,8 +365,8 @@ async def create_user_event(
     
     event = Event(**event_data.model_dump(), user_id=user_id)
     session.add(event)
-    session.commit()
-    session.refresh(event)
+    await session.commit()
+    await session.refresh(event)
     return event
 
 
@@ -225,11 +374,11 @@ async def create_user_event(
 async def delete_user_events(
     user_id: uuid.UUID,
     event_ids: list[uuid.UUID],
-    session: SessionDep,
-    request_user: User = Security(get_request_active_user, scopes=["isyourday:delete"]),
+    session: AsyncSessionDep,
+    request_user: Principal = Security(get_request_active_user, scopes=["isyourday:delete"]),
 ) -> dict:
     """批量删除指定用户的事件"""
-    user = session.get(VirtualUser, user_id)
+    user = await session.get(VirtualUser, user_id)
     if not user:
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND,
@@ -242,16 +391,16 @@ async def delete_user_events(
             detail="此操作需要管理员权限"
         )
     
-    for event_id in event_ids:
-        event = session.get(Event, event_id)
-        if not event or event.user_id != user_id:
-            raise HTTPException(
-                status_code=status.HTTP_404_NOT_FOUND,
-                detail=f"事件 {event_id} 不存在或不属于该用户"
-            )
-        session.delete(event)
+    found = await existing_ids(session, Event, event_ids, Event.user_id == user_id)
+    missing = next((event_id for event_id in event_ids if event_id not in found), None)
+    if missing is not None:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail=f"事件 {missing} 不存在或不属于该用户"
+        )
+    await bulk_delete(session, Event, found)
     
-    session.commit()
+    await session.commit()
     return {"message": "成功删除事件"}
 
 
@@ -260,18 +409,18 @@ async def update_user_event(
     user_id: uuid.UUID,
     event_id: uuid.UUID,
     event_data: EventPublic,
-    session: SessionDep,
-    request_user: User = Security(get_request_active_user, scopes=["isyourday:write"]),
+    session: AsyncSessionDep,
+    request_user: Principal = Security(get_request_active_user, scopes=["isyourday:write"]),
 ) -> Event:
     """更新指定用户的事件"""
-    user = session.get(VirtualUser, user_id)
+    user = await session.get(VirtualUser, user_id)
     if not user:
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND,
             detail="用户不存在"
         )
     
-    event = session.get(Event, event_id)
+    event = await session.get(Event, event_id)
     if not event or event.user_id != user_id:
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND,
@@ -282,7 +431,7 @@ async def update_user_event(
     event.sqlmodel_update(update_data)
     
     session.add(event)
-    session.commit()
-    session.refresh(event)
+    await session.commit()
+    await session.refresh(event)
     return event
     
\ No newline at end of file
@@ -1,8 +1,11 @@
-from sqlmodel import Relationship, SQLModel, Field
+from sqlmodel import Relationship, SQLModel, Field, Index
 from pydantic import BaseModel
 from datetime import datetime, timedelta
 import uuid
 
+from ..models import partial_model
+from ..search import searchable
+
 
 class VirtualUser(SQLModel, table=True):
     """ Virtual user model for isyourday project. """
@@ -72,6 +75,11 @@ class VirtualUser(SQLModel, table=True):
     )
 
 
+VirtualUserPartial = partial_model(VirtualUser)
+
+searchable(VirtualUser, "real_name")
+
+
 class VirtualUserPublic(BaseModel):
     """ Data model for creating a new virtual user. """
     real_name: str | None = None
@@ -88,6 +96,10 @@ class VirtualUserPublic(BaseModel):
     
 class Event(SQLModel, table=True):
     """ Event model for isyourday project. """
+    __table_args__ = (
+        # 按虚拟用户列出事件，按 (created_at, id) 排序
+        Index("ix_event_user_id_created_at", "user_id", "created_at", "id"),
+    )
     id: uuid.UUID = Field(
         default_factory=uuid.uuid4,
         primary_key=True,
@@ -126,6 +138,11 @@ class Event(SQLModel, table=True):
     )
 
 
+EventPartial = partial_model(Event)
+
+searchable(Event, "title", "description")
+
+
 class EventPublic(BaseModel):
     """ Data model for creating a new event. """
     title: str
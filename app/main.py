@@ -2,13 +2,17 @@ from fastapi import FastAPI
 from fastapi.middleware.cors import CORSMiddleware
 from fastapi.middleware.gzip import GZipMiddleware
 from contextlib import asynccontextmanager
+import asyncio
 
-from .db_manager import create_db_and_tables
+from .db_manager import create_db_and_tables, dispose_engines
 from .file.utils import init_file_storage
 from .middleware import UseTimeMiddleware
+from .responses import ORJSONResponse
 from .auth.auth import auth
+from .auth.smtp import smtp_pool
 from .file.file import file_manager_router
 from .isyourday.isyourday import is_your_day_router
+from .metrics import metrics_router
 
 from .settings import DOCS_TITLE, DOCS_DESCRIPTION, DOCS_TAG_METADATA
 
@@ -20,11 +24,14 @@ async def lifespan(app: FastAPI):
     init_file_storage()
     yield
     # Cleanup resources here
+    await dispose_engines()
+    await asyncio.to_thread(smtp_pool.close)
 
 app = FastAPI(
     lifespan=lifespan,
     title=DOCS_TITLE,
     description=DOCS_DESCRIPTION,
+    default_response_class=ORJSONResponse,
     )
 
 # Import Middlewares
@@ -48,3 +55,4 @@ UseTimeMiddleware.add_middleware(app)
 app.include_router(auth)
 app.include_router(file_manager_router)
 app.include_router(is_your_day_router)
+app.include_router(metrics_router)
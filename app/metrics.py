@@ -0,0 +1,72 @@
+"""
+运行指标
+以 JSON 形式输出当前 worker 进程的运行状态，每个 uvicorn worker 各自统计
+需要管理员权限，设置 METRICS_PUBLIC 后无需登录
+"""
+import os
+
+from fastapi import APIRouter, Depends, HTTPException, Security, status
+
+from .auth.attachments import attachment_cache
+from .auth.smtp import smtp_pool
+from .auth.models import Principal
+from .auth.utils import get_request_active_user, principal_cache, token_cache, password_limiter, username_buckets, ip_buckets
+from .db_manager import get_pool_status
+from .settings import METRICS_PUBLIC, SQL_POOL_SIZE, SQL_POOL_MAX_OVERFLOW, SQL_POOL_RECYCLE, SQL_POOL_TIMEOUT, SQL_POOL_PRE_PING
+
+
+async def require_superuser(request_user: Principal = Security(get_request_active_user)) -> None:
+    if not request_user.is_superuser:
+        raise HTTPException(
+            status_code=status.HTTP_403_FORBIDDEN,
+            detail="查看运行指标需要管理员权限"
+        )
+
+
+metrics_router = APIRouter(
+    prefix="/metrics",
+    tags=["运行指标"],
+    dependencies=[] if METRICS_PUBLIC else [Depends(require_superuser)],
+)
+
+
+@metrics_router.get("/db", summary="数据库连接池状态")
+async def get_db_metrics() -> dict:
+    """返回当前 worker 的连接池配置、已取出连接数、溢出连接数和获取连接的等待时间"""
+    return {
+        "pid": os.getpid(),
+        "config": {
+            "pool_size": SQL_POOL_SIZE,
+            "max_overflow": SQL_POOL_MAX_OVERFLOW,
+            "pool_recycle": SQL_POOL_RECYCLE,
+            "pool_timeout": SQL_POOL_TIMEOUT,
+            "pool_pre_ping": SQL_POOL_PRE_PING,
+        },
+        "pools": get_pool_status(),
+    }
+
+
+@metrics_router.get("/auth", summary="认证缓存与准入控制状态")
+async def get_auth_metrics() -> dict:
+    """返回当前 worker 的令牌缓存和登录态用户缓存的命中统计（未命中登录态用户缓存时才会查询数据库），
+    以及密码哈希的排队情况和登录、注册频率限制的拒绝次数"""
+    return {
+        "pid": os.getpid(),
+        "token_cache": token_cache.stats(),
+        "principal_cache": principal_cache.stats(),
+        "password_hash": password_limiter.stats(),
+        "rate_limit": {
+            "username": username_buckets.stats(),
+            "ip": ip_buckets.stats(),
+        },
+    }
+
+
+@metrics_router.get("/email", summary="SMTP 连接池和附件缓存状态")
+async def get_email_metrics() -> dict:
+    """返回当前 worker 的 SMTP 连接池状态：空闲和正在发送的连接数、建立连接、断线重连和 NOOP 检查的次数，以及发送成功和失败的邮件数；已编码附件缓存的内存占用和命中次数"""
+    return {
+        "pid": os.getpid(),
+        "smtp_pool": smtp_pool.stats(),
+        "attachment_cache": attachment_cache.stats(),
+    }
@@ -0,0 +1,79 @@
+"""
+Alembic 迁移环境
+数据库地址与应用一致，取自 app.settings.SQL_BACKEND；模型元数据取自 SQLModel.metadata
+通过 dev.py 中的 alembic 命令运行（工作目录为 app/）
+"""
+import os
+import sys
+from logging.config import fileConfig
+from pathlib import Path
+
+from sqlalchemy import create_engine, pool
+from sqlmodel import SQLModel
+
+from alembic import context
+
+config = context.config
+
+# 日志配置需在切换工作目录之前读取（alembic.ini 以相对路径给出）
+if config.config_file_name is not None:
+    fileConfig(config.config_file_name)
+
+# 确保项目根目录在Python路径中，并切换到项目根目录，使相对路径的 SQLite 数据库与应用一致
+project_root = Path(__file__).resolve().parent.parent.parent
+if str(project_root) not in sys.path:
+    sys.path.insert(0, str(project_root))
+os.chdir(project_root)
+
+from app.settings import SQL_BACKEND
+from app.search import SEARCH_TABLE_PREFIX
+# 导入所有数据表模型，使其注册到 SQLModel.metadata
+import app.auth.models  # noqa: F401
+import app.file.models  # noqa: F401
+import app.isyourday.models  # noqa: F401
+
+target_metadata = SQLModel.metadata
+
+
+def include_name(name, type_, parent_names) -> bool:
+    """全文检索索引表由 app.search 维护，不参与自动生成迁移"""
+    if type_ == "table":
+        return not name.startswith(SEARCH_TABLE_PREFIX)
+    return True
+
+
+def run_migrations_offline() -> None:
+    """离线模式：只生成 SQL 脚本，不连接数据库"""
+    context.configure(
+        url=SQL_BACKEND,
+        target_metadata=target_metadata,
+        literal_binds=True,
+        dialect_opts={"paramstyle": "named"},
+        include_name=include_name,
+        render_as_batch=SQL_BACKEND.startswith("sqlite"),
+    )
+
+    with context.begin_transaction():
+        context.run_migrations()
+
+
+def run_migrations_online() -> None:
+    """在线模式：连接数据库执行迁移"""
+    connectable = create_engine(SQL_BACKEND, poolclass=pool.NullPool)
+
+    with connectable.connect() as connection:
+        context.configure(
+            connection=connection,
+            target_metadata=target_metadata,
+            include_name=include_name,
+            render_as_batch=connection.dialect.name == "sqlite",
+        )
+
+        with context.begin_transaction():
+            context.run_migrations()
+
+
+if context.is_offline_mode():
+    run_migrations_offline()
+else:
+    run_migrations_online()
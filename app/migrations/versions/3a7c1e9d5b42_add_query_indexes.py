@@ -0,0 +1,57 @@
+"""为热点查询添加复合索引
+
+Revision ID: 3a7c1e9d5b42
+Revises:
+Create Date: 2026-10-18 10:00:00.000000
+
+基础数据表由 create_db_and_tables 创建，本迁移只补充与实际查询条件对应的复合索引：
+列表接口按 (时间, id) 排序，索引包含排序列，分页时不需要临时排序：
+- filedb: 按上传者列出文件 (uploader_id, upload_time, id)，公开文件 (is_public, upload_time, id)
+- event: 按虚拟用户列出事件 (user_id, created_at, id)
+- challengecodedb: 激活码校验 (call_from, code)，重发激活邮件 (user_id, call_from)
+- emailsendhistory: 按发送者查询发送历史 (sender_id, sent_at, id)
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+import sqlmodel
+
+
+# revision identifiers, used by Alembic.
+revision: str = '3a7c1e9d5b42'
+down_revision: Union[str, Sequence[str], None] = None
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+INDEXES = [
+    ("ix_filedb_uploader_id_upload_time", "filedb", ["uploader_id", "upload_time", "id"]),
+    ("ix_filedb_is_public_upload_time_id", "filedb", ["is_public", "upload_time", "id"]),
+    ("ix_event_user_id_created_at", "event", ["user_id", "created_at", "id"]),
+    ("ix_challengecodedb_call_from_code", "challengecodedb", ["call_from", "code"]),
+    ("ix_challengecodedb_user_id_call_from", "challengecodedb", ["user_id", "call_from"]),
+    ("ix_emailsendhistory_sender_id_sent_at_id", "emailsendhistory", ["sender_id", "sent_at", "id"]),
+]
+
+# 本迁移早期版本创建的、不覆盖排序的索引，已执行过早期版本的数据库升级时删除
+SUPERSEDED_INDEXES = [
+    ("ix_filedb_uploader_id_is_public", "filedb"),
+    ("ix_filedb_is_public_upload_time", "filedb"),
+    ("ix_event_user_id_start_time", "event"),
+    ("ix_emailsendhistory_sender_id_sent_at", "emailsendhistory"),
+]
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    # 新数据库中 create_all 已经创建了这些索引，因此使用 if_not_exists
+    for name, table, columns in INDEXES:
+        op.create_index(name, table, columns, unique=False, if_not_exists=True)
+    for name, table in SUPERSEDED_INDEXES:
+        op.drop_index(name, table_name=table, if_exists=True)
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    for name, table, _ in reversed(INDEXES):
+        op.drop_index(name, table_name=table, if_exists=True)
@@ -0,0 +1,32 @@
+"""添加全文检索索引表
+
+Revision ID: 8f2d6b0c41e7
+Revises: 3a7c1e9d5b42
+Create Date: 2026-10-18 14:00:00.000000
+
+为文件、用户、虚拟用户、事件和邮件发送历史创建全文检索索引表（见 app.search），并根据已有数据建立索引
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+import sqlmodel
+
+from app.search import create_search_indexes, drop_search_indexes
+
+
+# revision identifiers, used by Alembic.
+revision: str = '8f2d6b0c41e7'
+down_revision: Union[str, Sequence[str], None] = '3a7c1e9d5b42'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    create_search_indexes(op.get_bind())
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    drop_search_indexes(op.get_bind())
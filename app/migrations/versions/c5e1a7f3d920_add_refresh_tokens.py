@@ -0,0 +1,50 @@
+"""添加刷新令牌表
+
+Revision ID: c5e1a7f3d920
+Revises: 8f2d6b0c41e7
+Create Date: 2026-10-18 16:00:00.000000
+
+refreshtokendb 保存刷新令牌的 SHA-256 摘要，token_hash 上的唯一索引用于刷新和吊销时的查找
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+import sqlmodel
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'c5e1a7f3d920'
+down_revision: Union[str, Sequence[str], None] = '8f2d6b0c41e7'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    # 新数据库中 create_all 已经创建了该表，因此使用 if_not_exists
+    op.create_table(
+        'refreshtokendb',
+        sa.Column('id', sa.Uuid(), nullable=False),
+        sa.Column('token_hash', sqlmodel.sql.sqltypes.AutoString(), nullable=False),
+        sa.Column('family_id', sa.Uuid(), nullable=False),
+        sa.Column('user_id', sa.Uuid(), nullable=False),
+        sa.Column('scopes', sqlmodel.sql.sqltypes.AutoString(), nullable=False),
+        sa.Column('created_at', sa.DateTime(), nullable=False),
+        sa.Column('expires_at', sa.DateTime(), nullable=False),
+        sa.Column('revoked_at', sa.DateTime(), nullable=True),
+        sa.ForeignKeyConstraint(['user_id'], ['user.id'], ondelete='CASCADE'),
+        sa.PrimaryKeyConstraint('id'),
+        if_not_exists=True,
+    )
+    op.create_index(op.f('ix_refreshtokendb_token_hash'), 'refreshtokendb', ['token_hash'], unique=True, if_not_exists=True)
+    op.create_index(op.f('ix_refreshtokendb_family_id'), 'refreshtokendb', ['family_id'], unique=False, if_not_exists=True)
+    op.create_index(op.f('ix_refreshtokendb_user_id'), 'refreshtokendb', ['user_id'], unique=False, if_not_exists=True)
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_index(op.f('ix_refreshtokendb_user_id'), table_name='refreshtokendb', if_exists=True)
+    op.drop_index(op.f('ix_refreshtokendb_family_id'), table_name='refreshtokendb', if_exists=True)
+    op.drop_index(op.f('ix_refreshtokendb_token_hash'), table_name='refreshtokendb', if_exists=True)
+    op.drop_table('refreshtokendb', if_exists=True)
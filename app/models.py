@@ -1,19 +1,175 @@
 # 通用分页响应模型
-from typing import List, TypeVar, Generic
+import base64
+import json
+from datetime import datetime
+from enum import Enum
+from typing import Any, Callable, List, Optional, Sequence, TypeVar, Generic
 
-from pydantic import BaseModel, Field
+from fastapi import HTTPException, status
+from pydantic import BaseModel, ConfigDict, Field, create_model, model_serializer
+from sqlalchemy import DateTime, Table, and_, func, or_, text
+from sqlmodel import Session, select
+from sqlmodel.ext.asyncio.session import AsyncSession
+
+from .cache import TTLCache
+from .responses import ORJSONResponse
+from .settings import PAGINATION_COUNT_CACHE_TTL, PAGINATION_COUNT_CACHE_SIZE
 
 T = TypeVar('T')
 
+_count_cache = TTLCache(maxsize=PAGINATION_COUNT_CACHE_SIZE, ttl=PAGINATION_COUNT_CACHE_TTL)
+
+
+class CountStrategy(str, Enum):
+    """分页总数统计方式"""
+    exact = "exact"
+    estimate = "estimate"
+    none = "none"
+
+
+class SearchOrder(str, Enum):
+    """搜索结果排序方式"""
+    rank = "rank"
+    time = "time"
+
+
+def encode_cursor(values: Sequence[Any]) -> str:
+    """将排序键的取值编码为不透明的游标字符串"""
+    raw = json.dumps(
+        [value.isoformat() if isinstance(value, datetime) else str(value) for value in values],
+        separators=(",", ":"),
+    )
+    return base64.urlsafe_b64encode(raw.encode("utf-8")).decode("ascii").rstrip("=")
+
+
+def decode_cursor(cursor: str, sort_key: Sequence[Any]) -> list[Any]:
+    """解析游标字符串，按排序键各列的类型还原取值"""
+    try:
+        padded = cursor + "=" * (-len(cursor) % 4)
+        raw = json.loads(base64.urlsafe_b64decode(padded.encode("ascii")))
+        if not isinstance(raw, list) or len(raw) != len(sort_key):
+            raise ValueError("cursor length mismatch")
+        values = []
+        for column, value in zip(sort_key, raw):
+            if isinstance(column.type, DateTime):
+                values.append(datetime.fromisoformat(value))
+            else:
+                values.append(column.type.python_type(value))
+        return values
+    except Exception:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="无效的分页游标"
+        )
+
+
+def keyset_condition(sort_key: Sequence[Any], values: Sequence[Any], descending: bool = False):
+    """构建键集分页条件 (a, b) > (x, y)，展开为 OR/AND 以便在各数据库上使用索引"""
+    conditions = []
+    for i, column in enumerate(sort_key):
+        equals = [sort_key[j] == values[j] for j in range(i)]
+        compare = column < values[i] if descending else column > values[i]
+        conditions.append(and_(*equals, compare))
+    return or_(*conditions)
+
+
+def _table_statistics_count(session: Session, query: Any) -> Optional[int]:
+    """对无过滤条件的单表查询读取数据库的表统计信息，无法使用时返回 None"""
+    froms = query.get_final_froms()
+    if query.whereclause is not None or len(froms) != 1 or not isinstance(froms[0], Table):
+        return None
+    table_name = froms[0].name
+    dialect = session.get_bind().dialect.name
+    if dialect == "mysql":
+        return session.exec(
+            text(
+                "SELECT TABLE_ROWS FROM information_schema.TABLES "
+                "WHERE TABLE_SCHEMA = DATABASE() AND TABLE_NAME = :name"
+            ).bindparams(name=table_name)
+        ).scalar()
+    if dialect == "sqlite":
+        return session.exec(text(f'SELECT max(rowid) FROM "{table_name}"')).scalar() or 0
+    return None
+
+
+def count_query(session: Session, query: Any, strategy: CountStrategy = CountStrategy.exact) -> Optional[int]:
+    """按指定策略统计查询结果总数
+
+    exact: 对同一过滤条件的子查询执行 SELECT COUNT(*)
+    estimate: 无过滤条件时读取表统计信息，否则使用短时间缓存的精确计数
+    none: 不统计，返回 None
+    """
+    if strategy == CountStrategy.none:
+        return None
+
+    count_stmt = select(func.count()).select_from(query.order_by(None).subquery())
+    if strategy == CountStrategy.exact:
+        return session.exec(count_stmt).one()
+
+    estimated = _table_statistics_count(session, query)
+    if estimated is not None:
+        return int(estimated)
+
+    compiled = count_stmt.compile(dialect=session.get_bind().dialect)
+    cache_key = (str(compiled), tuple(sorted((k, repr(v)) for k, v in compiled.params.items())))
+    total = _count_cache.get(cache_key)
+    if total is None:
+        total = session.exec(count_stmt).one()
+        _count_cache.set(cache_key, total)
+    return total
+
+
+class PartialModel(BaseModel):
+    """部分字段响应模型的基类，序列化时只输出实际赋值过的字段"""
+    model_config = ConfigDict(from_attributes=True)
+
+    @model_serializer(mode="wrap")
+    def _serialize_set_fields(self, handler):
+        data = handler(self)
+        return {key: value for key, value in data.items() if key in self.model_fields_set}
+
+
+def partial_model(model: type[BaseModel]) -> type[PartialModel]:
+    """根据数据表模型生成所有字段可选的部分响应模型，用于 fields= 稀疏字段查询"""
+    columns = model.__table__.columns.keys()  # type: ignore[attr-defined]
+    return create_model(
+        f"{model.__name__}Partial",
+        __base__=PartialModel,
+        __doc__=f"{model.__name__} 的部分字段响应模型",
+        **{
+            name: (Optional[field.annotation], Field(default=None, description=field.description))
+            for name, field in model.model_fields.items()
+            if name in columns
+        },
+    )
+
+
+def parse_fields(model: Any, fields: Optional[str]) -> Optional[list[str]]:
+    """解析逗号分隔的字段列表，校验字段是否存在，并始终包含 id"""
+    if not fields:
+        return None
+    columns = model.__table__.columns.keys()
+    requested = [name.strip() for name in fields.split(",") if name.strip()]
+    unknown = [name for name in requested if name not in columns]
+    if unknown:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=f"未知的字段: {', '.join(unknown)}"
+        )
+    return list(dict.fromkeys(["id", *requested]))
+
+
 class PaginationInfo(BaseModel):
     """分页信息"""
     skip: int = Field(description="跳过的记录数")
     limit: int = Field(description="当前页记录数")
-    total: int = Field(description="总记录数")
+    total: Optional[int] = Field(description="总记录数，count=none 时为空")
     page: int = Field(description="当前页码 (从1开始)")
-    total_pages: int = Field(description="总页数")
+    total_pages: Optional[int] = Field(description="总页数，count=none 时为空")
     has_next: bool = Field(description="是否有下一页")
     has_prev: bool = Field(description="是否有上一页")
+    next_cursor: Optional[str] = Field(default=None, description="下一页游标，传入 cursor 参数以使用键集分页")
+    count_strategy: CountStrategy = Field(default=CountStrategy.exact, description="total 的统计方式")
 
 class PaginatedResponse(BaseModel, Generic[T]):
     """通用分页响应模型"""
@@ -21,10 +177,27 @@ class PaginatedResponse(BaseModel, Generic[T]):
     pagination: PaginationInfo = Field(description="分页信息")
     
     @classmethod
-    def create(cls, items: List[T], skip: int, limit: int, total: int):
-        """创建分页响应"""
+    def create(
+        cls,
+        items: List[T],
+        skip: int,
+        limit: int,
+        total: Optional[int],
+        next_cursor: Optional[str] = None,
+        has_next: Optional[bool] = None,
+        has_prev: Optional[bool] = None,
+        count_strategy: CountStrategy = CountStrategy.exact,
+        validate: bool = True,
+    ):
+        """创建分页响应，游标分页或不统计总数时由调用方给出 has_next/has_prev
+
+        validate=False 时不对 items 做 pydantic 校验，用于已从数据库加载的记录。
+        """
         page = (skip // limit) + 1 if limit > 0 else 1
-        total_pages = ((total - 1) // limit) + 1 if limit > 0 and total > 0 else 1
+        if total is None:
+            total_pages = None
+        else:
+            total_pages = ((total - 1) // limit) + 1 if limit > 0 and total > 0 else 1
         
         pagination = PaginationInfo(
             skip=skip,
@@ -32,8 +205,97 @@ class PaginatedResponse(BaseModel, Generic[T]):
             total=total,
             page=page,
             total_pages=total_pages,
-            has_next=skip + limit < total,
-            has_prev=skip > 0
+            has_next=skip + limit < (total or 0) if has_next is None else has_next,
+            has_prev=skip > 0 if has_prev is None else has_prev,
+            next_cursor=next_cursor,
+            count_strategy=count_strategy
         )
         
+        if not validate:
+            return cls.model_construct(items=items, pagination=pagination)
         return cls(items=items, pagination=pagination)
+
+    def to_response(self) -> ORJSONResponse:
+        """直接以 orjson 序列化分页结果，跳过 FastAPI 对响应模型的再次校验"""
+        return ORJSONResponse({"items": self.items, "pagination": self.pagination.model_dump()})
+
+    @classmethod
+    def from_query(
+        cls,
+        session: Session,
+        query: Any,
+        skip: int,
+        limit: int,
+        transform: Optional[Callable[[Any], T]] = None,
+        sort_key: Optional[Sequence[Any]] = None,
+        descending: bool = False,
+        cursor: Optional[str] = None,
+        count: CountStrategy = CountStrategy.exact,
+        fields: Optional[str] = None,
+    ):
+        """根据查询语句创建分页响应
+
+        总数通过对同一过滤条件的子查询执行 SELECT COUNT(*) 获得，不再加载全部记录；
+        当跳过的记录数已超过总数时不再执行分页查询。
+        transform 用于将数据库记录转换为响应模型（如 UserPublic.from_user）。
+
+        指定 sort_key（如 (FileDB.upload_time, FileDB.id)）时按该键稳定排序并返回 next_cursor；
+        传入 cursor 时改用键集分页，从游标位置继续读取并忽略 skip。
+
+        count 控制总数统计方式，见 count_query；has_next 始终通过多读取一条记录判断。
+
+        fields 为逗号分隔的字段名时只查询这些列（SELECT 投影），返回的记录为字典，
+        此时 cls 应使用对应的部分响应模型（见 partial_model）。
+
+        数据库记录不再经过 pydantic 校验，接口应返回 to_response() 的结果。
+        """
+        total = count_query(session, query, count)
+
+        entity = query.column_descriptions[0]["entity"]
+        selected = parse_fields(entity, fields)
+        fetch = session.exec
+        if selected:
+            # 投影查询返回多列的行记录，需要使用 execute 而非 exec（后者只取第一列）
+            projected = list(dict.fromkeys([*selected, *[column.key for column in sort_key or ()]]))
+            query = query.with_only_columns(*[getattr(entity, name) for name in projected])
+            fetch = session.execute
+
+        if sort_key:
+            query = query.order_by(None).order_by(
+                *[column.desc() if descending else column.asc() for column in sort_key]
+            )
+
+        if cursor and sort_key:
+            values = decode_cursor(cursor, sort_key)
+            rows = list(fetch(
+                query.where(keyset_condition(sort_key, values, descending)).limit(limit + 1)
+            ).all())
+            has_next = len(rows) > limit
+            items = rows[:limit]
+            has_prev = True
+        else:
+            rows = []
+            if limit > 0 and (count != CountStrategy.exact or total > skip):
+                rows = list(fetch(query.offset(skip).limit(limit + 1)).all())
+            has_next = len(rows) > limit
+            items = rows[:limit]
+            has_prev = skip > 0
+            if count == CountStrategy.estimate and items:
+                # 估算值不应小于已经读到的记录数
+                total = max(total, skip + len(items) + int(has_next))
+
+        next_cursor = None
+        if sort_key and has_next and items:
+            next_cursor = encode_cursor([getattr(items[-1], column.key) for column in sort_key])
+
+        if selected:
+            items = [{name: getattr(row, name) for name in selected} for row in items]
+        if transform is not None:
+            items = [transform(item) for item in items]
+
+        return cls.create(items, skip, limit, total, next_cursor, has_next, has_prev, count, validate=False)
+
+    @classmethod
+    async def from_query_async(cls, session: AsyncSession, query: Any, *args, **kwargs):
+        """from_query 的异步版本，参数相同，在 AsyncSession 底层的同步会话中执行"""
+        return await session.run_sync(lambda sync_session: cls.from_query(sync_session, query, *args, **kwargs))
@@ -0,0 +1,54 @@
+"""
+基于 orjson 的响应类与数据库记录快速序列化
+"""
+import pathlib
+from enum import Enum
+from typing import Any
+
+import orjson
+from fastapi.responses import JSONResponse
+from pydantic import BaseModel
+from sqlmodel import SQLModel
+
+# 每个数据表模型的列名缓存，避免每次序列化都遍历 __table__
+_column_keys: dict[type, tuple[str, ...]] = {}
+
+
+def row_to_dict(row: SQLModel) -> dict[str, Any]:
+    """将已从数据库加载的 SQLModel 记录直接转换为字典，不经过 pydantic 校验"""
+    cls = type(row)
+    keys = _column_keys.get(cls)
+    if keys is None:
+        keys = tuple(cls.__table__.columns.keys())  # type: ignore[attr-defined]
+        _column_keys[cls] = keys
+    return {key: getattr(row, key) for key in keys}
+
+
+def orjson_default(obj: Any) -> Any:
+    """orjson 无法原生序列化的类型的转换函数"""
+    if isinstance(obj, SQLModel) and hasattr(type(obj), "__table__"):
+        return row_to_dict(obj)
+    if isinstance(obj, BaseModel):
+        return obj.model_dump(mode="python")
+    if isinstance(obj, Enum):
+        return obj.value
+    if isinstance(obj, (set, frozenset)):
+        return list(obj)
+    if isinstance(obj, pathlib.PurePath):
+        return str(obj)
+    if isinstance(obj, bytes):
+        return obj.decode("utf-8", errors="replace")
+    raise TypeError(f"Object of type {type(obj).__name__} is not JSON serializable")
+
+
+def dumps(content: Any) -> bytes:
+    """使用 orjson 序列化内容"""
+    return orjson.dumps(content, default=orjson_default, option=orjson.OPT_NON_STR_KEYS)
+
+
+class ORJSONResponse(JSONResponse):
+    """使用 orjson 渲染的 JSON 响应，作为应用的默认响应类"""
+    media_type = "application/json"
+
+    def render(self, content: Any) -> bytes:
+        return dumps(content)
@@ -0,0 +1,330 @@
+"""
+全文检索
+为可搜索的实体维护倒排索引，记录增删改时在同一事务中同步更新：
+- SQLite 使用 FTS5 虚拟表，写入前按下述规则预先分词；FTS5 的 rowid 由另一张普通表按实体 id 分配，
+  以便按实体 id 更新和删除索引记录
+- MySQL 使用带 ngram 解析器的 FULLTEXT 索引，按实体 id 更新和删除索引记录
+- 其他数据库回退为 LIKE 查询
+
+分词规则：中日韩文字按单字和相邻二字切分，其余文字按单词切分并转为小写，HTML 标签会被去除
+"""
+import re
+import uuid
+from dataclasses import dataclass
+from typing import Any, Iterable, Mapping, Optional, Sequence
+
+from sqlalchemy import (
+    BigInteger, Column, Integer, MetaData, Table, Text, delete, event, false, inspect, insert,
+    literal_column, or_, select, text,
+)
+from sqlalchemy.engine import Connection, Engine
+from sqlalchemy.orm import Session
+
+# 索引表名前缀，Alembic 自动生成迁移时会忽略这些表
+SEARCH_TABLE_PREFIX = "search_"
+
+# 中日韩文字范围：假名、CJK 扩展 A、CJK 基本区、谚文音节、CJK 兼容区
+_CJK = r"\u3040-\u30ff\u3400-\u4dbf\u4e00-\u9fff\uac00-\ud7af\uf900-\ufaff"
+_TOKEN_RE = re.compile(rf"[{_CJK}]+|[^\W_{_CJK}]+")
+_CJK_RE = re.compile(rf"[{_CJK}]")
+_TAG_RE = re.compile(r"<[^>]+>")
+
+_metadata = MetaData()
+
+
+@dataclass(eq=False)
+class SearchIndex:
+    """实体与其索引表的对应关系，keys 为 SQLite 下实体 id 到 FTS5 rowid 的对应表"""
+    model: Any
+    fields: tuple[str, ...]
+    table: Table
+    keys: Table
+
+
+_registry: dict[type, SearchIndex] = {}
+
+
+def searchable(model: Any, *fields: str) -> SearchIndex:
+    """将数据表模型的若干文本字段登记为可搜索字段"""
+    table = Table(
+        f"{SEARCH_TABLE_PREFIX}{model.__tablename__}",
+        _metadata,
+        Column("rowid", BigInteger, primary_key=True),
+        Column("entity_id", model.__table__.c.id.type, nullable=False),
+        *[Column(name, Text) for name in fields],
+    )
+    keys = Table(
+        f"{table.name}_keys",
+        _metadata,
+        Column("rowid", Integer, primary_key=True),
+        Column("entity_id", model.__table__.c.id.type, nullable=False, unique=True),
+    )
+    index = SearchIndex(model=model, fields=fields, table=table, keys=keys)
+    _registry[model] = index
+    return index
+
+
+def is_searchable(model: Any) -> bool:
+    """实体是否登记了可搜索字段"""
+    return model in _registry
+
+
+def _normalize(value: Optional[str]) -> str:
+    """去除 HTML 标签并转为小写"""
+    return _TAG_RE.sub(" ", value or "").lower()
+
+
+def tokenize(value: Optional[str]) -> list[str]:
+    """将文本切分为索引词，中日韩文字先输出相邻二字（保持顺序以支持短语查询），再输出单字"""
+    tokens = []
+    for run in _TOKEN_RE.findall(_normalize(value)):
+        if _CJK_RE.match(run) and len(run) > 1:
+            tokens.extend(run[i:i + 2] for i in range(len(run) - 1))
+            tokens.extend(run)
+        else:
+            tokens.append(run)
+    return tokens
+
+
+def _fts5_query(q: str, fields: Sequence[str]) -> Optional[str]:
+    """构建 FTS5 查询表达式：中日韩文字按二字短语精确匹配，单词按前缀匹配，各词之间为 AND"""
+    terms = []
+    for run in _TOKEN_RE.findall(_normalize(q)):
+        if _CJK_RE.match(run) and len(run) > 1:
+            terms.append('"' + " ".join(run[i:i + 2] for i in range(len(run) - 1)) + '"')
+        elif _CJK_RE.match(run):
+            terms.append(f'"{run}"')
+        else:
+            terms.append(f'"{run}"*')
+    if not terms:
+        return None
+    return f"{{{' '.join(fields)}}} : ({' AND '.join(terms)})"
+
+
+def _mysql_query(q: str) -> Optional[str]:
+    """构建 MySQL 布尔模式查询表达式，ngram 解析器会将较长的词转换为短语匹配"""
+    terms = []
+    for run in _TOKEN_RE.findall(_normalize(q)):
+        if _CJK_RE.match(run) and len(run) > 1:
+            terms.append(f'+"{run}"')
+        else:
+            terms.append(f"+{run}*")
+    return " ".join(terms) or None
+
+
+def _create_table(conn: Connection, index: SearchIndex) -> None:
+    dialect = conn.dialect.name
+    name = index.table.name
+    if dialect == "sqlite":
+        columns = ", ".join(["entity_id UNINDEXED", *index.fields])
+        conn.execute(text(
+            f"CREATE VIRTUAL TABLE IF NOT EXISTS {name} "
+            f"USING fts5({columns}, tokenize='unicode61 remove_diacritics 0')"
+        ))
+        index.keys.create(conn, checkfirst=True)
+    elif dialect == "mysql":
+        # 每个字段单独建立全文索引，另建一个覆盖全部字段的索引，供按字段和全字段搜索使用
+        fulltext = [f"FULLTEXT INDEX ft_{name} ({', '.join(index.fields)}) WITH PARSER ngram"]
+        if len(index.fields) > 1:
+            fulltext += [f"FULLTEXT INDEX ft_{name}_{field} ({field}) WITH PARSER ngram" for field in index.fields]
+        columns = ", ".join(f"{field} LONGTEXT" for field in index.fields)
+        conn.execute(text(
+            f"CREATE TABLE IF NOT EXISTS {name} ("
+            f"rowid BIGINT AUTO_INCREMENT PRIMARY KEY, entity_id CHAR(32) NOT NULL, {columns}, "
+            f"UNIQUE INDEX uq_{name}_entity_id (entity_id), {', '.join(fulltext)}"
+            f") ENGINE=InnoDB DEFAULT CHARSET=utf8mb4"
+        ))
+
+
+def _table_names(conn: Connection, index: SearchIndex) -> list[str]:
+    """索引使用的全部表"""
+    if conn.dialect.name == "sqlite":
+        return [index.table.name, index.keys.name]
+    return [index.table.name]
+
+
+def _supported(conn: Connection) -> bool:
+    return conn.dialect.name in ("sqlite", "mysql")
+
+
+def _index_values(conn: Connection, index: SearchIndex, entity_id: uuid.UUID, values: Sequence[Optional[str]]) -> dict:
+    """生成一条索引记录"""
+    if conn.dialect.name == "sqlite":
+        texts = [" ".join(tokenize(value)) for value in values]
+    else:
+        texts = [_normalize(value) for value in values]
+    return {"entity_id": entity_id, **dict(zip(index.fields, texts))}
+
+
+def _delete_records(conn: Connection, index: SearchIndex, entity_ids: list[uuid.UUID]) -> None:
+    """按实体 id 删除索引记录，SQLite 下经由 keys 表找到 FTS5 的 rowid（FTS5 无法按普通列检索）"""
+    if conn.dialect.name == "sqlite":
+        rowids = select(index.keys.c.rowid).where(index.keys.c.entity_id.in_(entity_ids))
+        conn.execute(delete(index.table).where(index.table.c.rowid.in_(rowids)))
+    else:
+        conn.execute(delete(index.table).where(index.table.c.entity_id.in_(entity_ids)))
+
+
+def _write(conn: Connection, index: SearchIndex, rows: Iterable[tuple[uuid.UUID, Sequence[Optional[str]]]]) -> None:
+    """写入（覆盖）若干实体的索引记录"""
+    records = [_index_values(conn, index, entity_id, values) for entity_id, values in rows]
+    if not records:
+        return
+    entity_ids = [record["entity_id"] for record in records]
+    _delete_records(conn, index, entity_ids)
+    if conn.dialect.name == "sqlite":
+        # 为新实体分配 rowid，已有实体沿用原来的 rowid
+        conn.execute(insert(index.keys).prefix_with("OR IGNORE"), [{"entity_id": entity_id} for entity_id in entity_ids])
+        rowids = dict(conn.execute(
+            select(index.keys.c.entity_id, index.keys.c.rowid).where(index.keys.c.entity_id.in_(entity_ids))
+        ).all())
+        for record in records:
+            record["rowid"] = rowids[record["entity_id"]]
+    conn.execute(insert(index.table), records)
+
+
+def _remove(conn: Connection, index: SearchIndex, entity_ids: Iterable[uuid.UUID]) -> None:
+    """删除若干实体的索引记录"""
+    entity_ids = list(entity_ids)
+    if not entity_ids:
+        return
+    _delete_records(conn, index, entity_ids)
+    if conn.dialect.name == "sqlite":
+        conn.execute(delete(index.keys).where(index.keys.c.entity_id.in_(entity_ids)))
+
+
+def add_to_index(session: Session, model: Any, rows: Iterable[Mapping[str, Any]]) -> None:
+    """写入若干记录（列名到值的映射）的索引记录，用于绕过 ORM 的批量插入"""
+    index = _registry.get(model)
+    if index is None:
+        return
+    # 以插入语句取得连接，使读写分离的会话选择写引擎
+    conn = session.connection(bind_arguments={"clause": insert(index.table)})
+    if _supported(conn):
+        _write(conn, index, [(row["id"], [row.get(field) for field in index.fields]) for row in rows])
+
+
+def remove_from_index(session: Session, model: Any, entity_ids: Iterable[uuid.UUID]) -> None:
+    """删除指定实体的索引记录，用于绕过 ORM 的批量删除"""
+    index = _registry.get(model)
+    if index is None:
+        return
+    # 以删除语句取得连接，使读写分离的会话选择写引擎
+    conn = session.connection(bind_arguments={"clause": delete(index.table)})
+    if _supported(conn):
+        _remove(conn, index, entity_ids)
+
+
+def rebuild_index(conn: Connection, index: SearchIndex, batch_size: int = 1000) -> None:
+    """根据实体表重建索引"""
+    conn.execute(delete(index.table))
+    if conn.dialect.name == "sqlite":
+        conn.execute(delete(index.keys))
+    model_table = index.model.__table__
+    query = select(model_table.c.id, *[model_table.c[field] for field in index.fields])
+    batch = []
+    for row in conn.execute(query):
+        batch.append((row[0], row[1:]))
+        if len(batch) >= batch_size:
+            _write(conn, index, batch)
+            batch = []
+    _write(conn, index, batch)
+
+
+def _drop_tables(bind: Connection, index: SearchIndex) -> None:
+    for name in (index.table.name, index.keys.name):
+        bind.execute(text(f"DROP TABLE IF EXISTS {name}"))
+
+
+def create_search_indexes(bind: Engine | Connection) -> None:
+    """创建缺失的索引表，并根据已有数据建立索引"""
+    if isinstance(bind, Engine):
+        with bind.begin() as conn:
+            create_search_indexes(conn)
+        return
+    if not _supported(bind):
+        return
+    existing = set(inspect(bind).get_table_names())
+    for index in _registry.values():
+        if not existing.issuperset(_table_names(bind, index)):
+            # 缺少任一张表时整体重建，避免残留的索引记录无法按实体 id 更新
+            _drop_tables(bind, index)
+            _create_table(bind, index)
+            rebuild_index(bind, index)
+
+
+def drop_search_indexes(bind: Connection) -> None:
+    """删除全部索引表"""
+    for index in _registry.values():
+        _drop_tables(bind, index)
+
+
+def search(session: Session, query: Any, model: Any, q: str, fields: Optional[Sequence[str]] = None) -> Any:
+    """为查询语句添加全文检索条件，并按相关度排序（相关度相同时按 id 排序）
+
+    fields 限定搜索的字段，为空时搜索全部已登记字段；MySQL 下只支持单个字段或全部字段。
+    原查询的其他过滤条件（如权限约束）保持不变。
+    """
+    index = _registry[model]
+    fields = tuple(fields or index.fields)
+    table = index.table
+    dialect = session.get_bind().dialect.name
+
+    if dialect == "sqlite":
+        expression = _fts5_query(q, fields)
+        if expression is None:
+            return query.where(false())
+        hits = (
+            select(table.c.entity_id, literal_column("rank").label("rank"))
+            .where(literal_column(table.name).op("MATCH")(expression))
+            .subquery()
+        )
+    elif dialect == "mysql":
+        from sqlalchemy.dialects.mysql import match
+
+        expression = _mysql_query(q)
+        if expression is None:
+            return query.where(false())
+        score = match(*[table.c[field] for field in fields], against=expression).in_boolean_mode()
+        hits = select(table.c.entity_id, (-score).label("rank")).where(score > 0).subquery()
+    else:
+        pattern = f"%{q}%"
+        return query.where(or_(*[getattr(model, field).like(pattern) for field in fields])).order_by(model.id)
+
+    return query.join(hits, hits.c.entity_id == model.id).order_by(hits.c.rank, model.id)
+
+
+@event.listens_for(Session, "after_flush")
+def _sync_search_index(session: Session, flush_context: Any) -> None:
+    """在同一事务中同步新增、修改和删除的实体的索引记录"""
+    if not _registry:
+        return
+    changed: dict[SearchIndex, dict[uuid.UUID, Any]] = {}
+    removed: dict[SearchIndex, set[uuid.UUID]] = {}
+    for obj in session.new:
+        index = _registry.get(type(obj))
+        if index is not None:
+            changed.setdefault(index, {})[obj.id] = obj
+    for obj in session.dirty:
+        index = _registry.get(type(obj))
+        if index is not None:
+            state = inspect(obj)
+            if any(state.attrs[field].history.has_changes() for field in index.fields):
+                changed.setdefault(index, {})[obj.id] = obj
+    for obj in session.deleted:
+        index = _registry.get(type(obj))
+        if index is not None:
+            removed.setdefault(index, set()).add(obj.id)
+    if not changed and not removed:
+        return
+
+    conn = session.connection()
+    if not _supported(conn):
+        return
+    for index, objects in changed.items():
+        _write(conn, index, [
+            (entity_id, [getattr(obj, field) for field in index.fields])
+            for entity_id, obj in objects.items()
+        ])
+    for index, entity_ids in removed.items():
+        _remove(conn, index, entity_ids)
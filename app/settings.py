@@ -27,4 +27,56 @@ import os
 mysql_url = os.getenv("SQLALCHEMY_DATABASE_URL", sqlite_url)
 
 SQL_BACKEND = mysql_url
-SQL_DEBUG_ECHO = False
\ No newline at end of file
+# 异步数据库地址，未设置时根据 SQL_BACKEND 推导（sqlite 使用 aiosqlite，mysql 使用 aiomysql）
+SQL_ASYNC_BACKEND = os.getenv("SQLALCHEMY_ASYNC_DATABASE_URL")
+SQL_DEBUG_ECHO = False
+# 只读副本数据库地址，多个地址以逗号分隔；未设置时所有请求都使用主库
+SQL_REPLICA_BACKENDS = [url.strip() for url in os.getenv("SQLALCHEMY_REPLICA_DATABASE_URLS", "").split(",") if url.strip()]
+# 请求方写入后的该时间（秒）内，其只读请求仍使用主库以读到自己的写入，应大于副本的复制延迟
+SQL_REPLICA_STICKY_SECONDS = float(os.getenv("SQL_REPLICA_STICKY_SECONDS", 5))
+# Redis 地址，用于在多个工作进程之间共享状态；未设置时相应状态只在进程内保存
+REDIS_URL = os.getenv("REDIS_URL")
+
+# 数据库连接池配置，每个进程（uvicorn worker / Celery worker）各自持有一个连接池
+# 连接池大小和溢出上限
+SQL_POOL_SIZE = int(os.getenv("SQL_POOL_SIZE", 5))
+SQL_POOL_MAX_OVERFLOW = int(os.getenv("SQL_POOL_MAX_OVERFLOW", 10))
+# 连接回收时间（秒），应小于 MySQL 的 wait_timeout，避免使用已被服务端关闭的连接
+SQL_POOL_RECYCLE = int(os.getenv("SQL_POOL_RECYCLE", 1800))
+# 等待空闲连接的超时时间（秒）
+SQL_POOL_TIMEOUT = float(os.getenv("SQL_POOL_TIMEOUT", 30))
+# 取出连接前检测连接是否可用
+SQL_POOL_PRE_PING = os.getenv("SQL_POOL_PRE_PING", "true").lower() in ("1", "true", "yes")
+
+# SQLite 连接参数（仅在使用 SQLite 文件数据库时生效），在每个新连接上通过 PRAGMA 设置
+SQLITE_JOURNAL_MODE = os.getenv("SQLITE_JOURNAL_MODE", "WAL")
+SQLITE_SYNCHRONOUS = os.getenv("SQLITE_SYNCHRONOUS", "NORMAL")
+# 数据库被锁定时的等待时间（毫秒）
+SQLITE_BUSY_TIMEOUT = int(os.getenv("SQLITE_BUSY_TIMEOUT", 5000))
+# 内存映射大小（字节）
+SQLITE_MMAP_SIZE = int(os.getenv("SQLITE_MMAP_SIZE", 256 * 1024 * 1024))
+# 页缓存大小，负数表示以 KiB 为单位
+SQLITE_CACHE_SIZE = int(os.getenv("SQLITE_CACHE_SIZE", -64000))
+SQLITE_FOREIGN_KEYS = os.getenv("SQLITE_FOREIGN_KEYS", "true").lower() in ("1", "true", "yes")
+# 写事务经由单个写连接依次执行，等待写连接的超时时间（秒）
+SQLITE_WRITE_QUEUE = os.getenv("SQLITE_WRITE_QUEUE", "true").lower() in ("1", "true", "yes")
+SQLITE_WRITE_TIMEOUT = float(os.getenv("SQLITE_WRITE_TIMEOUT", 30))
+
+# 批量查询、删除时每条 IN (...) 语句包含的 id 数量上限，过大的参数列表会超出 SQLite 的参数上限或 MySQL 的 max_allowed_packet
+SQL_BULK_CHUNK_SIZE = int(os.getenv("SQL_BULK_CHUNK_SIZE", 500))
+
+# 流式导入（CSV / NDJSON）：每批校验和写入的行数、单行（CSV 记录）最大字符数、导入结果中列出的错误条目上限
+IMPORT_BATCH_SIZE = int(os.getenv("IMPORT_BATCH_SIZE", 1000))
+IMPORT_MAX_LINE_LENGTH = int(os.getenv("IMPORT_MAX_LINE_LENGTH", 1024 * 1024))
+IMPORT_MAX_REPORTED_ERRORS = int(os.getenv("IMPORT_MAX_REPORTED_ERRORS", 1000))
+
+# 流式导出：每次从数据库游标读取并写入响应的行数、gzip 压缩级别
+EXPORT_BATCH_SIZE = int(os.getenv("EXPORT_BATCH_SIZE", 1000))
+EXPORT_GZIP_LEVEL = int(os.getenv("EXPORT_GZIP_LEVEL", 6))
+
+# 分页总数估算（count=estimate）时缓存计数结果的时间（秒）和条目上限
+PAGINATION_COUNT_CACHE_TTL = int(os.getenv("PAGINATION_COUNT_CACHE_TTL", 30))
+PAGINATION_COUNT_CACHE_SIZE = int(os.getenv("PAGINATION_COUNT_CACHE_SIZE", 512))
+
+# /metrics 下的运行指标默认只有管理员可以查看；设为 true 时无需登录（仅应在指标接口不对外暴露时使用，如内网采集）
+METRICS_PUBLIC = os.getenv("METRICS_PUBLIC", "false").lower() in ("1", "true", "yes")
@@ -17,12 +17,15 @@ if str(project_root) not in sys.path:
 # 切换到项目根目录
 os.chdir(project_root)
 
+from app.auth.settings import EMAIL_PRIORITY_QUEUE, EMAIL_BULK_QUEUE
+
 celery_app = Celery(
     'app',
     backend=os.getenv('REDIS_BACKEND_URL'),
     broker=os.getenv('REDIS_BROKER_URL'),
     include=[
         'app.tasks.celery_tasks',
+        'app.tasks.email_tasks',
     ]
 )
 
@@ -37,6 +40,12 @@ celery_app.conf.update(
     worker_pool='threads',  # 在 Windows 上使用线程池而不是 eventlet
     worker_concurrency=4,   # 设置并发数
     task_always_eager=False,  # 确保任务异步执行
+    # 邮件任务分别进入优先队列和批量队列，见 app/tasks/email_tasks.py
+    task_routes={
+        'app.tasks.email_tasks.send_priority_email': {'queue': EMAIL_PRIORITY_QUEUE},
+        'app.tasks.email_tasks.send_bulk_email': {'queue': EMAIL_BULK_QUEUE},
+        'app.tasks.email_tasks.send_merged_emails': {'queue': EMAIL_BULK_QUEUE},
+    },
 )
 
 celery_app.conf.beat_schedule = {
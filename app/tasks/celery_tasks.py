@@ -5,6 +5,7 @@ import requests
 import json
 import uuid
 import os
+import time
 
 from sqlmodel import select
 
@@ -36,11 +37,21 @@ INPUTS = {
     "only_text": 0
 }
 
+# 已签发的访问令牌及其过期时间，未临近过期前重复使用，不必每次任务都查询数据库
+_cached_token: str | None = None
+_cached_token_expires_at: float = 0.0
+# 距过期不足该时间（秒）时重新签发
+TOKEN_RENEW_MARGIN = 300
+
+
 def get_refresh_token():
     """
     获取刷新令牌的函数
     这里可以根据实际情况实现获取刷新令牌的逻辑
     """
+    global _cached_token, _cached_token_expires_at
+    if _cached_token and time.time() < _cached_token_expires_at - TOKEN_RENEW_MARGIN:
+        return _cached_token
     try:
         with Session(engine) as session:
             user = session.exec(
@@ -61,6 +72,8 @@ def get_refresh_token():
                     },
                 expires_delta=access_token_expires
             )
+            _cached_token = access_token
+            _cached_token_expires_at = time.time() + access_token_expires.total_seconds()
             return access_token
     except Exception as e:
         print(f"获取刷新令牌失败: {e}")
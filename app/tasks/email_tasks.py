@@ -0,0 +1,188 @@
+"""
+邮件投递任务
+接口把邮件发布到消息队列后立即返回，由 Celery worker 发送并更新 EmailSendHistory 的状态：
+- 激活、重置密码等系统邮件进入优先队列，用户发送的邮件进入批量队列（每个 worker 受 EMAIL_BULK_RATE_LIMIT 限速）
+- 收件人按 EMAIL_MAX_RECIPIENTS_PER_MESSAGE 分组，各组在连接池的同一个连接上依次发送
+- 邮件合并（app/auth/mailmerge.py）的邮件按批投递，一批邮件在同一个连接上依次发送，按批限速
+- 4xx 应答、连接断开等临时性失败按指数退避重试，重试时只发送给失败的收件人；5xx 等永久性失败直接记录原因
+- 任务在执行完成后才确认（acks_late），worker 中途退出时任务重新投递；已发送成功的记录不会重复发送
+两个队列应由不同的 worker 消费，避免大批量发送占满优先队列的并发：
+    celery -A app.tasks.celery_app worker -Q email_priority
+    celery -A app.tasks.celery_app worker -Q email_bulk
+"""
+import random
+import smtplib
+import uuid
+from typing import Any, Optional
+
+from celery import Task
+from sqlmodel import update
+
+from app.auth.models import EmailSendHistory
+from app.auth.settings import (
+    EMAIL_SENDER_ACCOUNT, EMAIL_BULK_RATE_LIMIT, EMAIL_MAX_RECIPIENTS_PER_MESSAGE,
+    EMAIL_MAX_RETRIES, EMAIL_RETRY_BACKOFF, EMAIL_RETRY_BACKOFF_MAX, EMAIL_MERGE_RATE_LIMIT,
+)
+from app.auth.mailmerge import deliver_history_batch
+from app.auth.mime import write_message
+from app.auth.smtp import is_transient, smtp_pool
+from app.auth.utils import compose_email
+from app.db_manager import Session, engine
+from app.file.models import FileDB
+from .celery_app import celery_app
+
+
+def _retry_countdown(retries: int) -> float:
+    """第 retries + 1 次重试前等待的秒数：指数退避，加入随机抖动避免大量任务同时重试"""
+    return min(EMAIL_RETRY_BACKOFF_MAX, EMAIL_RETRY_BACKOFF * 2 ** retries) * random.uniform(0.5, 1)
+
+
+def _update_status(history_id: Optional[uuid.UUID], status: str, reason: Optional[str] = None) -> bool:
+    """在单独的事务中更新发送记录的状态，已发送成功的记录不再修改，返回是否更新了记录"""
+    if history_id is None:
+        return True
+    with Session(engine) as session:
+        result = session.exec(
+            update(EmailSendHistory)
+            .where(EmailSendHistory.id == history_id, EmailSendHistory.status != "success")
+            .values(status=status, reason=reason)
+        )
+        session.commit()
+        return result.rowcount > 0
+
+
+def _load_attachments(attachment_ids: list[str]) -> list[FileDB]:
+    with Session(engine) as session:
+        files = []
+        for file_id in attachment_ids:
+            file = session.get(FileDB, uuid.UUID(file_id))
+            if not file:
+                raise FileNotFoundError(f"附件文件不存在: {file_id}")
+            files.append(file)
+        return files
+
+
+def _delete_attachments(attachment_ids: list[str]) -> None:
+    """删除不需要存储的临时附件文件"""
+    with Session(engine) as session:
+        for file_id in attachment_ids:
+            try:
+                file = session.get(FileDB, uuid.UUID(file_id))
+                if file:
+                    file.get_path().unlink(missing_ok=True)
+            except Exception:
+                pass  # 忽略删除临时文件的错误
+
+
+def _deliver(
+    task: Task,
+    history_id: Optional[str],
+    receiver_emails: list[str],
+    receiver_names: list[str],
+    sender_name: str,
+    subject: str,
+    content: str,
+    attachment_ids: Optional[list[str]] = None,
+    store_upload_files: bool = False,
+    pending: Optional[list[str]] = None,
+    failures: Optional[list[str]] = None,
+) -> str:
+    """
+    发送一封邮件。pending 为重试时仍需发送的收件人（首次发送时为 None，即全部收件人），
+    failures 为之前各次发送中已确定的永久性失败
+    """
+    record_id = uuid.UUID(history_id) if history_id else None
+    if not _update_status(record_id, "sending"):
+        return "发送记录不存在或已发送成功"
+
+    def finish(status: str, reason: Optional[str] = None) -> str:
+        _update_status(record_id, status, reason)
+        if attachment_ids and not store_upload_files:
+            _delete_attachments(attachment_ids)
+        return status
+
+    if len(receiver_emails) != len(receiver_names):
+        return finish("failed", "收件人和收件人名称数量不匹配")
+    try:
+        message = write_message(
+            compose_email(receiver_emails, receiver_names, sender_name, subject, content),
+            _load_attachments(attachment_ids or []),
+        )
+    except Exception as e:
+        return finish("failed", f"附件处理失败: {e}")
+
+    # 收件人分组，各组在同一个连接上依次发送（同一封邮件，只是信封收件人不同）
+    recipients = receiver_emails if pending is None else pending
+    groups = [
+        recipients[i:i + EMAIL_MAX_RECIPIENTS_PER_MESSAGE]
+        for i in range(0, len(recipients), EMAIL_MAX_RECIPIENTS_PER_MESSAGE)
+    ]
+    with message:
+        errors = smtp_pool.send_batch([(EMAIL_SENDER_ACCOUNT, group, message) for group in groups])
+    failures = list(failures or [])
+    retry_recipients: list[str] = []
+    retry_errors: list[str] = []
+    outcomes: list[tuple[list[str], OSError]] = []
+    for group, error in zip(groups, errors):
+        if isinstance(error, smtplib.SMTPRecipientsRefused):
+            # 被拒的收件人逐个判断，同组其余收件人已经收到
+            outcomes.extend(
+                ([address], smtplib.SMTPRecipientsRefused({address: reply}))
+                for address, reply in error.recipients.items()
+            )
+        elif error is not None:
+            outcomes.append((group, error))
+    for group, error in outcomes:
+        if is_transient(error):
+            retry_recipients.extend(group)
+            retry_errors.append(f"{', '.join(group)}: {error}")
+        else:
+            failures.append(f"{', '.join(group)}: {error}")
+
+    if retry_recipients and task.request.retries < task.max_retries:
+        retries = task.request.retries + 1
+        _update_status(record_id, "retrying", f"第 {retries} 次重试: {'; '.join(retry_errors)}")
+        raise task.retry(
+            kwargs={
+                "history_id": history_id, "receiver_emails": receiver_emails, "receiver_names": receiver_names,
+                "sender_name": sender_name, "subject": subject, "content": content,
+                "attachment_ids": attachment_ids, "store_upload_files": store_upload_files,
+                "pending": retry_recipients, "failures": failures,
+            },
+            countdown=_retry_countdown(task.request.retries),
+        )
+    failures.extend(retry_errors)
+    if failures:
+        return finish("failed", f"邮件发送失败: {'; '.join(failures)}")
+    return finish("success")
+
+
+@celery_app.task(bind=True, max_retries=EMAIL_MAX_RETRIES, acks_late=True, reject_on_worker_lost=True)
+def send_priority_email(self: Task, **email: Any) -> str:
+    """发送激活、重置密码等系统邮件（优先队列），参数见 app.auth.utils.queue_email"""
+    return _deliver(self, **email)
+
+
+@celery_app.task(
+    bind=True, max_retries=EMAIL_MAX_RETRIES, acks_late=True, reject_on_worker_lost=True,
+    rate_limit=EMAIL_BULK_RATE_LIMIT,
+)
+def send_bulk_email(self: Task, **email: Any) -> str:
+    """发送用户提交的邮件（批量队列，限速），参数见 app.auth.utils.queue_email"""
+    return _deliver(self, **email)
+
+
+@celery_app.task(
+    bind=True, max_retries=EMAIL_MAX_RETRIES, acks_late=True, reject_on_worker_lost=True,
+    rate_limit=EMAIL_MERGE_RATE_LIMIT,
+)
+def send_merged_emails(self: Task, history_ids: list[str], sender_name: str) -> str:
+    """发送一批邮件合并生成的邮件（批量队列，按批限速），临时性失败的邮件一起退避重试"""
+    retry = self.request.retries < self.max_retries
+    failed = deliver_history_batch([uuid.UUID(history_id) for history_id in history_ids], sender_name, retry=retry)
+    if failed:
+        raise self.retry(
+            kwargs={"history_ids": [str(history_id) for history_id in failed], "sender_name": sender_name},
+            countdown=_retry_countdown(self.request.retries),
+        )
+    return "success"
@@ -0,0 +1,91 @@
+#!/usr/bin/env python3
+"""
+附件编码基准测试
+生成一个 --size MB 的附件，测量把它放入邮件所需的时间：
+- 原有方式：每次发送读取文件并以 encoders.encode_base64 编码
+- 当前方式：attachment_cache 按文件 MD5 缓存编码结果，分别测量首次发送（读取、编码并写入磁盘缓存）、
+  内存命中和磁盘命中（如进程重启后或被内存 LRU 淘汰后）的耗时
+并验证两种方式生成的邮件内容一致
+使用方法：python benchmarks/bench_attachments.py [--size 8] [--sends 50]
+"""
+import argparse
+import hashlib
+import os
+import statistics
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+# 确保项目根目录在Python路径中
+project_root = Path(__file__).parent.parent
+if str(project_root) not in sys.path:
+    sys.path.insert(0, str(project_root))
+
+parser = argparse.ArgumentParser(description="附件编码基准测试")
+parser.add_argument("--size", type=float, default=8, help="附件大小（MB）")
+parser.add_argument("--sends", type=int, default=50, help="每种情况发送的次数")
+args = parser.parse_args()
+
+# 使用临时目录保存附件和缓存
+work = Path(tempfile.mkdtemp())
+os.environ["EMAIL_ATTACHMENT_CACHE_PATH"] = str(work / "cache")
+
+from email import encoders
+from email.mime.base import MIMEBase
+
+from app.auth import models  # noqa: F401  注册 FileDB 关联的 User 模型
+from app.auth.attachments import attachment_cache
+from app.file.models import FileDB
+
+
+def legacy_part(file: FileDB) -> MIMEBase:
+    """原有方式：读取文件并编码"""
+    part = MIMEBase("application", "octet-stream")
+    part.set_payload(file.get_path().read_bytes())
+    encoders.encode_base64(part)
+    return part
+
+
+def cached_payload(file: FileDB) -> bytes:
+    """当前方式：从缓存逐块读取编码结果"""
+    return b"".join(attachment_cache.stream(file.md5, file.get_path()))
+
+
+def measure(build, file: FileDB, sends: int) -> float:
+    """返回每次构造附件的耗时中位数（毫秒）"""
+    durations = []
+    for _ in range(sends):
+        started = time.perf_counter()
+        build(file)
+        durations.append(time.perf_counter() - started)
+    return statistics.median(durations) * 1000
+
+
+def main():
+    content = os.urandom(int(args.size * 1024 * 1024))
+    file = FileDB(name="newsletter.pdf", md5=hashlib.md5(content).hexdigest(), path=str(work), size=len(content))
+    file.get_path().write_bytes(content)
+
+    legacy = legacy_part(file).get_payload().encode()
+    started = time.perf_counter()
+    cached = cached_payload(file)
+    cold = (time.perf_counter() - started) * 1000
+    assert cached == legacy, "编码结果不一致"
+
+    print(f"附件 {args.size:g}MB，每种情况发送 {args.sends} 次（取中位数）")
+    print(f"{'方式':<28}{'每次耗时(ms)':>14}")
+    print(f"{'原有方式（读取并编码）':<28}{measure(legacy_part, file, args.sends):>14.2f}")
+    print(f"{'当前方式（首次，写入缓存）':<28}{cold:>14.2f}")
+    print(f"{'当前方式（内存命中）':<28}{measure(cached_payload, file, args.sends):>14.2f}")
+
+    def disk_hit(file: FileDB) -> bytes:
+        attachment_cache.clear()
+        return cached_payload(file)
+
+    print(f"{'当前方式（磁盘命中）':<28}{measure(disk_hit, file, args.sends):>14.2f}")
+    print(attachment_cache.stats())
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,116 @@
+#!/usr/bin/env python3
+"""
+批量删除基准测试
+在临时 SQLite 数据库上删除同一虚拟用户的若干事件，对比以下两种方式执行的 SQL 语句数和耗时：
+- 原有方式：逐个 session.get 后 session.delete
+- 当前方式：调用 /isyourday/user/{id}/events/batch（分块 IN 查询 + 批量 DELETE）
+使用方法：python benchmarks/bench_bulk_delete.py [--events 5000]
+"""
+import argparse
+import asyncio
+import os
+import sys
+import tempfile
+import time
+from datetime import timedelta
+from pathlib import Path
+
+# 确保项目根目录在Python路径中
+project_root = Path(__file__).parent.parent
+if str(project_root) not in sys.path:
+    sys.path.insert(0, str(project_root))
+
+# 切换到项目根目录（邮件模板等使用相对路径）
+os.chdir(project_root)
+
+parser = argparse.ArgumentParser(description="批量删除基准测试")
+parser.add_argument("--events", type=int, default=5000, help="删除的事件数")
+args = parser.parse_args()
+
+# 使用临时数据库，避免影响开发数据库
+os.environ["SQLALCHEMY_DATABASE_URL"] = f"sqlite:///{Path(tempfile.mkdtemp()) / 'bench_bulk_delete.db'}"
+
+import httpx
+from sqlalchemy import event
+from sqlmodel import Session, select
+
+from app.main import app
+from app.db_manager import engine, async_engine, async_write_engine, create_db_and_tables, create_async_session, dispose_engines
+from app.auth.models import User, Token
+from app.auth.settings import OAUTH2_SCOPE
+from app.isyourday.models import VirtualUser, Event
+
+statements = 0
+
+
+def count_statement(*_):
+    global statements
+    statements += 1
+
+
+for async_db in filter(None, (async_engine, async_write_engine)):
+    event.listen(async_db.sync_engine, "before_cursor_execute", count_statement)
+
+
+def seed_admin():
+    """写入管理员，返回其 id"""
+    with Session(engine) as session:
+        admin = User(username="admin", email="admin@example.com", password="x", is_superuser=True, is_active=True)
+        session.add(admin)
+        session.commit()
+        return admin.id
+
+
+def seed_events(count: int):
+    """写入一个带有 count 个事件的虚拟用户，返回虚拟用户 id 和事件 id"""
+    with Session(engine) as session:
+        virtual_user = VirtualUser(real_name="bench", email=f"bench{time.monotonic_ns()}@example.com")
+        session.add(virtual_user)
+        session.flush()
+        session.add_all([Event(user_id=virtual_user.id, title=f"事件{i}") for i in range(count)])
+        session.commit()
+        event_ids = session.exec(select(Event.id).where(Event.user_id == virtual_user.id)).all()
+        return virtual_user.id, event_ids
+
+
+async def legacy_delete(user_id, event_ids):
+    """原有方式：逐个查询并删除"""
+    async with create_async_session() as session:
+        for event_id in event_ids:
+            db_event = await session.get(Event, event_id)
+            assert db_event and db_event.user_id == user_id
+            await session.delete(db_event)
+        await session.commit()
+
+
+async def main():
+    global statements
+    create_db_and_tables()
+    admin_id = seed_admin()
+    print(f"删除 {args.events} 个事件")
+    print(f"{'方式':<10}{'SQL 语句数':>12}{'耗时(s)':>10}")
+
+    user_id, event_ids = seed_events(args.events)
+    statements = 0
+    started = time.perf_counter()
+    await legacy_delete(user_id, event_ids)
+    print(f"{'原有方式':<10}{statements:>12}{time.perf_counter() - started:>10.2f}")
+
+    user_id, event_ids = seed_events(args.events)
+    token = Token.create_token({"sub": str(admin_id), "scopes": list(OAUTH2_SCOPE)}, timedelta(minutes=5))
+    transport = httpx.ASGITransport(app=app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://bench") as client:
+        statements = 0
+        started = time.perf_counter()
+        response = await client.request(
+            "DELETE", f"/isyourday/user/{user_id}/events/batch",
+            headers={"Authorization": f"Bearer {token}"}, json=[str(event_id) for event_id in event_ids],
+        )
+        elapsed = time.perf_counter() - started
+        assert response.status_code == 200, response.text
+    print(f"{'当前方式':<10}{statements:>12}{elapsed:>10.2f}")
+    await dispose_engines()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,159 @@
+#!/usr/bin/env python3
+"""
+流式导出基准测试
+在临时 SQLite 数据库上写入若干虚拟用户，对比取得全部数据的两种方式：
+- 原有方式：GET /isyourday/users，以游标分页每页 100 条依次取完
+- 当前方式：GET /isyourday/users/export，一次流式导出（NDJSON / CSV / NDJSON+gzip）
+并分别在 --users 和 4 倍数据量下测量导出时 Python 内存分配的峰值（tracemalloc），验证内存占用不随数据量增长
+导出直接调用 ASGI 应用并丢弃响应体（httpx 的 ASGITransport 会把整个响应体缓存在内存中）
+使用方法：python benchmarks/bench_export.py [--users 20000]
+"""
+import argparse
+import asyncio
+import os
+import sys
+import tempfile
+import time
+import tracemalloc
+import uuid
+from datetime import datetime, timedelta
+from pathlib import Path
+
+# 确保项目根目录在Python路径中
+project_root = Path(__file__).parent.parent
+if str(project_root) not in sys.path:
+    sys.path.insert(0, str(project_root))
+
+# 切换到项目根目录（邮件模板等使用相对路径）
+os.chdir(project_root)
+
+parser = argparse.ArgumentParser(description="流式导出基准测试")
+parser.add_argument("--users", type=int, default=20000, help="虚拟用户数")
+args = parser.parse_args()
+
+# 使用临时数据库，避免影响开发数据库
+os.environ["SQLALCHEMY_DATABASE_URL"] = f"sqlite:///{Path(tempfile.mkdtemp()) / 'bench_export.db'}"
+
+import httpx
+from sqlalchemy import insert
+from sqlmodel import Session
+
+from app.main import app
+from app.db_manager import engine, create_db_and_tables, dispose_engines
+from app.auth.models import User, Token
+from app.auth.settings import OAUTH2_SCOPE
+from app.isyourday.models import VirtualUser
+
+seeded = 0
+
+
+def seed_admin():
+    """写入管理员，返回其 id"""
+    with Session(engine) as session:
+        admin = User(username="admin", email="admin@example.com", password="x", is_superuser=True, is_active=True)
+        session.add(admin)
+        session.commit()
+        return admin.id
+
+
+def seed_users(total: int) -> None:
+    """补足虚拟用户到 total 个"""
+    global seeded
+    if total <= seeded:
+        return
+    now = datetime.now()
+    rows = [
+        {
+            "id": uuid.uuid4(), "real_name": f"联系人{i}", "email": f"user{i}@example.com", "sex": i % 3,
+            "prompt": "这是一段用于 AI 交互的提示词。" * 10, "location": "上海", "is_active": True,
+            "created_at": now + timedelta(microseconds=i), "updated_at": now + timedelta(microseconds=i),
+        }
+        for i in range(seeded, total)
+    ]
+    with Session(engine) as session:
+        session.execute(insert(VirtualUser.__table__), rows)
+        session.commit()
+    seeded = total
+
+
+async def export(path: str, headers: dict) -> int:
+    """直接调用 ASGI 应用完成一次导出，返回响应体字节数"""
+    path, _, query = path.partition("?")
+    scope = {
+        "type": "http", "http_version": "1.1", "method": "GET", "scheme": "http", "server": ("bench", 80),
+        "client": ("127.0.0.1", 1), "root_path": "", "path": path, "raw_path": path.encode(),
+        "query_string": query.encode(),
+        "headers": [(key.lower().encode(), value.encode()) for key, value in headers.items()],
+    }
+    size = 0
+    requested = False
+
+    async def receive():
+        # 第一次返回请求体，之后一直等待（StreamingResponse 以此监听客户端断开）
+        nonlocal requested
+        if requested:
+            await asyncio.Event().wait()
+        requested = True
+        return {"type": "http.request", "body": b"", "more_body": False}
+
+    async def send(message):
+        nonlocal size
+        if message["type"] == "http.response.start":
+            assert message["status"] == 200, message
+        elif message["type"] == "http.response.body":
+            size += len(message.get("body", b""))
+
+    await app(scope, receive, send)
+    return size
+
+
+async def paginate(client: httpx.AsyncClient, headers: dict) -> tuple[int, int]:
+    """以游标分页取完全部虚拟用户，返回 (请求数, 记录数)"""
+    requests, items, cursor = 0, 0, None
+    while True:
+        params = {"limit": 100, "count": "none", **({"cursor": cursor} if cursor else {})}
+        response = await client.get("/isyourday/users", headers=headers, params=params)
+        assert response.status_code == 200, response.text
+        requests += 1
+        page = response.json()
+        items += len(page["items"])
+        cursor = page["pagination"].get("next_cursor")
+        if not cursor:
+            return requests, items
+
+
+async def main():
+    create_db_and_tables()
+    token = Token.create_token({"sub": str(seed_admin()), "scopes": list(OAUTH2_SCOPE)}, timedelta(minutes=30))
+    headers = {"Authorization": f"Bearer {token}"}
+    seed_users(args.users)
+    print(f"取得全部 {args.users} 个虚拟用户")
+    print(f"{'方式':<22}{'请求数':>8}{'耗时(s)':>10}{'响应体(MB)':>12}")
+
+    transport = httpx.ASGITransport(app=app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://bench", timeout=None) as client:
+        started = time.perf_counter()
+        requests, items = await paginate(client, headers)
+        elapsed = time.perf_counter() - started
+        assert items == args.users, items
+        print(f"{'原有方式（分页）':<22}{requests:>8}{elapsed:>10.2f}{'-':>12}")
+
+    for name, query in (("ndjson", "format=ndjson"), ("csv", "format=csv"), ("ndjson+gzip", "format=ndjson&gzip=true")):
+        started = time.perf_counter()
+        size = await export(f"/isyourday/users/export?{query}", headers)
+        elapsed = time.perf_counter() - started
+        print(f"{'当前方式（' + name + '）':<22}{1:>8}{elapsed:>10.2f}{size / 1024 / 1024:>12.2f}")
+
+    print(f"\n{'数据量':<10}{'导出内存峰值(MB)':>18}")
+    for total in (args.users, args.users * 4):
+        seed_users(total)
+        tracemalloc.start()
+        await export("/isyourday/users/export?format=ndjson", headers)
+        _, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+        print(f"{total:<10}{peak / 1024 / 1024:>18.2f}")
+    await dispose_engines()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,107 @@
+#!/usr/bin/env python3
+"""
+批量导入基准测试
+在临时 SQLite 数据库上导入若干虚拟用户，对比以下两种方式的耗时和执行的 SQL 语句数：
+- 原有方式：POST /isyourday/user，每次提交 --request-size 个用户的 JSON 列表（逐行检查邮箱、逐行 refresh）
+- 当前方式：POST /isyourday/users/import，以 NDJSON 流式上传全部用户（按批检查邮箱、多行 INSERT）
+使用方法：python benchmarks/bench_import.py [--users 10000] [--request-size 500]
+"""
+import argparse
+import asyncio
+import os
+import sys
+import tempfile
+import time
+from datetime import timedelta
+from pathlib import Path
+
+# 确保项目根目录在Python路径中
+project_root = Path(__file__).parent.parent
+if str(project_root) not in sys.path:
+    sys.path.insert(0, str(project_root))
+
+# 切换到项目根目录（邮件模板等使用相对路径）
+os.chdir(project_root)
+
+parser = argparse.ArgumentParser(description="批量导入基准测试")
+parser.add_argument("--users", type=int, default=10000, help="导入的虚拟用户数")
+parser.add_argument("--request-size", type=int, default=500, help="原有方式每个请求包含的用户数")
+args = parser.parse_args()
+
+# 使用临时数据库，避免影响开发数据库
+os.environ["SQLALCHEMY_DATABASE_URL"] = f"sqlite:///{Path(tempfile.mkdtemp()) / 'bench_import.db'}"
+
+import httpx
+import orjson
+from sqlalchemy import event
+from sqlmodel import Session
+
+from app.main import app
+from app.db_manager import engine, async_engine, async_write_engine, create_db_and_tables, dispose_engines
+from app.auth.models import User, Token
+from app.auth.settings import OAUTH2_SCOPE
+
+statements = 0
+
+
+def count_statement(*_):
+    global statements
+    statements += 1
+
+
+for async_db in filter(None, (async_engine, async_write_engine)):
+    event.listen(async_db.sync_engine, "before_cursor_execute", count_statement)
+
+
+def seed_admin():
+    """写入管理员，返回其 id"""
+    with Session(engine) as session:
+        admin = User(username="admin", email="admin@example.com", password="x", is_superuser=True, is_active=True)
+        session.add(admin)
+        session.commit()
+        return admin.id
+
+
+def contacts(prefix: str) -> list[dict]:
+    return [
+        {"real_name": f"联系人{i}", "email": f"{prefix}{i}@example.com", "sex": i % 3, "birthday": "2000-01-01T00:00:00"}
+        for i in range(args.users)
+    ]
+
+
+async def main():
+    global statements
+    create_db_and_tables()
+    token = Token.create_token({"sub": str(seed_admin()), "scopes": list(OAUTH2_SCOPE)}, timedelta(minutes=30))
+    headers = {"Authorization": f"Bearer {token}"}
+    print(f"导入 {args.users} 个虚拟用户")
+    print(f"{'方式':<10}{'SQL 语句数':>12}{'耗时(s)':>10}{'行/秒':>10}")
+
+    transport = httpx.ASGITransport(app=app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://bench", timeout=None) as client:
+        rows = contacts("legacy")
+        statements = 0
+        started = time.perf_counter()
+        for start in range(0, len(rows), args.request_size):
+            response = await client.post("/isyourday/user", headers=headers, json=rows[start:start + args.request_size])
+            assert response.status_code == 200, response.text
+        elapsed = time.perf_counter() - started
+        print(f"{'原有方式':<10}{statements:>12}{elapsed:>10.2f}{args.users / elapsed:>10.0f}")
+
+        async def body():
+            for row in contacts("stream"):
+                yield orjson.dumps(row) + b"\n"
+
+        statements = 0
+        started = time.perf_counter()
+        response = await client.post(
+            "/isyourday/users/import", headers={**headers, "Content-Type": "application/x-ndjson"}, content=body()
+        )
+        elapsed = time.perf_counter() - started
+        assert response.status_code == 200 and response.json()["imported"] == args.users, response.text
+        print(f"{'当前方式':<10}{statements:>12}{elapsed:>10.2f}{args.users / elapsed:>10.0f}")
+    await dispose_engines()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
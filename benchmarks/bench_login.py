@@ -0,0 +1,116 @@
+#!/usr/bin/env python3
+"""
+登录并发基准测试
+在临时 SQLite 数据库上并发调用 /auth/login，对比以下两种密码校验方式的登录吞吐与事件循环延迟：
+- 原有方式：每次调用新建 CryptContext，并在事件循环中同步执行 bcrypt
+- 当前方式：共享的 CryptContext，在密码哈希线程池中执行 bcrypt
+事件循环延迟由一个每 5ms 唤醒一次的探测协程测量，反映登录期间其他请求被阻塞的时间
+使用方法：python benchmarks/bench_login.py [--logins 64] [--concurrency 16] [--rounds 10]
+"""
+import argparse
+import asyncio
+import os
+import statistics
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+# 确保项目根目录在Python路径中
+project_root = Path(__file__).parent.parent
+if str(project_root) not in sys.path:
+    sys.path.insert(0, str(project_root))
+
+# 切换到项目根目录（邮件模板等使用相对路径）
+os.chdir(project_root)
+
+parser = argparse.ArgumentParser(description="登录并发基准测试")
+parser.add_argument("--logins", type=int, default=64, help="每种方式的登录次数")
+parser.add_argument("--concurrency", type=int, default=16, help="并发登录数")
+parser.add_argument("--rounds", type=int, default=10, help="bcrypt 计算成本")
+args = parser.parse_args()
+
+# 使用临时数据库，避免影响开发数据库
+os.environ["SQLALCHEMY_DATABASE_URL"] = f"sqlite:///{Path(tempfile.mkdtemp()) / 'bench_login.db'}"
+os.environ["BCRYPT_ROUNDS"] = str(args.rounds)
+
+import httpx
+from sqlmodel import Session
+
+from app.main import app
+from app.db_manager import engine, create_db_and_tables, dispose_engines
+from app.auth import auth as auth_module
+from app.auth.models import User
+from app.auth.utils import hash_password, verify_and_update_password
+
+PASSWORD = "Passw0rd!"
+
+
+async def legacy_verify_and_update_password(plain_password: str, hashed_password: str) -> tuple[bool, None]:
+    """原有方式：每次新建 CryptContext 并在事件循环中同步校验"""
+    from passlib.context import CryptContext
+    pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
+    return pwd_context.verify(plain_password, hashed_password), None
+
+
+def seed(count: int) -> list[str]:
+    """写入使用相同密码的已激活用户"""
+    create_db_and_tables()
+    hashed = hash_password(PASSWORD)
+    with Session(engine) as session:
+        usernames = [f"user{i}" for i in range(count)]
+        session.add_all([
+            User(username=name, email=f"{name}@example.com", password=hashed, is_active=True)
+            for name in usernames
+        ])
+        session.commit()
+    return usernames
+
+
+async def run(usernames: list[str]) -> dict:
+    lags = []
+    done = asyncio.Event()
+
+    async def probe():
+        while not done.is_set():
+            start = time.perf_counter()
+            await asyncio.sleep(0.005)
+            lags.append(time.perf_counter() - start - 0.005)
+
+    semaphore = asyncio.Semaphore(args.concurrency)
+    transport = httpx.ASGITransport(app=app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://bench") as client:
+        async def login(username: str):
+            async with semaphore:
+                response = await client.post("/auth/login", data={"username": username, "password": PASSWORD})
+                assert response.status_code == 200, response.text
+
+        probe_task = asyncio.create_task(probe())
+        started = time.perf_counter()
+        await asyncio.gather(*[login(username) for username in usernames])
+        elapsed = time.perf_counter() - started
+        done.set()
+        await probe_task
+
+    lags.sort()
+    return {
+        "logins_per_sec": len(usernames) / elapsed,
+        "lag_p50_ms": statistics.median(lags) * 1000,
+        "lag_max_ms": lags[-1] * 1000,
+    }
+
+
+async def main():
+    usernames = seed(args.logins)
+    print(f"bcrypt 成本 {args.rounds}，共 {args.logins} 次登录，并发 {args.concurrency}，CPU 核数 {os.cpu_count()}")
+    print(f"{'方式':<10}{'登录/秒':>10}{'循环延迟P50(ms)':>18}{'循环延迟最大(ms)':>18}")
+    # 两种方式在同一个事件循环中运行，连接池中的异步连接只能在创建它的事件循环中使用
+    for name, verify in (("原有方式", legacy_verify_and_update_password), ("当前方式", verify_and_update_password)):
+        auth_module.verify_and_update_password = verify
+        result = await run(usernames)
+        print(f"{name:<10}{result['logins_per_sec']:>10.1f}{result['lag_p50_ms']:>18.2f}{result['lag_max_ms']:>18.2f}")
+    await dispose_engines()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,182 @@
+#!/usr/bin/env python3
+"""
+邮件合并基准测试
+在临时 SQLite 数据库上写入 --users 个虚拟用户，启动本地 SMTP 替身服务器，为每个虚拟用户发送一封个性化邮件：
+- 原有方式：逐个调用 POST /auth/send-email/isyourday（正文在客户端渲染，每次请求一个收件人）
+- 当前方式：调用一次 POST /auth/send-email/merge/isyourday，由服务端逐个渲染模板
+对比请求数、数据库语句数、全部邮件发送完成的耗时和建立的 SMTP 连接数
+未配置 Celery，两种方式均在当前进程的后台任务中发送
+使用方法：python benchmarks/bench_mailmerge.py [--users 2000]
+"""
+import argparse
+import asyncio
+import os
+import socket
+import sys
+import tempfile
+import threading
+import time
+import uuid
+from datetime import datetime, timedelta
+from pathlib import Path
+
+# 确保项目根目录在Python路径中
+project_root = Path(__file__).parent.parent
+if str(project_root) not in sys.path:
+    sys.path.insert(0, str(project_root))
+
+# 切换到项目根目录（邮件模板等使用相对路径）
+os.chdir(project_root)
+
+parser = argparse.ArgumentParser(description="邮件合并基准测试")
+parser.add_argument("--users", type=int, default=2000, help="虚拟用户数（即发送的邮件数）")
+args = parser.parse_args()
+
+
+def free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+SMTP_PORT = free_port()
+
+# 使用临时数据库和本地替身服务器，避免影响开发数据库和真实邮箱
+os.environ["SQLALCHEMY_DATABASE_URL"] = f"sqlite:///{Path(tempfile.mkdtemp()) / 'bench_mailmerge.db'}"
+os.environ.update({
+    "EMAIL_SENDER_ACCOUNT": "noreply@example.com",
+    "EMAIL_SENDER_SMTP": "127.0.0.1",
+    "EMAIL_SENDER_PORT": str(SMTP_PORT),
+    "EMAIL_SENDER_SSL": "false",
+    "EMAIL_USE_CELERY": "false",
+})
+
+import httpx
+from sqlalchemy import event, insert
+from sqlmodel import Session
+
+from app.main import app
+from app.db_manager import engine, async_engine, create_db_and_tables, dispose_engines
+from app.auth.models import User, Token
+from app.auth.settings import OAUTH2_SCOPE
+from app.auth.smtp import smtp_pool
+from app.isyourday.models import VirtualUser
+
+CONTENT = "<p>{{ real_name }}，你好！今天{{ location }}天气晴。</p>"
+statements = 0
+
+
+class StandInSMTPServer:
+    """只实现发信所需命令的 SMTP 服务器，统计连接数和收到的邮件数"""
+
+    def __init__(self, port: int):
+        self.port = port
+        self.connections = 0
+        self.messages = 0
+        self._started = threading.Event()
+
+    async def handle(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> None:
+        self.connections += 1
+        writer.write(b"220 stand-in ESMTP\r\n")
+        while line := await reader.readline():
+            command = line.decode().strip().upper()
+            if command.startswith(("EHLO", "HELO")):
+                writer.write(b"250-stand-in\r\n250 AUTH PLAIN LOGIN\r\n")
+            elif command.startswith("AUTH"):
+                writer.write(b"235 2.7.0 Authentication successful\r\n")
+            elif command == "DATA":
+                writer.write(b"354 End data with <CR><LF>.<CR><LF>\r\n")
+                await writer.drain()
+                while (await reader.readline()) not in (b".\r\n", b""):
+                    pass
+                self.messages += 1
+                writer.write(b"250 OK queued\r\n")
+            elif command == "QUIT":
+                writer.write(b"221 Bye\r\n")
+                break
+            else:
+                writer.write(b"250 OK\r\n")
+            await writer.drain()
+        writer.close()
+
+    def start(self) -> None:
+        async def serve():
+            server = await asyncio.start_server(self.handle, "127.0.0.1", self.port)
+            self._started.set()
+            async with server:
+                await server.serve_forever()
+
+        threading.Thread(target=asyncio.run, args=(serve(),), daemon=True).start()
+        self._started.wait()
+
+
+def count_statements(*_) -> None:
+    global statements
+    statements += 1
+
+
+def seed() -> tuple[uuid.UUID, list[dict]]:
+    """写入管理员和虚拟用户，返回管理员 id 和虚拟用户"""
+    now = datetime.now()
+    users = [
+        {
+            "id": uuid.uuid4(), "real_name": f"联系人{i}", "email": f"user{i}@example.com", "sex": 0,
+            "location": "上海", "is_active": True, "created_at": now, "updated_at": now,
+        }
+        for i in range(args.users)
+    ]
+    with Session(engine) as session:
+        admin = User(username="admin", email="admin@example.com", password="x", is_superuser=True, is_active=True)
+        session.add(admin)
+        session.execute(insert(VirtualUser.__table__), users)
+        session.commit()
+        return admin.id, users
+
+
+async def wait_for(server: StandInSMTPServer, total: int) -> None:
+    while server.messages < total:
+        await asyncio.sleep(0.01)
+
+
+async def main():
+    global statements
+    create_db_and_tables()
+    admin_id, users = seed()
+    token = Token.create_token({"sub": str(admin_id), "scopes": list(OAUTH2_SCOPE)}, timedelta(minutes=30))
+    headers = {"Authorization": f"Bearer {token}"}
+    server = StandInSMTPServer(SMTP_PORT)
+    server.start()
+    for target in (engine, async_engine.sync_engine):
+        event.listen(target, "before_cursor_execute", count_statements)
+
+    print(f"为 {args.users} 个虚拟用户各发送一封个性化邮件")
+    print(f"{'方式':<10}{'请求数':>8}{'SQL 语句数':>12}{'耗时(s)':>10}{'SMTP 连接数':>12}")
+    transport = httpx.ASGITransport(app=app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://bench", timeout=None) as client:
+        statements, connections, messages = 0, server.connections, server.messages
+        started = time.perf_counter()
+        for user in users:
+            response = await client.post("/auth/send-email/isyourday", headers=headers, data={
+                "receiver": [str(user["id"])], "subject": f"{user['real_name']} 的每日提醒",
+                "content": CONTENT.replace("{{ real_name }}", user["real_name"]).replace("{{ location }}", user["location"]),
+            })
+            assert response.status_code == 200, response.text
+        await wait_for(server, messages + args.users)
+        elapsed = time.perf_counter() - started
+        print(f"{'原有方式':<10}{args.users:>8}{statements:>12}{elapsed:>10.2f}{server.connections - connections:>12}")
+
+        statements, connections, messages = 0, server.connections, server.messages
+        started = time.perf_counter()
+        response = await client.post("/auth/send-email/merge/isyourday", headers=headers, json={
+            "subject": "{{ real_name }} 的每日提醒", "content": CONTENT, "is_active": True,
+        })
+        assert response.status_code == 200 and response.json()["queued"] == args.users, response.text
+        await wait_for(server, messages + args.users)
+        elapsed = time.perf_counter() - started
+        print(f"{'当前方式':<10}{1:>8}{statements:>12}{elapsed:>10.2f}{server.connections - connections:>12}")
+    smtp_pool.close()
+    await dispose_engines()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,191 @@
+#!/usr/bin/env python3
+"""
+大附件邮件内存基准测试
+生成一个 --size MB 的附件，分别在独立的子进程中构造并发送一封带该附件的邮件到本地 SMTP 替身服务器，
+对比进程峰值内存（ru_maxrss）相对发送前的增长和耗时：
+- 原有方式：读取整个文件，encoders.encode_base64 编码，as_string() 生成整封邮件后以 smtplib.sendmail 发送
+- 当前方式：write_message 逐块编码写入 SpooledMessage，连接池逐块写入 SMTP DATA
+替身服务器把收到的邮件写入磁盘，结束后解析并验证两种方式收到的附件与原文件一致；
+当前方式的峰值内存增长超过 --limit MB 时以非零状态退出
+使用方法：python benchmarks/bench_mime.py [--size 128] [--limit 64]
+"""
+import argparse
+import asyncio
+import email
+import hashlib
+import json
+import os
+import resource
+import socket
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from email import policy
+from pathlib import Path
+
+# 确保项目根目录在Python路径中
+project_root = Path(__file__).parent.parent
+if str(project_root) not in sys.path:
+    sys.path.insert(0, str(project_root))
+
+# 切换到项目根目录（邮件模板等使用相对路径）
+os.chdir(project_root)
+
+parser = argparse.ArgumentParser(description="大附件邮件内存基准测试")
+parser.add_argument("--size", type=float, default=128, help="附件大小（MB）")
+parser.add_argument("--limit", type=float, default=64, help="当前方式允许的峰值内存增长（MB）")
+# 以下参数供子进程使用
+parser.add_argument("--child", choices=["legacy", "stream"], help=argparse.SUPPRESS)
+parser.add_argument("--work", help=argparse.SUPPRESS)
+args = parser.parse_args()
+
+ATTACHMENT_NAME = "季度报告.pdf"
+
+
+def free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def peak_rss_mb() -> float:
+    # Linux 上 ru_maxrss 的单位是 KB
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+class StandInSMTPServer:
+    """只实现发信所需命令的 SMTP 服务器，收到的邮件（去掉行首加倍的点）写入 output"""
+
+    def __init__(self, port: int, output: Path):
+        self.port = port
+        self.output = output
+        self._started = threading.Event()
+
+    async def handle(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> None:
+        writer.write(b"220 stand-in ESMTP\r\n")
+        while line := await reader.readline():
+            command = line.decode().strip().upper()
+            if command.startswith(("EHLO", "HELO")):
+                writer.write(b"250-stand-in\r\n250-SIZE 1073741824\r\n250 AUTH PLAIN LOGIN\r\n")
+            elif command.startswith("AUTH"):
+                writer.write(b"235 2.7.0 Authentication successful\r\n")
+            elif command == "DATA":
+                writer.write(b"354 End data with <CR><LF>.<CR><LF>\r\n")
+                await writer.drain()
+                with open(self.output, "wb") as f:
+                    while (data := await reader.readline()) not in (b".\r\n", b""):
+                        f.write(data[1:] if data.startswith(b".") else data)
+                writer.write(b"250 OK queued\r\n")
+            elif command == "QUIT":
+                writer.write(b"221 Bye\r\n")
+                break
+            else:
+                writer.write(b"250 OK\r\n")
+            await writer.drain()
+        writer.close()
+
+    def start(self) -> None:
+        async def serve():
+            server = await asyncio.start_server(self.handle, "127.0.0.1", self.port, limit=1024 * 1024)
+            self._started.set()
+            async with server:
+                await server.serve_forever()
+
+        threading.Thread(target=asyncio.run, args=(serve(),), daemon=True).start()
+        self._started.wait()
+
+
+def child(mode: str, work: Path) -> None:
+    """在当前进程中发送一封邮件，输出峰值内存和耗时（JSON）"""
+    port = free_port()
+    os.environ.update({
+        "SQLALCHEMY_DATABASE_URL": f"sqlite:///{work / 'bench_mime.db'}",
+        "EMAIL_SENDER_ACCOUNT": "noreply@example.com",
+        "EMAIL_SENDER_PASSWORD": "secret",
+        "EMAIL_SENDER_SMTP": "127.0.0.1",
+        "EMAIL_SENDER_PORT": str(port),
+        "EMAIL_SENDER_SSL": "false",
+        "EMAIL_USE_CELERY": "false",
+        "EMAIL_ATTACHMENT_CACHE_PATH": str(work / f"cache-{mode}"),
+    })
+    from email import encoders
+    from email.mime.base import MIMEBase
+
+    from app.auth import models  # noqa: F401  注册 FileDB 关联的 User 模型
+    from app.auth.mime import write_message
+    from app.auth.settings import EMAIL_SENDER_ACCOUNT
+    from app.auth.smtp import smtp_pool
+    from app.auth.utils import compose_email
+    from app.file.models import FileDB
+
+    StandInSMTPServer(port, work / f"received-{mode}.eml").start()
+    source = work / "attachment.bin"
+    file = FileDB(name=ATTACHMENT_NAME, md5=(work / "attachment.md5").read_text(), path=str(work), size=source.stat().st_size)
+    source.rename(file.get_path())
+    receivers = ["reader@example.com"]
+    message = compose_email(receivers, ["读者"], "基准测试", "季度报告", "<p>附件为本季度报告</p>")
+    # 预热连接池，连接建立的开销不计入
+    smtp_pool.send_message(EMAIL_SENDER_ACCOUNT, receivers, "Subject: warm-up\r\n\r\nwarm-up\r\n")
+
+    baseline = peak_rss_mb()
+    started = time.perf_counter()
+    if mode == "legacy":
+        part = MIMEBase("application", "octet-stream")
+        part.set_payload(file.get_path().read_bytes())
+        encoders.encode_base64(part)
+        part.add_header("Content-Disposition", "attachment", filename=("utf-8", "", ATTACHMENT_NAME))
+        message.attach(part)
+        smtp_pool.send_message(EMAIL_SENDER_ACCOUNT, receivers, message.as_string())
+    else:
+        with write_message(message, [file]) as spooled:
+            smtp_pool.send_message(EMAIL_SENDER_ACCOUNT, receivers, spooled)
+    elapsed = time.perf_counter() - started
+    file.get_path().rename(source)
+    smtp_pool.close()
+    print(json.dumps({"growth": peak_rss_mb() - baseline, "seconds": elapsed}))
+
+
+def received_attachment_md5(path: Path) -> str:
+    with open(path, "rb") as f:
+        message = email.message_from_binary_file(f, policy=policy.default)
+    attachment = next(message.iter_attachments())
+    assert attachment.get_filename() == ATTACHMENT_NAME, attachment.get_filename()
+    return hashlib.md5(attachment.get_content()).hexdigest()
+
+
+def main():
+    work = Path(tempfile.mkdtemp())
+    digest = hashlib.md5()
+    with open(work / "attachment.bin", "wb") as f:
+        remaining = int(args.size * 1024 * 1024)
+        while remaining > 0:
+            chunk = os.urandom(min(remaining, 1024 * 1024))
+            digest.update(chunk)
+            f.write(chunk)
+            remaining -= len(chunk)
+    (work / "attachment.md5").write_text(digest.hexdigest())
+
+    print(f"附件 {args.size:g}MB，发送一封邮件")
+    print(f"{'方式':<10}{'峰值内存增长(MB)':>18}{'耗时(s)':>10}")
+    results = {}
+    for mode, label in (("legacy", "原有方式"), ("stream", "当前方式")):
+        output = subprocess.run(
+            [sys.executable, __file__, "--child", mode, "--work", str(work)],
+            check=True, capture_output=True, text=True,
+        ).stdout
+        results[mode] = json.loads(output.strip().splitlines()[-1])
+        assert received_attachment_md5(work / f"received-{mode}.eml") == digest.hexdigest(), f"{label}收到的附件不一致"
+        print(f"{label:<10}{results[mode]['growth']:>18.1f}{results[mode]['seconds']:>10.2f}")
+
+    growth = results["stream"]["growth"]
+    assert growth <= args.limit, f"当前方式峰值内存增长 {growth:.1f}MB，超过 {args.limit:g}MB"
+    print(f"两种方式收到的附件均与原文件一致，当前方式峰值内存增长不超过 {args.limit:g}MB")
+
+
+if __name__ == "__main__":
+    if args.child:
+        child(args.child, Path(args.work))
+    else:
+        main()
@@ -0,0 +1,90 @@
+#!/usr/bin/env python3
+"""
+分页响应序列化基准测试
+对比 100 条记录的分页结果在原有路径（pydantic 校验 + 标准 json）与
+快速路径（跳过校验 + orjson）下的序列化耗时
+使用方法：python benchmarks/bench_serialization.py
+"""
+import json
+import sys
+import timeit
+from datetime import datetime, timedelta
+from pathlib import Path
+
+# 确保项目根目录在Python路径中
+project_root = Path(__file__).parent.parent
+if str(project_root) not in sys.path:
+    sys.path.insert(0, str(project_root))
+
+from pydantic import TypeAdapter
+from sqlmodel import SQLModel, Session, create_engine, select
+
+from app.auth.models import User, EmailSendHistory
+from app.file.models import FileDB
+from app.isyourday.models import VirtualUser
+from app.models import PaginatedResponse
+from app.search import create_search_indexes
+
+PAGE_SIZE = 100
+ROUNDS = 200
+
+
+def seed(session: Session) -> None:
+    """写入测试数据"""
+    sender = User(username="bench", email="bench@example.com", password="x")
+    session.add(sender)
+    session.flush()
+    now = datetime.now()
+    for i in range(PAGE_SIZE):
+        session.add(FileDB(name=f"文件{i}.pdf", md5=f"{i:032x}", path="./media", size=i * 1024, uploader_id=sender.id))
+        session.add(VirtualUser(
+            real_name=f"用户{i}",
+            email=f"user{i}@example.com",
+            birthday=now - timedelta(days=365 * 20),
+            prompt="这是一段用于AI交互的较长提示词。" * 20,
+            location="上海",
+        ))
+        session.add(EmailSendHistory(
+            receiver_type="isyourday",
+            receiver_emails=f"user{i}@example.com",
+            receiver_names=f"用户{i}",
+            sender_id=sender.id,
+            subject=f"生日快乐 {i}",
+            content="<p>祝你生日快乐！</p>" * 50,
+        ))
+    session.commit()
+
+
+def before(model, rows) -> bytes:
+    """原有路径：构造时校验，FastAPI 再按 response_model 校验并序列化，最后用标准库 json 输出"""
+    page = PaginatedResponse[model].create(rows, 0, PAGE_SIZE, PAGE_SIZE)
+    adapter = TypeAdapter(PaginatedResponse[model])
+    value = adapter.validate_python(page.model_dump())
+    content = adapter.dump_python(value, mode="json")
+    return json.dumps(content, ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+
+
+def after(model, rows) -> bytes:
+    """快速路径：跳过校验，直接以 orjson 序列化数据库记录"""
+    page = PaginatedResponse[model].create(rows, 0, PAGE_SIZE, PAGE_SIZE, validate=False)
+    return page.to_response().body
+
+
+def main():
+    engine = create_engine("sqlite://")
+    SQLModel.metadata.create_all(engine)
+    create_search_indexes(engine)
+    with Session(engine) as session:
+        seed(session)
+        print(f"每页 {PAGE_SIZE} 条记录，每项测试 {ROUNDS} 轮")
+        print(f"{'模型':<20}{'原有路径(ms)':>14}{'快速路径(ms)':>14}{'加速比':>10}")
+        for model in (FileDB, VirtualUser, EmailSendHistory):
+            rows = list(session.exec(select(model).limit(PAGE_SIZE)).all())
+            assert json.loads(before(model, rows)) == json.loads(after(model, rows))
+            t_before = timeit.timeit(lambda: before(model, rows), number=ROUNDS) / ROUNDS * 1000
+            t_after = timeit.timeit(lambda: after(model, rows), number=ROUNDS) / ROUNDS * 1000
+            print(f"{model.__name__:<20}{t_before:>14.3f}{t_after:>14.3f}{t_before / t_after:>9.1f}x")
+
+
+if __name__ == "__main__":
+    main()
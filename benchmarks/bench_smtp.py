@@ -0,0 +1,193 @@
+#!/usr/bin/env python3
+"""
+邮件发送基准测试
+启动一个本地 SMTP 替身服务器（在独立线程的事件循环中运行，每次应答延迟 --latency 秒，
+新连接额外延迟 --handshake 秒以模拟 TLS 握手和登录），在后台发送 --mails 封邮件的同时持续请求 GET /isyourday/users，
+对比以下两种发送方式下接口延迟的 P50 / P99 / 最大值、全部邮件发送完成的耗时和建立的 SMTP 连接数：
+- 原有方式：每封邮件新建连接并登录，在事件循环中同步调用 smtplib
+- 当前方式：SMTP 连接池复用已登录的连接，在连接池线程中发送
+替身服务器不支持 TLS，两种方式均使用明文连接（EMAIL_SENDER_SSL=false）
+使用方法：python benchmarks/bench_smtp.py [--mails 500] [--latency 0.002] [--handshake 0.05]
+"""
+import argparse
+import asyncio
+import os
+import smtplib
+import socket
+import statistics
+import sys
+import tempfile
+import threading
+import time
+from datetime import timedelta
+from pathlib import Path
+
+# 确保项目根目录在Python路径中
+project_root = Path(__file__).parent.parent
+if str(project_root) not in sys.path:
+    sys.path.insert(0, str(project_root))
+
+# 切换到项目根目录（邮件模板等使用相对路径）
+os.chdir(project_root)
+
+parser = argparse.ArgumentParser(description="邮件发送基准测试")
+parser.add_argument("--mails", type=int, default=500, help="每种方式发送的邮件数")
+parser.add_argument("--latency", type=float, default=0.002, help="替身服务器每次应答的延迟（秒）")
+parser.add_argument("--handshake", type=float, default=0.05, help="替身服务器建立连接的额外延迟（秒）")
+args = parser.parse_args()
+
+
+def free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+SMTP_PORT = free_port()
+
+# 使用临时数据库和本地替身服务器，避免影响开发数据库和真实邮箱
+os.environ["SQLALCHEMY_DATABASE_URL"] = f"sqlite:///{Path(tempfile.mkdtemp()) / 'bench_smtp.db'}"
+os.environ.update({
+    "EMAIL_SENDER_ACCOUNT": "noreply@example.com",
+    "EMAIL_SENDER_PASSWORD": "secret",
+    "EMAIL_SENDER_SMTP": "127.0.0.1",
+    "EMAIL_SENDER_PORT": str(SMTP_PORT),
+    "EMAIL_SENDER_SSL": "false",
+})
+
+import httpx
+from sqlmodel import Session
+
+from app.main import app
+from app.db_manager import engine, create_db_and_tables, dispose_engines
+from app.auth import utils as auth_utils
+from app.auth.models import User, Token
+from app.auth.settings import OAUTH2_SCOPE, EMAIL_SENDER_ACCOUNT, EMAIL_SENDER_PASSWORD
+from app.auth.smtp import smtp_pool
+
+
+class StandInSMTPServer:
+    """只实现发信所需命令的 SMTP 服务器，统计连接数和收到的邮件数"""
+
+    def __init__(self, port: int, latency: float, handshake: float):
+        self.port = port
+        self.latency = latency
+        self.handshake = handshake
+        self.connections = 0
+        self.messages = 0
+        self._started = threading.Event()
+
+    async def handle(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> None:
+        self.connections += 1
+
+        async def reply(text: str) -> None:
+            await asyncio.sleep(self.latency)
+            writer.write(text.encode() + b"\r\n")
+            await writer.drain()
+
+        await asyncio.sleep(self.handshake)
+        await reply("220 stand-in ESMTP")
+        try:
+            while line := await reader.readline():
+                command = line.decode().strip().upper()
+                if command.startswith(("EHLO", "HELO")):
+                    await reply("250-stand-in\r\n250 AUTH PLAIN LOGIN")
+                elif command.startswith("AUTH"):
+                    await reply("235 2.7.0 Authentication successful")
+                elif command.startswith(("MAIL", "RCPT", "RSET", "NOOP")):
+                    await reply("250 OK")
+                elif command == "DATA":
+                    await reply("354 End data with <CR><LF>.<CR><LF>")
+                    while (await reader.readline()) not in (b".\r\n", b""):
+                        pass
+                    self.messages += 1
+                    await reply("250 OK queued")
+                elif command == "QUIT":
+                    await reply("221 Bye")
+                    break
+                else:
+                    await reply("502 Command not implemented")
+        finally:
+            writer.close()
+
+    def start(self) -> None:
+        async def serve():
+            server = await asyncio.start_server(self.handle, "127.0.0.1", self.port)
+            self._started.set()
+            async with server:
+                await server.serve_forever()
+
+        threading.Thread(target=asyncio.run, args=(serve(),), daemon=True).start()
+        self._started.wait()
+
+
+class LegacyTransport:
+    """原有方式：每封邮件新建连接并登录，同步发送"""
+
+    async def send(self, from_addr, to_addrs, message) -> None:
+        with smtplib.SMTP("127.0.0.1", SMTP_PORT) as server:
+            server.login(EMAIL_SENDER_ACCOUNT, EMAIL_SENDER_PASSWORD)
+            server.sendmail(from_addr=from_addr, to_addrs=to_addrs, msg=message.as_string())
+
+
+def seed_admin():
+    """写入管理员，返回其 id"""
+    with Session(engine) as session:
+        admin = User(username="admin", email="admin@example.com", password="x", is_superuser=True, is_active=True)
+        session.add(admin)
+        session.commit()
+        return admin.id
+
+
+async def run(client: httpx.AsyncClient, headers: dict) -> dict:
+    """后台发送全部邮件，同时持续请求接口，返回接口延迟和发送耗时"""
+    async def send_all():
+        started = time.perf_counter()
+        await asyncio.gather(*[
+            auth_utils.send_email(None, [f"user{i}@example.com"], [f"用户{i}"], "系统邮件", "通知", "<p>每日提醒</p>")
+            for i in range(args.mails)
+        ])
+        return time.perf_counter() - started
+
+    sending = asyncio.create_task(send_all())
+    latencies = []
+    while not sending.done():
+        started = time.perf_counter()
+        response = await client.get("/isyourday/users", headers=headers, params={"limit": 10, "count": "none"})
+        latencies.append(time.perf_counter() - started)
+        assert response.status_code == 200, response.text
+    latencies.sort()
+    return {
+        "send_seconds": await sending,
+        "p50_ms": statistics.median(latencies) * 1000,
+        "p99_ms": latencies[min(len(latencies) - 1, int(len(latencies) * 0.99))] * 1000,
+        "max_ms": latencies[-1] * 1000,
+    }
+
+
+async def main():
+    create_db_and_tables()
+    token = Token.create_token({"sub": str(seed_admin()), "scopes": list(OAUTH2_SCOPE)}, timedelta(minutes=30))
+    headers = {"Authorization": f"Bearer {token}"}
+    server = StandInSMTPServer(SMTP_PORT, args.latency, args.handshake)
+    server.start()
+
+    print(f"发送 {args.mails} 封邮件，应答延迟 {args.latency * 1000:.0f}ms，建立连接延迟 {args.handshake * 1000:.0f}ms")
+    print(f"{'方式':<10}{'发送耗时(s)':>12}{'SMTP 连接数':>12}{'接口P50(ms)':>12}{'接口P99(ms)':>12}{'接口最大(ms)':>13}")
+    transport = httpx.ASGITransport(app=app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://bench", timeout=None) as client:
+        for name, pool in (("原有方式", LegacyTransport()), ("当前方式", smtp_pool)):
+            auth_utils.smtp_pool = pool
+            connections, messages = server.connections, server.messages
+            result = await run(client, headers)
+            assert server.messages - messages == args.mails, server.messages - messages
+            print(
+                f"{name:<10}{result['send_seconds']:>12.2f}{server.connections - connections:>12}"
+                f"{result['p50_ms']:>12.1f}{result['p99_ms']:>12.1f}{result['max_ms']:>13.1f}"
+            )
+    smtp_pool.close()
+    await dispose_engines()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
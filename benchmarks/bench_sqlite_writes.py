@@ -0,0 +1,162 @@
+#!/usr/bin/env python3
+"""
+SQLite 并发写入基准测试
+在临时 SQLite 数据库上模拟多个工作进程的并发负载：每个进程中若干写协程反复执行“先查询再写入邮件历史”的事务，
+同时若干读协程持续分页查询，对比以下两种配置的写入吞吐、失败次数与读延迟：
+- 默认配置：回滚日志模式，无 PRAGMA，读写共用连接池
+- 生产配置：db_manager 中的 SQLite PRAGMA（WAL 等）+ 单写者队列
+使用方法：python benchmarks/bench_sqlite_writes.py [--processes 4] [--writers 4] [--readers 4] [--seconds 5]
+"""
+import argparse
+import asyncio
+import multiprocessing
+import statistics
+import sys
+import tempfile
+import time
+from datetime import datetime
+from pathlib import Path
+
+# 确保项目根目录在Python路径中
+project_root = Path(__file__).parent.parent
+if str(project_root) not in sys.path:
+    sys.path.insert(0, str(project_root))
+
+from sqlalchemy import exc
+from sqlalchemy.ext.asyncio import create_async_engine
+from sqlmodel import SQLModel, Session, create_engine, select
+from sqlmodel.ext.asyncio.session import AsyncSession
+
+from app.db_manager import RoutingSession, configure_sqlite_engine, engine_options
+from app.auth.models import User, EmailSendHistory
+from app.file.models import FileDB  # noqa: F401  User.avatar_id 外键引用 filedb 表
+from app.isyourday.models import VirtualUser  # noqa: F401
+from app.search import create_search_indexes
+
+
+def prepare(db_file: Path):
+    """建表并写入发件人，返回发件人 id"""
+    engine = create_engine(f"sqlite:///{db_file}")
+    SQLModel.metadata.create_all(engine)
+    create_search_indexes(engine)
+    with Session(engine) as session:
+        sender = User(username="bench", email="bench@example.com", password="x")
+        session.add(sender)
+        session.commit()
+        sender_id = sender.id
+    engine.dispose()
+    return sender_id
+
+
+def default_profile(url: str):
+    """默认配置：不设置 PRAGMA，读写共用同一个连接池"""
+    reader = create_async_engine(url, **engine_options(url, is_async=True))
+    return reader, None, lambda: AsyncSession(reader, expire_on_commit=False)
+
+
+def production_profile(url: str):
+    """生产配置：与 db_manager 在 SQLite 文件数据库下创建的引擎和会话一致"""
+    reader = create_async_engine(url, **engine_options(url, is_async=True))
+    writer = create_async_engine(url, **{
+        **engine_options(url, is_async=True, name="async_writer"),
+        "pool_size": 1,
+        "max_overflow": 0,
+    })
+    configure_sqlite_engine(reader.sync_engine)
+    configure_sqlite_engine(writer.sync_engine, writer=True)
+    return reader, writer, lambda: AsyncSession(
+        reader, expire_on_commit=False, sync_session_class=RoutingSession, writer=writer.sync_engine,
+    )
+
+
+async def run(profile, url: str, sender_id, writers: int, readers: int, deadline: float) -> dict:
+    """在一个进程中运行负载，返回写入次数、失败次数、每次读取的耗时和运行时间"""
+    reader, writer, new_session = profile(url)
+    stats = {"writes": 0, "errors": 0, "read_latency": []}
+
+    async def write_loop(worker: int):
+        i = 0
+        while time.perf_counter() < deadline:
+            i += 1
+            try:
+                async with new_session() as session:
+                    sender = await session.get(User, sender_id)
+                    session.add(EmailSendHistory(
+                        receiver_type="user",
+                        receiver_emails=f"user{worker}_{i}@example.com",
+                        receiver_names=f"用户{worker}_{i}",
+                        sender_id=sender.id,
+                        subject=f"生日快乐 {worker}-{i}",
+                        content="<p>祝你生日快乐！</p>" * 10,
+                        sent_at=datetime.now(),
+                    ))
+                    await session.commit()
+                stats["writes"] += 1
+            except exc.OperationalError:
+                # database is locked
+                stats["errors"] += 1
+
+    async def read_loop():
+        while time.perf_counter() < deadline:
+            start = time.perf_counter()
+            async with new_session() as session:
+                query = select(EmailSendHistory).order_by(EmailSendHistory.sent_at.desc()).limit(20)
+                (await session.exec(query)).all()
+            stats["read_latency"].append(time.perf_counter() - start)
+
+    started = time.perf_counter()
+    await asyncio.gather(*[write_loop(i) for i in range(writers)], *[read_loop() for _ in range(readers)])
+    stats["elapsed"] = time.perf_counter() - started
+    await reader.dispose()
+    if writer is not None:
+        await writer.dispose()
+    return stats
+
+
+def worker(args: tuple) -> dict:
+    profile, url, sender_id, writers, readers, seconds = args
+    deadline = time.perf_counter() + seconds
+    return asyncio.run(run(profile, url, sender_id, writers, readers, deadline))
+
+
+def benchmark(profile, processes: int, writers: int, readers: int, seconds: float) -> dict:
+    db_file = Path(tempfile.mkdtemp()) / "bench_writes.db"
+    sender_id = prepare(db_file)
+    url = f"sqlite+aiosqlite:///{db_file}"
+    with multiprocessing.get_context("spawn").Pool(processes) as pool:
+        results = pool.map(worker, [(profile, url, sender_id, writers, readers, seconds)] * processes)
+
+    # 各进程启动时间不同，吞吐量按各进程自身的运行时间分别计算后相加
+    latency = sorted(value for result in results for value in result["read_latency"]) or [0.0]
+    return {
+        "writes_per_sec": sum(result["writes"] / result["elapsed"] for result in results),
+        "errors": sum(result["errors"] for result in results),
+        "reads_per_sec": sum(len(result["read_latency"]) / result["elapsed"] for result in results),
+        "read_p50_ms": statistics.median(latency) * 1000,
+        "read_p95_ms": latency[int(len(latency) * 0.95)] * 1000,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="SQLite 并发写入基准测试")
+    parser.add_argument("--processes", type=int, default=4, help="工作进程数")
+    parser.add_argument("--writers", type=int, default=4, help="每个进程的并发写协程数")
+    parser.add_argument("--readers", type=int, default=4, help="每个进程的并发读协程数")
+    parser.add_argument("--seconds", type=float, default=5, help="每种配置的运行时间（秒）")
+    args = parser.parse_args()
+
+    print(
+        f"{args.processes} 个进程，每个进程写协程 {args.writers} 个、读协程 {args.readers} 个，"
+        f"每种配置运行 {args.seconds} 秒"
+    )
+    print(f"{'配置':<12}{'写入/秒':>10}{'写失败':>8}{'读取/秒':>10}{'读P50(ms)':>12}{'读P95(ms)':>12}")
+    for name, profile in (("默认配置", default_profile), ("生产配置", production_profile)):
+        result = benchmark(profile, args.processes, args.writers, args.readers, args.seconds)
+        print(
+            f"{name:<12}{result['writes_per_sec']:>10.1f}{result['errors']:>8}{result['reads_per_sec']:>10.1f}"
+            f"{result['read_p50_ms']:>12.2f}{result['read_p95_ms']:>12.2f}"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,134 @@
+#!/usr/bin/env python3
+"""
+查询计划检查
+在临时 SQLite 数据库上调用各热点接口，捕获其执行的 SELECT 语句并执行 EXPLAIN QUERY PLAN，
+若任一语句对受检数据表进行了全表扫描，或排序未被索引覆盖（USE TEMP B-TREE）则以非零状态退出
+使用方法：python benchmarks/check_query_plans.py
+"""
+import os
+import re
+import sqlite3
+import sys
+import tempfile
+from datetime import datetime, timedelta
+from pathlib import Path
+
+# 确保项目根目录在Python路径中
+project_root = Path(__file__).parent.parent
+if str(project_root) not in sys.path:
+    sys.path.insert(0, str(project_root))
+
+# 切换到项目根目录（邮件模板等使用相对路径）
+os.chdir(project_root)
+
+# 使用临时数据库，避免影响开发数据库
+db_file = Path(tempfile.mkdtemp()) / "query_plans.db"
+os.environ["SQLALCHEMY_DATABASE_URL"] = f"sqlite:///{db_file}"
+
+from fastapi.testclient import TestClient
+from sqlalchemy import event
+from sqlmodel import SQLModel, Session
+
+from app.main import app
+from app.db_manager import engine, async_engine, create_db_and_tables
+from app.auth.models import User, Token, ChallengeCodeDB, EmailSendHistory
+from app.auth.settings import OAUTH2_SCOPE
+from app.file.models import FileDB
+from app.isyourday.models import VirtualUser, Event
+
+# 受检的数据表，以及对这些表的全表扫描模式和访问模式
+WATCHED_TABLES = ("filedb", "event", "emailsendhistory", "challengecodedb")
+FULL_SCAN = re.compile(rf"^SCAN ({'|'.join(WATCHED_TABLES)})\b")
+WATCHED_ACCESS = re.compile(rf"^(SCAN|SEARCH) ({'|'.join(WATCHED_TABLES)})\b")
+# 访问受检数据表的语句中出现临时 B 树，说明排序（或分组、去重）未被索引覆盖
+TEMP_BTREE = re.compile(r"USE TEMP B-TREE")
+
+captured: list[tuple[str, tuple]] = []
+
+
+@event.listens_for(async_engine.sync_engine, "before_cursor_execute")
+def capture_statement(conn, cursor, statement, parameters, context, executemany):
+    if statement.lstrip().upper().startswith("SELECT"):
+        captured.append((statement, parameters))
+
+
+def seed() -> dict:
+    """写入测试数据，返回接口调用所需的标识"""
+    create_db_and_tables()
+    with Session(engine) as session:
+        admin = User(username="admin", email="admin@example.com", password="x", is_superuser=True, is_active=True)
+        pending = User(username="pending", email="pending@example.com", password="x", is_active=False)
+        session.add(admin)
+        session.add(pending)
+        session.flush()
+        now = datetime.now()
+        virtual_user = None
+        for i in range(200):
+            session.add(FileDB(name=f"file{i}.txt", md5=f"{i:032x}", path="./media", uploader_id=admin.id if i % 3 else pending.id, is_public=i % 2 == 0, upload_time=now + timedelta(seconds=i)))
+            virtual_user = VirtualUser(real_name=f"user{i}", email=f"user{i}@example.com")
+            session.add(virtual_user)
+            session.flush()
+            session.add(Event(user_id=virtual_user.id, title=f"event{i}", start_time=now + timedelta(days=i)))
+            session.add(EmailSendHistory(receiver_type="user", receiver_emails=f"user{i}@example.com", receiver_names=f"user{i}", sender_id=admin.id if i % 3 else pending.id, subject=f"subject{i}", content="content", sent_at=now + timedelta(seconds=i)))
+            session.add(ChallengeCodeDB(user_id=pending.id if i % 2 else admin.id, call_from="register" if i % 2 else "reset_password"))
+        challenge = ChallengeCodeDB(user_id=pending.id, call_from="register")
+        session.add(challenge)
+        session.commit()
+        return {
+            "admin_id": admin.id,
+            "virtual_user_id": virtual_user.id,
+            "code": challenge.code,
+        }
+
+
+def main():
+    ids = seed()
+    token = Token.create_token({"sub": str(ids["admin_id"]), "scopes": list(OAUTH2_SCOPE)}, timedelta(minutes=5))
+    headers = {"Authorization": f"Bearer {token}"}
+    client = TestClient(app, raise_server_exceptions=False)
+
+    # 第四项为排序是否应由索引覆盖：全文搜索的结果和 OR 条件（多个索引的并集）只能在取出后排序
+    checks = [
+        ("GET", "/file/list/private", {}, True),
+        ("GET", "/file/list/public", {}, True),
+        ("GET", "/file/list/all", {}, False),
+        ("GET", "/file/search", {"q": "file1"}, False),
+        ("GET", "/file/search", {"q": "file1", "public_only": True}, False),
+        ("GET", f"/isyourday/user/{ids['virtual_user_id']}/events", {}, True),
+        ("GET", "/auth/send-email/history/all", {}, True),
+        ("GET", "/auth/send-email/history/subject_search", {"q": "subject1"}, False),
+        # 重新发送激活邮件需在激活之前调用，否则用户已激活不会查询激活码
+        ("POST", "/auth/resend-activation", {"email": "pending@example.com"}, True),
+        ("GET", f"/auth/activate/{ids['code']}", {}, True),
+    ]
+
+    raw = sqlite3.connect(db_file)
+    failures = []
+    for method, url, params, indexed_sort in checks:
+        captured.clear()
+        if method == "GET":
+            client.get(url, headers=headers, params=params)
+        else:
+            client.post(url, headers=headers, data=params)
+        for statement, parameters in captured:
+            plan = [row[3] for row in raw.execute(f"EXPLAIN QUERY PLAN {statement}", parameters)]
+            scans = [detail for detail in plan if FULL_SCAN.match(detail)]
+            if indexed_sort and any(WATCHED_ACCESS.match(detail) for detail in plan):
+                scans += [detail for detail in plan if TEMP_BTREE.search(detail)]
+            status = "UNINDEXED" if scans else "OK"
+            print(f"[{status}] {method} {url}")
+            for detail in plan:
+                print(f"    {detail}")
+            if scans:
+                failures.append((url, statement, scans))
+
+    if failures:
+        print(f"\n{len(failures)} 条语句出现全表扫描或未被索引覆盖的排序:")
+        for url, statement, scans in failures:
+            print(f"  {url}: {', '.join(scans)}\n    {' '.join(statement.split())}")
+        sys.exit(1)
+    print("\n所有受检语句均使用了索引")
+
+
+if __name__ == "__main__":
+    main()
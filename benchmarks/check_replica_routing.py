@@ -0,0 +1,116 @@
+#!/usr/bin/env python3
+"""
+只读副本路由检查
+以两个 SQLite 文件分别充当主库和只读副本（副本为主库的拷贝，之后不再同步，用于区分请求实际读取的库），
+检查只读接口使用副本、写入后的请求方在粘滞时间内改用主库、粘滞时间过后重新使用副本，
+任一检查不通过时以非零状态退出
+使用方法：python benchmarks/check_replica_routing.py
+"""
+import os
+import shutil
+import sys
+import tempfile
+import time
+from datetime import timedelta
+from pathlib import Path
+
+# 确保项目根目录在Python路径中
+project_root = Path(__file__).parent.parent
+if str(project_root) not in sys.path:
+    sys.path.insert(0, str(project_root))
+
+# 切换到项目根目录（邮件模板等使用相对路径）
+os.chdir(project_root)
+
+STICKY_SECONDS = 1.0
+
+# 使用临时数据库，避免影响开发数据库
+work_dir = Path(tempfile.mkdtemp())
+primary_file = work_dir / "primary.db"
+replica_file = work_dir / "replica.db"
+os.environ["SQLALCHEMY_DATABASE_URL"] = f"sqlite:///{primary_file}"
+os.environ["SQLALCHEMY_REPLICA_DATABASE_URLS"] = f"sqlite:///{replica_file}"
+os.environ["SQL_REPLICA_STICKY_SECONDS"] = str(STICKY_SECONDS)
+os.environ.pop("REDIS_URL", None)
+# 直接读取连接池指标，无需管理员登录
+os.environ["METRICS_PUBLIC"] = "true"
+
+from fastapi.testclient import TestClient
+from sqlmodel import Session, create_engine
+
+from app.main import app
+from app.db_manager import engine, create_db_and_tables
+from app.auth.models import User, Token
+from app.auth.settings import OAUTH2_SCOPE
+from app.isyourday.models import VirtualUser
+
+
+def seed() -> list:
+    """在主库写入两个用户，并将主库拷贝为副本，副本中另外写入一个只存在于副本的虚拟用户"""
+    create_db_and_tables()
+    with Session(engine) as session:
+        users = [
+            User(username=name, email=f"{name}@example.com", password="x", is_superuser=True, is_active=True)
+            for name in ("alice", "bob")
+        ]
+        session.add_all(users)
+        session.commit()
+        user_ids = [user.id for user in users]
+    engine.dispose()
+    shutil.copy(primary_file, replica_file)
+
+    replica = create_engine(f"sqlite:///{replica_file}")
+    with Session(replica) as session:
+        session.add(VirtualUser(real_name="replica-only", email="replica-only@example.com"))
+        session.commit()
+    replica.dispose()
+    return user_ids
+
+
+def main():
+    user_ids = seed()
+    headers = {}
+    for name, user_id in zip(("alice", "bob"), user_ids):
+        token = Token.create_token({"sub": str(user_id), "scopes": list(OAUTH2_SCOPE)}, timedelta(minutes=5))
+        headers[name] = {"Authorization": f"Bearer {token}"}
+
+    def served_by(name: str) -> str:
+        """根据只读接口返回的虚拟用户判断请求读取的库"""
+        response = client.get("/isyourday/users", headers=headers[name])
+        assert response.status_code == 200, response.text
+        names = {item["real_name"] for item in response.json()["items"]}
+        return "replica" if "replica-only" in names else "primary"
+
+    failures = []
+
+    def check(description: str, actual: str, expected: str) -> None:
+        status = "OK" if actual == expected else "FAIL"
+        print(f"[{status}] {description}: {actual}（期望 {expected}）")
+        if actual != expected:
+            failures.append(description)
+
+    with TestClient(app) as client:
+        check("只读请求", served_by("alice"), "replica")
+
+        response = client.post(
+            "/isyourday/user", headers=headers["alice"],
+            json=[{"real_name": "written", "email": "written@example.com"}],
+        )
+        assert response.status_code == 200, response.text
+        check("写入方随后的只读请求", served_by("alice"), "primary")
+        check("其他用户的只读请求", served_by("bob"), "replica")
+
+        time.sleep(STICKY_SECONDS + 0.2)
+        check("粘滞时间过后写入方的只读请求", served_by("alice"), "replica")
+
+        pools = client.get("/metrics/db").json()["pools"]
+        print(f"副本连接池取出次数: {pools['replica0']['checkouts']}")
+
+    if failures:
+        print(f"\n{len(failures)} 项检查未通过")
+        sys.exit(1)
+    print("\n所有检查均通过")
+
+
+if __name__ == "__main__":
+    main()
@@ -243,7 +243,7 @@ class ServerCommand():
         from app.auth.models import User
         from sqlmodel import select, Session
         from app.db_manager import engine
-        from app.auth.utils import hash_password
+        from app.auth.utils import hash_password, principal_invalidation
 
         input_username = input("请输入超级用户的用户名: ")
 
@@ -257,6 +257,8 @@ class ServerCommand():
                     user.is_superuser = True
                     session.add(user)
                     session.commit()
+                    # 通知服务进程刷新已缓存的用户权限
+                    principal_invalidation.invalidate(user.id)
                     print("[green]已授予管理员权限。[/green]")
                 else:
                     print("[yellow]跳过授予管理员权限。[/yellow]")
@@ -285,6 +287,7 @@ class ServerCommand():
         from app.file.models import FileDB
         from sqlmodel import select, Session
         from app.db_manager import engine
+        from app.auth.utils import principal_invalidation
 
         input_username = input("请输入要撤销超级用户权限的用户名: ")
 
@@ -295,6 +298,8 @@ class ServerCommand():
                 user.is_superuser = False
                 session.add(user)
                 session.commit()
+                # 通知服务进程刷新已缓存的用户权限
+                principal_invalidation.invalidate(user.id)
                 print(f"[green]已撤销 {input_username} 的超级用户权限。[/green]")
             else:
                 print("[red]未找到用户或该用户不是管理员。[/red]")